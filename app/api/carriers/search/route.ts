@@ -3,6 +3,7 @@ import { createClient } from '@supabase/supabase-js'
 
 const supabaseUrl = process.env.NEXT_PUBLIC_SUPABASE_URL!
 const supabaseServiceKey = process.env.SUPABASE_SERVICE_ROLE_KEY!
+const geoServiceUrl = process.env.GEO_SERVICE_URL || 'http://localhost:8000'
 
 export async function POST(request: NextRequest) {
     if (!supabaseUrl || !supabaseServiceKey) {
@@ -17,6 +18,21 @@ export async function POST(request: NextRequest) {
 
         if (!source) return NextResponse.json({ carriers: [] })
 
+        // Prefer the Python spatial index (nearest carriers across the whole fleet)
+        try {
+            const geoResponse = await fetch(`${geoServiceUrl}/carriers/search`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ source, k: 10 })
+            })
+            if (geoResponse.ok) {
+                const { carriers } = await geoResponse.json()
+                if (carriers?.length) return NextResponse.json({ carriers })
+            }
+        } catch (geoError: any) {
+            console.warn('Spatial search unavailable, falling back to direct query:', geoError.message)
+        }
+
         // Default: Chennai
         let searchLat = 13.0827
         let searchLng = 80.2707
@@ -10,6 +10,7 @@ import {
 } from 'lucide-react'
 import ProgressIndicator from '../../components/ProgressIndicator'
 import LoadingSpinner from '../../components/LoadingSpinner'
+import { runNegotiation } from '../../lib/negotiation'
 import CinematicLayout from '../../components/CinematicLayout'
 import { useWorkflow } from '../../components/WorkflowContext'
 
@@ -71,15 +72,7 @@ export default function NegotiationPage() {
       setLogs(['Initializing Dual-Advocate Handshake...', 'Synchronizing Shipper/Carrier nodes...'])
 
       try {
-        const response = await fetch('http://localhost:8000/negotiate', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ shipperTerms, carrierConstraints, shipment_id: shipmentId, carrier_id: carrierId })
-        })
-
-        if (!response.ok) throw new Error(`Server Sync Failed: ${response.status}`)
-
-        const data = await response.json()
+        const data = await runNegotiation({ shipperTerms, carrierConstraints, shipment_id: shipmentId, carrier_id: carrierId })
         setLocalNegotiationData(data)
 
         // Visual Reveal Loop
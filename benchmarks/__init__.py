@@ -0,0 +1,6 @@
+"""
+Load-test suite for server.py. `python -m benchmarks.run` starts local
+stand-ins for Supabase, Groq, OpenWeather and NewsAPI (benchmarks/stubs.py),
+points the API at them, drives it with simulated trucks and negotiations
+(benchmarks/load.py) and saves the report under benchmarks/results/.
+"""
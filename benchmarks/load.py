@@ -0,0 +1,183 @@
+"""
+Async load generators: trucks streaming GPS fixes to /carrier/live-location
+and negotiators pushing jobs through /negotiate and its long-poll endpoint.
+"""
+import time
+import random
+import asyncio
+import itertools
+from collections import Counter, defaultdict
+import numpy as np
+import httpx
+from services import distance
+from benchmarks.stubs import CITIES
+
+# Waypoints inserted between a truck's base and its destination
+ROUTE_WAYPOINTS = 6
+# Max sideways drift of a waypoint off the straight line, in degrees
+ROUTE_DRIFT_DEG = 0.08
+CRUISE_SPEED_KMH = (45, 75)
+# Chance per fix that the truck is stopped (toll plaza, traffic)
+STOP_PROBABILITY = 0.05
+
+
+class Recorder:
+    """Latency samples and outcomes per operation."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        self.statuses = Counter()
+        self.engines = Counter()
+
+    def record(self, operation, started, status=None, ok=True):
+        self.samples[operation].append((time.perf_counter() - started) * 1000)
+        if status is not None:
+            self.statuses[f"{operation} {status}"] += 1
+        if not ok:
+            self.errors[operation] += 1
+
+    def fail(self, operation, error):
+        self.errors[operation] += 1
+        self.statuses[f"{operation} {type(error).__name__}"] += 1
+
+    def report(self, elapsed):
+        operations = {}
+        for operation in sorted(set(self.samples) | set(self.errors)):
+            samples = np.asarray(self.samples.get(operation, []), dtype=np.float64)
+            entry = {
+                "count": int(samples.size),
+                "errors": self.errors[operation],
+                "throughput_rps": round(samples.size / elapsed, 2) if elapsed else None,
+            }
+            if samples.size:
+                p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+                entry.update(p50_ms=round(p50, 2), p95_ms=round(p95, 2), p99_ms=round(p99, 2),
+                             mean_ms=round(samples.mean(), 2), max_ms=round(samples.max(), 2))
+            operations[operation] = entry
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "operations": operations,
+            "statuses": dict(self.statuses),
+            "negotiation_engines": dict(self.engines),
+        }
+
+
+def build_route(rng, origin):
+    """(lats, lngs, cumulative km) of a drifting polyline from `origin` to another city."""
+    destination = rng.choice([c for c in CITIES.values() if distance.haversine_matrix(
+        [origin[0]], [origin[1]], [c[0]], [c[1]])[0, 0] > 50])
+    t = np.linspace(0, 1, ROUTE_WAYPOINTS + 2)
+    drift = np.array([0] + [rng.uniform(-ROUTE_DRIFT_DEG, ROUTE_DRIFT_DEG) for _ in range(ROUTE_WAYPOINTS)] + [0])
+    lats = origin[0] + (destination[0] - origin[0]) * t + drift
+    lngs = origin[1] + (destination[1] - origin[1]) * t - drift
+    legs = distance.haversine_pairs(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    return lats, lngs, np.concatenate(([0.0], np.cumsum(legs)))
+
+def position_along(route, travelled_km):
+    """(lat, lng, heading) `travelled_km` along the route, looping back to the start at the end."""
+    lats, lngs, cumulative = route
+    travelled_km %= cumulative[-1]
+    leg = min(int(np.searchsorted(cumulative, travelled_km, side="right")) - 1, len(lats) - 2)
+    share = (travelled_km - cumulative[leg]) / (cumulative[leg + 1] - cumulative[leg])
+    lat = lats[leg] + (lats[leg + 1] - lats[leg]) * share
+    lng = lngs[leg] + (lngs[leg + 1] - lngs[leg]) * share
+    heading = distance.bearing_matrix([lats[leg]], [lngs[leg]], [lats[leg + 1]], [lngs[leg + 1]])[0, 0]
+    return float(lat), float(lng), float(heading)
+
+
+async def drive_truck(client, carrier_id, route, rng, recorder, stop_at, interval, time_scale):
+    """Post a fix every `interval` seconds; the truck covers `time_scale` seconds of road per interval."""
+    travelled = rng.uniform(0, route[2][-1])
+    await asyncio.sleep(rng.uniform(0, interval))
+    while time.monotonic() < stop_at:
+        speed = 0.0 if rng.random() < STOP_PROBABILITY else rng.uniform(*CRUISE_SPEED_KMH)
+        travelled += speed * interval * time_scale / 3600
+        lat, lng, heading = position_along(route, travelled)
+        started = time.perf_counter()
+        try:
+            res = await client.post("/carrier/live-location", json={
+                "carrier_id": carrier_id, "lat": lat, "lng": lng, "speed": round(speed, 1), "heading": round(heading, 1)
+            })
+            recorder.record("live_location", started, res.status_code, res.status_code == 200)
+        except httpx.HTTPError as e:
+            recorder.fail("live_location", e)
+        await asyncio.sleep(interval)
+
+def negotiation_body(shipment, response, profile):
+    return {
+        "shipment_id": shipment["id"],
+        "carrier_id": response["carrier_id"],
+        "userEmail": "bench-shipper@negotiatex.ai",
+        "shipperTerms": {
+            "source": shipment["source_location"],
+            "destination": shipment["destination_location"],
+            "minBudget": shipment["min_budget"],
+            "maxBudget": shipment["max_budget"],
+            "deadline": shipment["deadline"],
+        },
+        "carrierConstraints": {
+            "carrierName": profile["company_name"],
+            "proposed_price": response["proposed_price"],
+        },
+    }
+
+async def negotiate(client, bodies, recorder, stop_at, poll_wait, drain_timeout):
+    """Submit negotiations back to back until `stop_at`, long-polling each job to completion."""
+    for body in bodies:
+        if time.monotonic() >= stop_at:
+            return
+        started = time.perf_counter()
+        try:
+            res = await client.post("/negotiate", json=body)
+            recorder.record("negotiate.submit", started, res.status_code, res.status_code == 202)
+            if res.status_code != 202:
+                continue
+            job_id = res.json()["job_id"]
+            job = None
+            give_up = max(stop_at, time.monotonic()) + drain_timeout
+            while time.monotonic() < give_up:
+                poll_started = time.perf_counter()
+                poll = await client.get(f"/negotiate/jobs/{job_id}", params={"wait": poll_wait},
+                                        timeout=poll_wait + 10)
+                recorder.record("negotiate.poll", poll_started, poll.status_code, poll.status_code == 200)
+                job = poll.json()
+                if job.get("status") in ("succeeded", "failed"):
+                    break
+            succeeded = bool(job) and job.get("status") == "succeeded"
+            recorder.record("negotiate.end_to_end", started, (job or {}).get("status", "timeout"), succeeded)
+            if succeeded:
+                report = (job["result"] or {}).get("transparency_report") or {}
+                recorder.engines[report.get("engine", "llm")] += 1
+        except httpx.HTTPError as e:
+            recorder.fail("negotiate.end_to_end", e)
+
+
+async def run_load(base_url, dataset, trucks, negotiations, duration, ping_interval=1.0, time_scale=30,
+                   poll_wait=10, drain_timeout=60, seed=42):
+    """Drive the API for `duration` seconds; returns the Recorder report."""
+    rng = random.Random(seed)
+    recorder = Recorder()
+    profiles = dataset["carrier_profiles"]
+    shipments = {s["id"]: s for s in dataset["shipment_requests"]}
+    profiles_by_id = {p["carrier_id"]: p for p in profiles}
+    responses = list(dataset["carrier_responses"])
+    rng.shuffle(responses)
+    bodies = itertools.cycle([
+        negotiation_body(shipments[r["shipment_id"]], r, profiles_by_id[r["carrier_id"]]) for r in responses
+    ])
+
+    limits = httpx.Limits(max_connections=trucks + negotiations + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        stop_at = time.monotonic() + duration
+        started = time.perf_counter()
+        tasks = []
+        for i in range(trucks):
+            profile = profiles[i % len(profiles)]
+            route = build_route(rng, (profile["latitude"], profile["longitude"]))
+            truck_rng = random.Random(rng.random())
+            tasks.append(drive_truck(client, profile["carrier_id"], route, truck_rng, recorder, stop_at,
+                                     ping_interval, time_scale))
+        tasks += [negotiate(client, bodies, recorder, stop_at, poll_wait, drain_timeout) for _ in range(negotiations)]
+        await asyncio.gather(*tasks)
+        return recorder.report(time.perf_counter() - started)
@@ -0,0 +1,192 @@
+"""
+Benchmark server.py against local stand-ins for its upstreams.
+
+Starts benchmarks.stubs and the API (uvicorn server:app) as subprocesses,
+runs N trucks and M negotiators for the given duration, prints throughput
+and p50/p95/p99 latency per endpoint and saves the report as JSON under
+benchmarks/results/ next to earlier runs, comparing against the last one.
+
+    python -m benchmarks.run --trucks 200 --negotiations 16 --duration 60 --groq-failure-rate 0.1
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+import httpx
+from benchmarks.stubs import add_stub_arguments, stub_argv, build_dataset
+from benchmarks.load import run_load
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+STARTUP_TIMEOUT = 30
+# Latency fields compared against the previous run
+COMPARED_FIELDS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trucks", type=int, default=50)
+    parser.add_argument("--negotiations", type=int, default=8, help="concurrent negotiation clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--ping-interval", type=float, default=1.0, help="seconds between a truck's fixes")
+    parser.add_argument("--time-scale", type=float, default=30, help="simulated road seconds per real second")
+    parser.add_argument("--poll-wait", type=float, default=10, help="long-poll wait per job lookup")
+    parser.add_argument("--job-workers", type=int, default=4)
+    parser.add_argument("--app-port", type=int, default=8800)
+    parser.add_argument("--stub-port", type=int, default=8801)
+    parser.add_argument("--label", default="", help="free-text tag stored with the results")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--no-save", action="store_true")
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+    # One truck per carrier, so each simulated truck has its own live position
+    args.carriers = max(args.carriers, args.trucks)
+    return args
+
+
+def app_environment(args, job_db_path):
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    return {
+        **os.environ,
+        "NEXT_PUBLIC_SUPABASE_URL": stub_url,
+        "SUPABASE_SERVICE_ROLE_KEY": "benchmark",
+        "SUPABASE_REALTIME": "0",
+        "GROQ_API_KEY": "benchmark",
+        "OPENWEATHER_API_KEY": "benchmark",
+        "NEWSAPI_KEY": "benchmark",
+        "GROQ_BASE_URL": stub_url,
+        "OPENWEATHER_BASE_URL": stub_url,
+        "NEWSAPI_BASE_URL": stub_url,
+        "JOB_DB_PATH": job_db_path,
+        "JOB_WORKERS": str(args.job_workers),
+        "WEATHER_CACHE_BACKEND": "memory",
+        "GROQ_CACHE_BACKEND": "memory",
+    }
+
+def start_process(argv, env, log_path):
+    """Popen with output going to `log_path`; the log is closed by stop_process."""
+    log = open(log_path, "w")
+    try:
+        process = subprocess.Popen(argv, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    except Exception:
+        log.close()
+        raise
+    process.log = log
+    return process
+
+def wait_ready(url, process, name):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{name} not ready after {STARTUP_TIMEOUT}s ({url})")
+
+def stop_process(process):
+    try:
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    finally:
+        process.log.close()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def previous_result(results_dir):
+    if not os.path.isdir(results_dir):
+        return None
+    names = sorted(name for name in os.listdir(results_dir) if name.endswith(".json"))
+    if not names:
+        return None
+    with open(os.path.join(results_dir, names[-1])) as f:
+        return json.load(f)
+
+def print_report(result, previous=None):
+    load = result["load"]
+    print(f"\n{load['elapsed_s']}s, {result['config']['trucks']} trucks, "
+          f"{result['config']['negotiations']} negotiators")
+    print(f"{'operation':<24}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    before = (previous or {}).get("load", {}).get("operations", {})
+    for operation, entry in load["operations"].items():
+        print(f"{operation:<24}{entry['count']:>8}{entry['errors']:>8}{entry['throughput_rps'] or 0:>10}"
+              f"{entry.get('p50_ms', '-'):>10}{entry.get('p95_ms', '-'):>10}{entry.get('p99_ms', '-'):>10}")
+        if operation in before:
+            changes = []
+            for field in COMPARED_FIELDS:
+                old, new = before[operation].get(field), entry.get(field)
+                if old and new is not None:
+                    changes.append(f"{field} {(new - old) / old:+.1%}")
+            if changes:
+                print(f"{'':<24}vs {previous['started_at']}: " + ", ".join(changes))
+    if load["negotiation_engines"]:
+        print(f"negotiation engines: {load['negotiation_engines']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="negotiatex-bench-")
+    stub = start_process(
+        [sys.executable, "-m", "benchmarks.stubs", "--port", str(args.stub_port), *stub_argv(args)],
+        os.environ, os.path.join(workdir, "stubs.log")
+    )
+    app = None
+    try:
+        wait_ready(f"http://127.0.0.1:{args.stub_port}/_stats", stub, "stubs")
+        app = start_process(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.app_port), "--log-level", "warning"],
+            app_environment(args, os.path.join(workdir, "jobs.sqlite3")), os.path.join(workdir, "server.log")
+        )
+        app_url = f"http://127.0.0.1:{args.app_port}"
+        wait_ready(f"{app_url}/metrics", app, "server")
+
+        started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        dataset = build_dataset(args.seed, args.shipments, args.carriers)
+        load = asyncio.run(run_load(
+            app_url, dataset, args.trucks, args.negotiations, args.duration,
+            ping_interval=args.ping_interval, time_scale=args.time_scale, poll_wait=args.poll_wait, seed=args.seed
+        ))
+        result = {
+            "started_at": started_at,
+            "label": args.label,
+            "commit": git_commit(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("results_dir", "no_save")},
+            "load": load,
+            "server_metrics": httpx.get(f"{app_url}/metrics", timeout=10).json(),
+            "stub_stats": httpx.get(f"http://127.0.0.1:{args.stub_port}/_stats", timeout=10).json(),
+        }
+    finally:
+        if app is not None:
+            stop_process(app)
+        stop_process(stub)
+
+    print_report(result, previous_result(args.results_dir))
+    if not args.no_save:
+        os.makedirs(args.results_dir, exist_ok=True)
+        path = os.path.join(args.results_dir, f"{started_at.replace(':', '').replace('+0000', 'Z')}.json")
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved {path}")
+    print(f"logs: {workdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Local stand-ins for the upstream services, served by one FastAPI app:
+
+- Supabase: the PostgREST subset the API uses (select with eq/in filters,
+  limit/offset, insert and upsert) over in-memory seeded tables
+- Groq: chat completions, plain and streamed
+- OpenWeather: current weather
+- NewsAPI: everything search
+
+Every service has its own latency (base +/- jitter) and failure rate; a
+failed call answers 503 so the API's retry and circuit-breaker paths run.
+
+    python -m benchmarks.stubs --port 8801 --groq-latency-ms 1200 --groq-failure-rate 0.05
+"""
+import json
+import uuid
+import random
+import asyncio
+import argparse
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# name -> (default latency ms, default jitter ms)
+STUB_SERVICES = {
+    "supabase": (15, 10),
+    "groq": (1200, 400),
+    "openweather": (80, 40),
+    "newsapi": (150, 50),
+}
+
+# Cities the seeded shipments and carriers are spread over
+CITIES = {
+    "Chennai": (13.0827, 80.2707),
+    "Coimbatore": (11.0168, 76.9558),
+    "Madurai": (9.9252, 78.1198),
+    "Trichy": (10.7905, 78.7047),
+    "Salem": (11.6643, 78.1460),
+    "Bengaluru": (12.9716, 77.5946),
+}
+WEATHER_CONDITIONS = (("Clear", "clear sky"), ("Clouds", "scattered clouds"), ("Rain", "light rain"), ("Haze", "haze"))
+HEADLINES = (
+    "Diesel prices steady across southern states",
+    "Highway widening slows NH44 traffic near Salem",
+    "Port of Chennai clears container backlog",
+    "Monsoon forecast brings early showers to Tamil Nadu",
+    "Freight demand up ahead of festival season",
+)
+# Share of carrier responses priced inside the shipper budget (settled by the fast path)
+IN_BUDGET_SHARE = 0.7
+
+config = {name: {"latency_ms": latency, "jitter_ms": jitter, "failure_rate": 0.0}
+          for name, (latency, jitter) in STUB_SERVICES.items()}
+tables = {}
+calls = Counter()
+failures = Counter()
+_rng = random.Random()
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def build_dataset(seed=42, shipments=200, carriers=100, responses_per_shipment=3):
+    """
+    Deterministic seed tables; the load generator rebuilds the same dataset
+    from the same arguments to know which ids exist.
+    """
+    rng = random.Random(seed)
+    names = list(CITIES)
+    today = date.today()
+
+    profiles = []
+    for i in range(carriers):
+        city = rng.choice(names)
+        lat, lng = CITIES[city]
+        profiles.append({
+            "carrier_id": _uuid(rng),
+            "company_name": f"Bench Carrier {i + 1}",
+            "base_location": f"{city}, India",
+            "latitude": round(lat + rng.uniform(-0.2, 0.2), 5),
+            "longitude": round(lng + rng.uniform(-0.2, 0.2), 5),
+            "available_capacity": rng.choice((5, 10, 15, 20)),
+            "capacity_unit": "tons",
+            "reliability_score": rng.randint(60, 98),
+            "total_deliveries": rng.randint(10, 500),
+            "cost_structure": {"base_rate": rng.randint(1500, 3000), "fuel_charge": rng.randint(200, 600)},
+            "risk_factors": {"weather": rng.choice(("low", "medium", "high"))},
+        })
+
+    shipment_rows, response_rows = [], []
+    for _ in range(shipments):
+        source, destination = rng.sample(names, 2)
+        min_budget = rng.randint(15, 30) * 100
+        max_budget = min_budget + rng.randint(5, 20) * 100
+        deadline = today + timedelta(days=rng.randint(4, 14))
+        shipment = {
+            "id": _uuid(rng),
+            "shipper_id": _uuid(rng),
+            "source_location": f"{source}, India",
+            "destination_location": f"{destination}, India",
+            "min_budget": min_budget,
+            "max_budget": max_budget,
+            "deadline": deadline.isoformat(),
+            "status": "pending",
+            "special_terms": None,
+            "sla_rules": {"delayPenalty": 5, "maxDelayTolerance": 24},
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        shipment_rows.append(shipment)
+        for profile in rng.sample(profiles, min(responses_per_shipment, len(profiles))):
+            in_budget = rng.random() < IN_BUDGET_SHARE
+            price = rng.randint(min_budget, max_budget) if in_budget else max_budget + rng.randint(2, 10) * 100
+            response_rows.append({
+                "id": _uuid(rng),
+                "shipment_id": shipment["id"],
+                "carrier_id": profile["carrier_id"],
+                "response_type": "accept" if in_budget else "counter",
+                "proposed_price": price,
+                "estimated_delivery_date": (deadline - timedelta(days=rng.randint(0, 2))).isoformat(),
+                "vehicle_type": rng.choice(("32ft container", "20ft truck", "trailer")),
+                "notes": json.dumps({"notes": "Benchmark response"}),
+            })
+
+    return {
+        "carrier_profiles": profiles,
+        "shipment_requests": shipment_rows,
+        "carrier_responses": response_rows,
+        "carrier_live_location": [],
+        "ai_negotiations": [],
+    }
+
+
+async def _upstream(service):
+    """Simulated latency, then a 503 JSONResponse for an injected failure (else None)."""
+    settings = config[service]
+    calls[service] += 1
+    delay = settings["latency_ms"] + _rng.uniform(-settings["jitter_ms"], settings["jitter_ms"])
+    await asyncio.sleep(max(delay, 0) / 1000)
+    if _rng.random() < settings["failure_rate"]:
+        failures[service] += 1
+        return JSONResponse({"message": f"{service} stub: injected failure", "code": "503"}, status_code=503)
+    return None
+
+
+app = FastAPI(title="Benchmark upstream stand-ins")
+
+
+# --- Supabase (PostgREST) ---
+
+# Query parameters that are not column filters
+POSTGREST_RESERVED = ("select", "limit", "offset", "order", "on_conflict", "columns")
+
+def _matches(row, column, condition):
+    op, _, value = condition.partition(".")
+    actual = row.get(column)
+    if op == "eq":
+        return str(actual) == value
+    if op == "neq":
+        return str(actual) != value
+    if op == "in":
+        options = [v.strip().strip('"') for v in value.strip("()").split(",")]
+        return str(actual) in options
+    return True
+
+@app.get("/rest/v1/{table}")
+async def select_rows(table: str, request: Request):
+    failure = await _upstream("supabase")
+    if failure:
+        return failure
+    params = request.query_params
+    rows = tables.get(table, [])
+    for column, condition in params.multi_items():
+        if column not in POSTGREST_RESERVED:
+            rows = [row for row in rows if _matches(row, column, condition)]
+    offset = int(params.get("offset", 0))
+    limit = params.get("limit")
+    rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+    return rows
+
+@app.post("/rest/v1/{table}")
+async def insert_rows(table: str, request: Request):
+    failure = await _upstream("supabase")
+    if failure:
+        return failure
+    body = await request.json()
+    incoming = body if isinstance(body, list) else [body]
+    rows = tables.setdefault(table, [])
+    conflict = request.query_params.get("on_conflict")
+    written = []
+    for row in incoming:
+        row = dict(row)
+        existing = next((r for r in rows if r.get(conflict) == row.get(conflict)), None) if conflict else None
+        if existing is not None:
+            existing.update(row)
+            written.append(existing)
+            continue
+        row.setdefault("id", str(uuid.uuid4()))
+        rows.append(row)
+        written.append(row)
+    if "return=representation" in request.headers.get("prefer", ""):
+        return JSONResponse(written, status_code=201)
+    return JSONResponse(None, status_code=201)
+
+
+# --- Groq ---
+
+def _agreement(prompt):
+    """A well-formed agreement JSON for the prompt; the price is the carrier's own proposal."""
+    price = 2500
+    marker = '"proposed_price":'
+    if marker in prompt:
+        digits = "".join(ch for ch in prompt.split(marker, 1)[1][:12] if ch.isdigit() or ch == ".")
+        price = float(digits or price)
+    deadline = (date.today() + timedelta(days=7)).strftime("%d %b %Y")
+    return json.dumps({
+        "agreement_text": f"# MASTER TRANSPORTATION SERVICES AGREEMENT\nFixed rate of ${price:,.0f}, delivery by {deadline}.",
+        "justified_price": f"${price:,.0f}",
+        "fixed_deadline": deadline,
+        "clauses": [
+            {"id": "pricing", "title": "Base Price", "negotiated": f"${price:,.0f}", "reasoning": "Stub mediation.", "status": "agreed"},
+            {"id": "delivery", "title": "Delivery Deadline", "negotiated": deadline, "reasoning": "Stub mediation.", "status": "agreed"},
+        ],
+        "confidence_score": 88,
+        "summary": "Benchmark stub agreement.",
+        "transparency": {"engine": "groq-stub"},
+    })
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    failure = await _upstream("groq")
+    if failure:
+        return failure
+    body = await request.json()
+    prompt = body["messages"][-1]["content"] if body.get("messages") else ""
+    content = _agreement(prompt)
+    if not body.get("stream"):
+        return {"choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+
+    async def events():
+        for start in range(0, len(content), 40):
+            await asyncio.sleep(0.01)
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': content[start:start + 40]}}]})}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# --- OpenWeather / NewsAPI ---
+
+@app.get("/data/2.5/weather")
+async def weather(q: str = ""):
+    failure = await _upstream("openweather")
+    if failure:
+        return failure
+    main, description = WEATHER_CONDITIONS[sum(map(ord, q.lower())) % len(WEATHER_CONDITIONS)]
+    return {"weather": [{"main": main, "description": description}], "main": {"temp": 29.5}, "name": q}
+
+@app.get("/v2/everything")
+async def everything():
+    failure = await _upstream("newsapi")
+    if failure:
+        return failure
+    published = datetime.now(timezone.utc).isoformat()
+    return {"status": "ok", "articles": [
+        {"title": title, "source": {"name": "Bench Wire"}, "publishedAt": published} for title in HEADLINES
+    ]}
+
+
+@app.get("/_stats")
+async def stats():
+    return {
+        "calls": dict(calls),
+        "failures": dict(failures),
+        "rows": {table: len(rows) for table, rows in tables.items()},
+        "config": config,
+    }
+
+
+def add_stub_arguments(parser):
+    """Dataset and per-service latency/failure options, shared with benchmarks.run."""
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--shipments", type=int, default=200)
+    parser.add_argument("--carriers", type=int, default=100)
+    for name, (latency, jitter) in STUB_SERVICES.items():
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=latency)
+        parser.add_argument(f"--{name}-jitter-ms", type=float, default=jitter)
+        parser.add_argument(f"--{name}-failure-rate", type=float, default=0.0)
+
+def stub_argv(args):
+    """The command-line form of the stub options in `args`."""
+    argv = ["--seed", str(args.seed), "--shipments", str(args.shipments), "--carriers", str(args.carriers)]
+    for name in STUB_SERVICES:
+        for option in ("latency_ms", "jitter_ms", "failure_rate"):
+            argv += [f"--{name}-{option.replace('_', '-')}", str(getattr(args, f"{name}_{option}"))]
+    return argv
+
+def configure(args):
+    for name in STUB_SERVICES:
+        config[name] = {option: getattr(args, f"{name}_{option}") for option in ("latency_ms", "jitter_ms", "failure_rate")}
+    tables.clear()
+    tables.update(build_dataset(args.seed, args.shipments, args.carriers))
+    _rng.seed(args.seed)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8801)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -4,6 +4,7 @@ import { useState, useEffect } from 'react'
 import { motion } from 'framer-motion'
 import { Truck, DollarSign, Calendar, Clock, Package, AlertTriangle, Sparkles, Plus, MapPin, XCircle } from 'lucide-react'
 import { supabase } from '../lib/supabase'
+import { runNegotiation } from '../lib/negotiation'
 import { useWorkflow } from './WorkflowContext'
 
 interface CarrierResponseFormProps {
@@ -148,23 +149,17 @@ export default function CarrierResponseForm({ shipmentRequest, onSubmit, onCance
 
             // If shipper terms are available, generate the full agreement
             if (shipperTerms) {
-                const agreementResponse = await fetch('http://localhost:8000/negotiate', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
+                try {
+                    const agreementData = await runNegotiation({
                         shipperTerms,
                         carrierConstraints: formData,
                         shipment_id: shipmentRequest.id,
                         carrier_id: user.id,
                         userEmail: user.email
                     })
-                })
-
-                if (agreementResponse.ok) {
-                    const agreementData = await agreementResponse.json()
                     setNegotiationData(agreementData)
+                } catch (agreementError) {
+                    console.error('Agreement generation failed:', agreementError)
                 }
             }
 
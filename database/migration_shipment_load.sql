@@ -0,0 +1,5 @@
+-- Migration for shipment loads (matched against carrier_profiles.available_capacity)
+-- Run this in your Supabase SQL Editor
+
+ALTER TABLE shipment_requests ADD COLUMN IF NOT EXISTS required_capacity DECIMAL(10, 2);
+ALTER TABLE shipment_requests ADD COLUMN IF NOT EXISTS capacity_unit TEXT DEFAULT 'tons';
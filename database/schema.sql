@@ -12,6 +12,8 @@ CREATE TABLE IF NOT EXISTS shipment_requests (
   special_conditions TEXT[],
   special_terms TEXT,
   sla_rules JSONB,
+  required_capacity DECIMAL(10, 2), -- load to carry, in capacity_unit
+  capacity_unit TEXT DEFAULT 'tons',
   status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'matched', 'in_progress', 'completed', 'cancelled')),
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
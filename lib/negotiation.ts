@@ -0,0 +1,31 @@
+const negotiationApiUrl = process.env.NEXT_PUBLIC_NEGOTIATION_API_URL || 'http://localhost:8000'
+
+// Seconds each long-poll may wait on the server before we ask again
+const POLL_WAIT_SECONDS = 25
+// Give up on a job after this long (workers retry failed attempts with backoff)
+const MAX_WAIT_MS = 5 * 60 * 1000
+
+/**
+ * Queue an AI negotiation on the Python service and wait for the agreement.
+ * The POST returns a job id immediately; the result is collected by
+ * long-polling the job, so no HTTP request is held open for the whole run.
+ */
+export async function runNegotiation(body: Record<string, any>) {
+    const submit = await fetch(`${negotiationApiUrl}/negotiate`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    })
+    if (!submit.ok) throw new Error(`Server Sync Failed: ${submit.status}`)
+    const { job_id } = await submit.json()
+
+    const startedAt = Date.now()
+    while (Date.now() - startedAt < MAX_WAIT_MS) {
+        const poll = await fetch(`${negotiationApiUrl}/negotiate/jobs/${job_id}?wait=${POLL_WAIT_SECONDS}`)
+        if (!poll.ok) throw new Error(`Negotiation job lookup failed: ${poll.status}`)
+        const job = await poll.json()
+        if (job.status === 'succeeded') return job.result
+        if (job.status === 'failed') throw new Error(job.error || 'Negotiation failed')
+    }
+    throw new Error('Negotiation timed out')
+}
@@ -1,9 +1,62 @@
-from fastapi import FastAPI, Request
+import json
+import time
+import asyncio
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from services.api import negotiate_contract_api, CarrierLocation, supabase
+from fastapi.responses import StreamingResponse, JSONResponse
+from services.api import negotiate_shipment_async, stream_negotiation, weather_cache, negotiation_cache, news_feed, groq_breaker, CarrierLocation, supabase, shipment_repo, profile_repo, response_repo, realtime_invalidator
+from services.http_client import close_async_client
+from services.streaming import sse_event
+from services.telemetry import telemetry_buffer, hot_locations, record_location, get_location
+from services import telemetry_codec
+from services.live_feed import live_feed
+from services.history import telemetry_history
+from services.anomaly import anomaly_detector
+from services.geofence import geofence_engine
+from services.progress import route_tracker
+from services.carrier_search import carrier_directory, search_carriers, resolve_search_center
+from services.gazetteer import gazetteer
+from services.matching import run_matching
+from services.jobs import negotiation_queue, negotiation_workers, submit_negotiation
+from services.prompt import prompt_stats
+from services.fast_path import fast_path_stats
+from services.repository import query_metrics
 import uvicorn
 
-app = FastAPI()
+# How often (seconds) an in-flight negotiation checks whether its client went away
+DISCONNECT_POLL_INTERVAL = 0.5
+# Longest a single long-poll on a negotiation job may hold the connection
+JOB_MAX_WAIT = 30
+# Default and maximum window of a history query, in seconds
+HISTORY_DEFAULT_WINDOW = 86400
+HISTORY_MAX_WINDOW = 7 * 86400
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    news_feed.start()
+    telemetry_buffer.start()
+    telemetry_history.start()
+    anomaly_detector.start()
+    geofence_engine.start()
+    route_tracker.start()
+    carrier_directory.start()
+    negotiation_workers.start()
+    realtime_invalidator.start()
+    yield
+    await realtime_invalidator.stop()
+    await negotiation_workers.stop()
+    await carrier_directory.stop()
+    await route_tracker.stop()
+    await geofence_engine.stop()
+    await anomaly_detector.stop()
+    await telemetry_history.stop()
+    await telemetry_buffer.stop()
+    await news_feed.stop()
+    await close_async_client()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for Next.js frontend
 app.add_middleware(
@@ -14,59 +67,470 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def run_until_disconnected(request: Request, coro):
+    """
+    Await `coro`, cancelling it if the HTTP client disconnects first.
+    Returns None when the work was cancelled.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                print("Client disconnected, negotiation cancelled")
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 @app.post("/negotiate")
 async def negotiate(request: Request):
+    """
+    Queue a negotiation and return its job id at once (202). The agreement is
+    collected from GET /negotiate/jobs/{job_id}.
+    """
+    data = await request.json()
+    job_id = await submit_negotiation(data)
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": "queued", "poll_url": f"/negotiate/jobs/{job_id}"}
+    )
+
+
+@app.get("/negotiate/jobs/{job_id}")
+async def negotiation_job(job_id: str, wait: float = 0):
+    """
+    Job status and, once succeeded, the agreement. `wait` (seconds, max
+    JOB_MAX_WAIT) long-polls until the job finishes.
+    """
+    job = await negotiation_queue.wait(job_id, min(max(wait, 0), JOB_MAX_WAIT))
+    if job is None:
+        return JSONResponse(status_code=404, content={"detail": "Unknown job"})
+    return job
+
+
+@app.post("/negotiate/shipment/{shipment_id}")
+async def negotiate_shipment(shipment_id: str, request: Request):
+    """
+    Negotiate with every carrier that responded to a shipment at once and
+    return a ranked comparison. Optional body: {"shipperTerms": {...}, "userEmail"}.
+    """
+    body = await request.body()
+    data = json.loads(body) if body else {}
+    result = await run_until_disconnected(request, negotiate_shipment_async(shipment_id, data))
+    if result is None:
+        return Response(status_code=499)
+    if not result["carriers"]:
+        return JSONResponse(status_code=404, content={"detail": "No carrier responses for this shipment"})
+    return result
+
+
+@app.post("/negotiate/stream")
+async def negotiate_stream(request: Request):
+    """
+    Stream the negotiation as Server-Sent Events: the agreement text arrives
+    as it is generated, structured fields as soon as they parse.
+    """
     data = await request.json()
-    return negotiate_contract_api(data)
+
+    async def events():
+        async for event, payload in stream_negotiation(data):
+            yield sse_event(event, payload)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/carrier/live-location")
 async def update_live_location(data: CarrierLocation):
     """
     Update carrier's live location for real-time tracking.
+    Pings are acknowledged immediately and written to the DB in bulk.
     """
     if not supabase:
         return {"status": "error", "message": "Supabase not configured"}
     
+    if not record_location(data.carrier_id, data.lat, data.lng, data.speed, data.heading,
+                           taken_at=fix_time(data.timestamp, datetime.now(timezone.utc))):
+        return telemetry_full_response()
+    return {"status": "live location accepted"}
+
+
+def fix_time(timestamp, received_at):
+    """When a fix was taken: its own timestamp, never later than its arrival, else the arrival time."""
+    if timestamp is None or not timestamp > 0:
+        return received_at
+    return min(datetime.fromtimestamp(timestamp, timezone.utc), received_at)
+
+def telemetry_full_response():
+    return JSONResponse(
+        {"status": "error", "message": "Telemetry buffer full, retry shortly"},
+        status_code=503,
+        headers={"Retry-After": "1"}
+    )
+
+
+@app.post("/carrier/live-location/batch")
+async def update_live_locations(request: Request):
+    """
+    Ingest many CarrierLocation fixes, across carriers, in one request.
+    Accepts a JSON array, NDJSON (application/x-ndjson) or packed binary
+    records (application/octet-stream, see services/telemetry_codec.py).
+    Fixes are applied in the order they were taken; one without a
+    "timestamp" takes the time the batch arrived.
+    """
+    if not supabase:
+        return {"status": "error", "message": "Supabase not configured"}
+
     try:
-        response = supabase.table("carrier_live_location").upsert({
-            "carrier_id": data.carrier_id,
-            "latitude": data.lat,
-            "longitude": data.lng,
-            "speed": data.speed,
-            "heading": data.heading,
-            "updated_at": "now()"
-        }).execute()
-        
-        # Verbose logging for terminal visibility
-        try:
-            print(f"TELEMETRY: Carrier {data.carrier_id[:8]} | Speed: {data.speed} KM/H | Pos: {data.lat},{data.lng}")
-        except:
-            pass
-        
-        return {"status": "live location updated"}
-    except Exception as e:
-        try:
-            print(f"Error updating location: {str(e)}")
-        except:
-            pass
-        return {"status": "error", "message": str(e)}
+        batch = telemetry_codec.decode(await request.body(), request.headers.get("content-type"))
+    except (ValueError, UnicodeDecodeError) as e:
+        return JSONResponse({"status": "error", "message": f"Invalid batch: {e}"}, status_code=400)
+
+    valid, errors = batch.validate()
+    received_at = datetime.now(timezone.utc)
+    fixes = sorted(
+        ((fix_time(timestamp, received_at), carrier_id, lat, lng, speed, heading)
+         for carrier_id, lat, lng, speed, heading, timestamp in batch.rows(valid)),
+        key=lambda fix: fix[0]
+    )
+    accepted = throttled = 0
+    for taken_at, carrier_id, lat, lng, speed, heading in fixes:
+        if record_location(carrier_id, lat, lng, speed, heading, taken_at=taken_at):
+            accepted += 1
+        else:
+            throttled += 1
+
+    if throttled and not accepted:
+        return telemetry_full_response()
+    return {
+        "status": "accepted",
+        "accepted": accepted,
+        "invalid": len(batch) - int(valid.sum()),
+        "throttled": throttled,
+        "errors": [{"index": index, "reason": reason} for index, reason in errors]
+    }
 
 
 @app.get("/carrier/live-location/{carrier_id}")
 async def get_live_location(carrier_id: str):
     """
     Get carrier's current live location.
+    Served from the in-process hot store; the DB is only read for cold carriers.
     """
+    record = await get_location(carrier_id)
+    if record is not None:
+        return {"status": "success", "location": record.as_row()}
     if not supabase:
         return {"status": "error", "message": "Supabase not configured"}
-    
-    result = supabase.table("carrier_live_location").select("*").eq("carrier_id", carrier_id).single().execute()
-    
-    if result.data:
-        return {"status": "success", "location": result.data}
-    else:
-        return {"status": "not_found", "message": "Carrier location not available"}
+    return {"status": "not_found", "message": "Carrier location not available"}
+
+
+@app.get("/carrier/history/{carrier_id}")
+async def get_location_history(carrier_id: str, start: datetime | None = None, end: datetime | None = None,
+                               resolution: int | None = None):
+    """
+    Replay a carrier's track between `start` and `end` (default: the last
+    24 hours), optionally thinned to one fix per `resolution` seconds.
+    Points come back as parallel arrays (t in epoch seconds, lat, lng, speed, heading).
+    """
+    end_ts = end.timestamp() if end else time.time()
+    start_ts = start.timestamp() if start else end_ts - HISTORY_DEFAULT_WINDOW
+    if end_ts - start_ts > HISTORY_MAX_WINDOW:
+        return JSONResponse(
+            {"status": "error", "message": f"Window is limited to {HISTORY_MAX_WINDOW // 86400} days"},
+            status_code=400
+        )
+    track = telemetry_history.query(carrier_id, start_ts, end_ts, resolution)
+    return {"status": "success", "start": start_ts, "end": end_ts, "resolution": resolution, **track}
+
+
+@app.get("/anomalies")
+async def list_anomalies(since: int = 0, carrier_id: str | None = None, type: str | None = None, limit: int = 100):
+    """
+    Recent telemetry anomalies (speed_spike, position_jump, stall, dropout,
+    signal_restored), oldest first. Poll with ?since=<last_id>.
+    """
+    events = anomaly_detector.recent(since, carrier_id, type, min(max(limit, 1), 1000))
+    return {"events": events, "last_id": events[-1]["id"] if events else max(since, 0)}
+
+
+@app.get("/anomalies/stream")
+async def stream_anomalies(request: Request, carrier_id: str | None = None):
+    """Server-Sent Events feed of anomalies as they are detected."""
+    queue = anomaly_detector.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=DISCONNECT_POLL_INTERVAL * 30)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if carrier_id is None or event["carrier_id"] == carrier_id:
+                    yield sse_event("anomaly", event)
+        finally:
+            anomaly_detector.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/geofences/events")
+async def geofence_events(since: int = 0, shipment_id: str | None = None, limit: int = 100):
+    """
+    Pickup/delivery zone enter and exit events of the assigned carriers,
+    oldest first. Poll with ?since=<last_id>.
+    """
+    events = geofence_engine.recent(since, shipment_id, min(max(limit, 1), 1000))
+    return {"events": events, "last_id": events[-1]["id"] if events else max(since, 0)}
+
+
+@app.post("/shipments/{shipment_id}/route")
+async def set_shipment_route(shipment_id: str, request: Request):
+    """
+    Replace a shipment's route with a real polyline. Body: {"polyline":
+    [[lat, lng], ...], "carrier_id"?: defaults to the carrier assigned to it}.
+    Without one, active shipments follow a straight pickup -> delivery line.
+    """
+    body = await request.json()
+    if not isinstance(body, dict):
+        return JSONResponse(status_code=422, content={"detail": "Body must be a JSON object"})
+    if not isinstance(body.get("carrier_id") or "", str):
+        return JSONResponse(status_code=422, content={"detail": "carrier_id must be a string"})
+    carrier_id = body.get("carrier_id") or geofence_engine.carrier_for(shipment_id)
+    if not carrier_id:
+        return JSONResponse(status_code=400, content={"detail": "carrier_id is required for an unassigned shipment"})
+    try:
+        points = [(float(lat), float(lng)) for lat, lng in body.get("polyline") or []]
+        route_tracker.track(shipment_id, carrier_id, points)
+    except (TypeError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"detail": f"Invalid polyline: {e}"})
+    return {"status": "success", "progress": route_tracker.get(shipment_id)}
+
+
+@app.get("/shipments/{shipment_id}/progress")
+async def get_shipment_progress(shipment_id: str):
+    """Distance travelled and remaining along the route, smoothed speed and ETA."""
+    progress = route_tracker.get(shipment_id)
+    if progress is None:
+        return JSONResponse(status_code=404, content={"detail": "Shipment is not being tracked"})
+    return progress
+
+
+@app.websocket("/ws/live-location")
+async def live_location_feed(websocket: WebSocket):
+    """
+    Push channel for live positions. Connect with ?carrier_ids=a,b and/or send
+    {"subscribe": [...]} / {"unsubscribe": [...]}. Each message is
+    {"type": "locations", "locations": [...]} with carrier_live_location rows,
+    pushed from memory as fixes are ingested (coalesced and rate-limited).
+    """
+    await websocket.accept()
+    subscription = live_feed.open()
+
+    async def watch(carrier_ids):
+        added = live_feed.subscribe(subscription, carrier_ids)
+        # Start each new watcher with the last known position
+        for carrier_id in added:
+            record = hot_locations.get(carrier_id)
+            if record is not None:
+                subscription.push(record)
+
+    async def receive():
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                await websocket.send_json({"type": "error", "message": "Expected a JSON object"})
+                continue
+            if isinstance(message.get("subscribe"), list):
+                await watch([str(c) for c in message["subscribe"]])
+            if isinstance(message.get("unsubscribe"), list):
+                live_feed.unsubscribe(subscription, [str(c) for c in message["unsubscribe"]])
+
+    async def send():
+        async for locations in subscription.updates():
+            if locations:
+                await websocket.send_json({"type": "locations", "locations": locations})
+
+    query_ids = websocket.query_params.get("carrier_ids", "")
+    await watch([c for c in query_ids.split(",") if c])
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            # A disconnect ends the receiver (or a failed send ends the sender); anything else is a bug
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                print(f"Live location feed closed on error: {error!r}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        live_feed.close(subscription)
+
+
+def search_coordinates(lat, lng):
+    """(lat, lng) as floats; ValueError unless both are numbers within the globe."""
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"coordinates out of range: {lat}, {lng}")
+    return lat, lng
+
+def search_params(body):
+    """Validated lat, lng, k and radius_km of a carrier search body (lat/lng None for a source search)."""
+    lat = lng = None
+    if body.get("lat") is not None or body.get("lng") is not None:
+        lat, lng = search_coordinates(body.get("lat"), body.get("lng"))
+    k = int(body.get("k", 10) or 0)
+    if k < 0:
+        raise ValueError(f"k must not be negative: {k}")
+    radius_km = body.get("radius_km")
+    if radius_km is not None:
+        radius_km = float(radius_km)
+        if not 0 < radius_km < float("inf"):
+            raise ValueError(f"radius_km must be a positive number: {radius_km}")
+    return lat, lng, k, radius_km
+
+@app.post("/carriers/search")
+async def carriers_search(request: Request):
+    """
+    Nearest carriers for the shipper dashboard. Body: {"source": "...", "lat", "lng",
+    "k", "radius_km", "live"}; explicit lat/lng take precedence over the source text.
+    """
+    body = await request.json()
+    if not isinstance(body, dict):
+        return JSONResponse(status_code=422, content={"detail": "Body must be a JSON object"})
+    try:
+        lat, lng, k, radius_km = search_params(body)
+    except (TypeError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"detail": f"Invalid search: {e}"})
+    carriers = search_carriers(
+        source=body.get("source"),
+        lat=lat,
+        lng=lng,
+        k=k,
+        radius_km=radius_km,
+        live=bool(body.get("live"))
+    )
+    return {"carriers": carriers}
+
+
+@app.post("/carriers/distance-matrix")
+async def carriers_distance_matrix(request: Request):
+    """
+    Distance, bearing and ETA from many shipment origins to a candidate set of
+    carriers in one vectorised pass. Body: {"origins": [{"lat", "lng"} | {"source"}],
+    "carrier_ids": [...] (default: every indexed carrier), "live": bool}.
+    """
+    body = await request.json()
+    origins = []
+    try:
+        for origin in body.get("origins") or []:
+            if origin.get("lat") is not None and origin.get("lng") is not None:
+                origins.append(search_coordinates(origin["lat"], origin["lng"]))
+            else:
+                origins.append(resolve_search_center(origin.get("source")))
+    except (AttributeError, TypeError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"detail": f"Invalid origin: {e}"})
+    if not origins:
+        return JSONResponse(status_code=422, content={"detail": "origins must not be empty"})
+    carrier_ids, matrix = carrier_directory.route_matrix(origins, body.get("carrier_ids"), bool(body.get("live")))
+    return {
+        "origins": [{"lat": lat, "lng": lng} for lat, lng in origins],
+        "carrier_ids": carrier_ids,
+        "distance_km": matrix["distance_km"].round(3).tolist(),
+        "bearing_deg": matrix["bearing_deg"].round(1).tolist(),
+        "eta_hours": matrix["eta_hours"].round(3).tolist()
+    }
+
+
+@app.get("/carriers/nearest")
+async def carriers_nearest(lat: float, lng: float, k: int = 10, radius_km: float | None = None, live: bool = False):
+    """
+    Raw k-nearest / within-radius query over carrier base or live positions
+    (k=0 with radius_km returns every carrier inside the radius).
+    """
+    index = carrier_directory.live if live else carrier_directory.bases
+    matches = carrier_directory.nearest(lat, lng, k, radius_km, live)
+    return {
+        "carriers": [
+            {"carrier_id": carrier_id, "distance_km": round(distance, 3), "position": index.position(carrier_id)}
+            for distance, carrier_id in matches
+        ]
+    }
+
+
+@app.get("/places/resolve")
+async def resolve_place(q: str):
+    """
+    Canonical place (name, state, coordinates) for a free-text location such
+    as a shipment's source_location, from the bundled gazetteer. `confidence`
+    is 1 for a verbatim name and below 1 for a guessed one.
+    """
+    place, confidence = gazetteer.match(q)
+    if place is None:
+        return JSONResponse(status_code=404, content={"detail": "Unknown place", "suggestions": [
+            {**p.as_dict(), "confidence": round(similarity, 4)} for similarity, p in gazetteer.fuzzy(q, 5)
+        ]})
+    return {**place.as_dict(), "confidence": confidence}
+
+
+@app.get("/places/search")
+async def search_places(prefix: str, limit: int = 10):
+    """Places whose name or alias starts with `prefix`, most populous first (autocomplete)."""
+    return {"places": [place.as_dict() for place in gazetteer.complete(prefix, min(max(limit, 1), 50))]}
+
+
+@app.post("/shipments/match")
+async def shipments_match(request: Request):
+    """
+    Batch-assign pending shipments to carriers. Body: {"shipment_ids": [...]
+    (default: every pending shipment), "negotiate_top": N}; only the N best
+    pairs are negotiated with Groq.
+    """
+    body = await request.json()
+    return await run_matching(body.get("shipment_ids"), int(body.get("negotiate_top", 0) or 0))
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Runtime counters for the in-process caches and background feeds.
+    """
+    return {
+        "weather_cache": weather_cache.stats(),
+        "negotiation_cache": negotiation_cache.stats(),
+        "news_feed": news_feed.freshness(),
+        "groq_circuit": groq_breaker.stats(),
+        "telemetry": telemetry_buffer.stats(),
+        "hot_locations": hot_locations.stats(),
+        "history": telemetry_history.stats(),
+        "anomalies": anomaly_detector.stats(),
+        "geofences": geofence_engine.stats(),
+        "route_progress": route_tracker.stats(),
+        "live_feed": live_feed.stats(),
+        "carrier_index": carrier_directory.stats(),
+        "gazetteer": gazetteer.stats(),
+        "negotiation_jobs": await negotiation_workers.stats(),
+        "groq_prompt": prompt_stats.stats(),
+        "fast_path": fast_path_stats.stats(),
+        "repository": {
+            "queries": query_metrics.stats(),
+            "caches": {repo.table: repo.stats() for repo in (shipment_repo, profile_repo, response_repo)},
+            "realtime": realtime_invalidator.stats()
+        }
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,235 @@
+import os
+import time
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from services.spatial import haversine_km
+from services.distance import MIN_MOVING_SPEED_KMH
+
+# Streaming anomaly detection on the live-location ingest path
+ANOMALY_SPEED_LIMIT_KMH = float(os.environ.get("ANOMALY_SPEED_LIMIT_KMH", "100"))
+# A fix this far above the carrier's smoothed speed is a spike even under the limit
+ANOMALY_SPIKE_DELTA_KMH = float(os.environ.get("ANOMALY_SPIKE_DELTA_KMH", "40"))
+# Weight of the newest fix in the smoothed speed
+ANOMALY_SPEED_ALPHA = float(os.environ.get("ANOMALY_SPEED_ALPHA", "0.2"))
+# Speed implied by two consecutive fixes above which the position jumped
+ANOMALY_MAX_IMPLIED_SPEED_KMH = float(os.environ.get("ANOMALY_MAX_IMPLIED_SPEED_KMH", "200"))
+# Moves shorter than this are GPS jitter, whatever the implied speed
+ANOMALY_JUMP_MIN_KM = float(os.environ.get("ANOMALY_JUMP_MIN_KM", "1.0"))
+ANOMALY_STALL_SECONDS = float(os.environ.get("ANOMALY_STALL_SECONDS", "900"))
+ANOMALY_STALL_RADIUS_KM = float(os.environ.get("ANOMALY_STALL_RADIUS_KM", "0.2"))
+ANOMALY_DROPOUT_SECONDS = float(os.environ.get("ANOMALY_DROPOUT_SECONDS", "120"))
+# The same anomaly is reported at most once per carrier in this window
+ANOMALY_COOLDOWN_SECONDS = float(os.environ.get("ANOMALY_COOLDOWN_SECONDS", "60"))
+# Recent events kept for GET /anomalies
+ANOMALY_EVENT_BUFFER = int(os.environ.get("ANOMALY_EVENT_BUFFER", "2000"))
+# Per-subscriber backlog; a subscriber that falls further behind loses events
+ANOMALY_QUEUE_SIZE = int(os.environ.get("ANOMALY_QUEUE_SIZE", "500"))
+ANOMALY_SWEEP_INTERVAL = float(os.environ.get("ANOMALY_SWEEP_INTERVAL", "15"))
+# Carriers silent this long are forgotten
+ANOMALY_STATE_TTL = float(os.environ.get("ANOMALY_STATE_TTL", "86400"))
+
+ANOMALY_TYPES = ("speed_spike", "position_jump", "stall", "dropout", "signal_restored")
+
+
+class CarrierState:
+    """Everything the detector remembers about one carrier: a fixed handful of fields."""
+
+    __slots__ = ("t", "lat", "lng", "avg_speed", "stall_t", "stall_lat", "stall_lng", "stall_reported",
+                 "dropout_reported", "last_emitted")
+
+    def __init__(self, t, lat, lng, speed):
+        self.t = t
+        self.lat = lat
+        self.lng = lng
+        self.avg_speed = speed
+        self.stall_t = None
+        self.stall_lat = lat
+        self.stall_lng = lng
+        self.stall_reported = False
+        self.dropout_reported = False
+        self.last_emitted = {}
+
+
+class AnomalyDetector:
+    """
+    Checks every ingested fix against the carrier's previous one: speed
+    spikes (over the limit, or far above its smoothed speed), position jumps
+    (implausible implied speed), stalls (stopped in one spot too long) and
+    GPS dropouts (found by a periodic sweep, or by the gap when fixes resume).
+    Events go to a ring buffer and to every subscriber queue.
+    """
+
+    def __init__(self, speed_limit=100, spike_delta=40, alpha=0.2, max_implied_speed=200, jump_min_km=1.0,
+                 stall_seconds=900, stall_radius_km=0.2, dropout_seconds=120, cooldown=60,
+                 buffer_size=2000, queue_size=500, sweep_interval=15, state_ttl=86400):
+        self.speed_limit = speed_limit
+        self.spike_delta = spike_delta
+        self.alpha = alpha
+        self.max_implied_speed = max_implied_speed
+        self.jump_min_km = jump_min_km
+        self.stall_seconds = stall_seconds
+        self.stall_radius_km = stall_radius_km
+        self.dropout_seconds = dropout_seconds
+        self.cooldown = cooldown
+        self.queue_size = queue_size
+        self.sweep_interval = sweep_interval
+        self.state_ttl = state_ttl
+        self.states = {}
+        self.events = deque(maxlen=buffer_size)
+        self.subscribers = set()
+        self._task = None
+        self.last_id = 0
+        self.observed = 0
+        self.counts = {kind: 0 for kind in ANOMALY_TYPES}
+        self.suppressed = 0
+        self.dropped = 0
+
+    def emit(self, kind, carrier_id, state, t, details):
+        last = state.last_emitted.get(kind)
+        if last is not None and t - last < self.cooldown:
+            self.suppressed += 1
+            return None
+        state.last_emitted[kind] = t
+        self.last_id += 1
+        self.counts[kind] += 1
+        event = {
+            "id": self.last_id,
+            "type": kind,
+            "carrier_id": carrier_id,
+            "at": datetime.fromtimestamp(t, timezone.utc).isoformat(),
+            "lat": state.lat,
+            "lng": state.lng,
+            "details": details,
+        }
+        self.events.append(event)
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+        return event
+
+    def observe(self, carrier_id, t, lat, lng, speed=0):
+        """Check one fix (`t` in epoch seconds); O(1) per call."""
+        self.observed += 1
+        speed = speed or 0
+        state = self.states.get(carrier_id)
+        if state is None:
+            self.states[carrier_id] = CarrierState(t, lat, lng, min(speed, self.speed_limit))
+            return
+
+        elapsed = t - state.t
+        moved_km = haversine_km(state.lat, state.lng, lat, lng)
+        resumed_after = elapsed if elapsed > self.dropout_seconds else None
+        state.t, state.lat, state.lng = max(t, state.t), lat, lng
+
+        if resumed_after is not None:
+            kind = "signal_restored" if state.dropout_reported else "dropout"
+            self.emit(kind, carrier_id, state, t, {"gap_seconds": round(resumed_after, 1)})
+        state.dropout_reported = False
+
+        # Fixes sharing a timestamp (or out of order) say nothing about speed
+        if moved_km > self.jump_min_km and elapsed > 0:
+            implied = moved_km / (elapsed / 3600)
+            if implied > self.max_implied_speed:
+                self.emit("position_jump", carrier_id, state, t, {
+                    "distance_km": round(moved_km, 3),
+                    "elapsed_seconds": round(elapsed, 2),
+                    "implied_speed_kmh": round(implied, 1),
+                })
+
+        if speed > self.speed_limit or speed - state.avg_speed > self.spike_delta:
+            self.emit("speed_spike", carrier_id, state, t, {
+                "speed_kmh": round(speed, 1), "smoothed_speed_kmh": round(state.avg_speed, 1),
+                "limit_kmh": self.speed_limit,
+            })
+        else:
+            # Spikes stay out of the baseline so a burst does not mask the next one
+            state.avg_speed += self.alpha * (speed - state.avg_speed)
+
+        stopped = speed < MIN_MOVING_SPEED_KMH
+        if stopped and state.stall_t is not None and \
+                haversine_km(state.stall_lat, state.stall_lng, lat, lng) <= self.stall_radius_km:
+            stalled_for = t - state.stall_t
+            if stalled_for >= self.stall_seconds and not state.stall_reported:
+                state.stall_reported = True
+                self.emit("stall", carrier_id, state, t, {"stalled_seconds": round(stalled_for, 1)})
+        elif stopped:
+            state.stall_t, state.stall_lat, state.stall_lng, state.stall_reported = t, lat, lng, False
+        else:
+            state.stall_t, state.stall_reported = None, False
+
+    def sweep(self, now=None):
+        """Report carriers that have gone silent and forget long-gone ones; O(carriers), off the ping path."""
+        now = now or time.time()
+        for carrier_id, state in list(self.states.items()):
+            silent = now - state.t
+            if silent > self.state_ttl:
+                del self.states[carrier_id]
+            elif silent > self.dropout_seconds and not state.dropout_reported:
+                state.dropout_reported = True
+                self.emit("dropout", carrier_id, state, now, {"gap_seconds": round(silent, 1), "ongoing": True})
+
+    def recent(self, since=0, carrier_id=None, kind=None, limit=100):
+        """Buffered events newer than id `since`, oldest first."""
+        events = [
+            event for event in self.events
+            if event["id"] > since and (carrier_id is None or event["carrier_id"] == carrier_id)
+            and (kind is None or event["type"] == kind)
+        ]
+        return events[:limit]
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "carriers": len(self.states),
+            "observed": self.observed,
+            "events": self.counts,
+            "suppressed": self.suppressed,
+            "subscribers": len(self.subscribers),
+            "dropped": self.dropped,
+            "last_id": self.last_id,
+        }
+
+
+anomaly_detector = AnomalyDetector(
+    speed_limit=ANOMALY_SPEED_LIMIT_KMH,
+    spike_delta=ANOMALY_SPIKE_DELTA_KMH,
+    alpha=ANOMALY_SPEED_ALPHA,
+    max_implied_speed=ANOMALY_MAX_IMPLIED_SPEED_KMH,
+    jump_min_km=ANOMALY_JUMP_MIN_KM,
+    stall_seconds=ANOMALY_STALL_SECONDS,
+    stall_radius_km=ANOMALY_STALL_RADIUS_KM,
+    dropout_seconds=ANOMALY_DROPOUT_SECONDS,
+    cooldown=ANOMALY_COOLDOWN_SECONDS,
+    buffer_size=ANOMALY_EVENT_BUFFER,
+    queue_size=ANOMALY_QUEUE_SIZE,
+    sweep_interval=ANOMALY_SWEEP_INTERVAL,
+    state_ttl=ANOMALY_STATE_TTL
+)
@@ -2,11 +2,23 @@ import time
 import os
 import hashlib
 import json
-import requests
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from pydantic import BaseModel
+import httpx
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
 from dotenv import load_dotenv
+from services.http_client import SERVICES, get_session, get_async_client, request_with_retry, CircuitBreaker
+from services.cache import TTLCache, make_backend
+from services.repository import TableRepository, RealtimeInvalidator
+from services.news import NewsFeed
+from services.streaming import JsonFieldStream
+from services.prompt import build_user_prompt, compact_context
+from services.fast_path import route_negotiation, fallback_agreement
+from services.gazetteer import gazetteer
 
 # Load environment variables from .env.local
 load_dotenv(dotenv_path=".env.local")
@@ -16,9 +28,76 @@ supabase_url = os.environ.get("NEXT_PUBLIC_SUPABASE_URL", "")
 supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "")
 supabase: Client = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
 
+# Read-through caches per table: profiles change rarely, responses are negotiated live
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", "900"))
+SHIPMENT_CACHE_TTL = float(os.environ.get("SHIPMENT_CACHE_TTL", "60"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "10"))
+
+shipment_repo = TableRepository(supabase, "shipment_requests", ("id",), ttl=SHIPMENT_CACHE_TTL)
+profile_repo = TableRepository(supabase, "carrier_profiles", ("carrier_id",), ttl=PROFILE_CACHE_TTL, max_entries=10000)
+response_repo = TableRepository(supabase, "carrier_responses", ("shipment_id", "carrier_id"), ttl=RESPONSE_CACHE_TTL)
+# Drops cached rows as soon as Supabase reports a change
+realtime_invalidator = RealtimeInvalidator(
+    supabase_url, supabase_key, (shipment_repo, profile_repo, response_repo),
+    enabled=os.environ.get("SUPABASE_REALTIME", "1") != "0"
+)
+
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY")
 NEWSAPI_KEY = os.environ.get("NEWSAPI_KEY")
+# Seconds between background refreshes of the logistics headlines
+NEWS_REFRESH_INTERVAL = float(os.environ.get("NEWS_REFRESH_INTERVAL", "900"))
+
+# Per-source deadline (seconds) for the negotiation input fan-out
+NEGOTIATION_SOURCE_TIMEOUT = float(os.environ.get("NEGOTIATION_SOURCE_TIMEOUT", "5"))
+NEGOTIATION_FETCH_WORKERS = int(os.environ.get("NEGOTIATION_FETCH_WORKERS", "12"))
+# Upper bound on concurrent blocking Supabase calls issued from the event loop
+SUPABASE_MAX_WORKERS = int(os.environ.get("SUPABASE_MAX_WORKERS", "8"))
+
+DEFAULT_WEATHER = {"status": "unknown", "temp": 25, "condition": "clear"}
+
+# Shared pool for the blocking weather/Supabase lookups
+_fetch_pool = ThreadPoolExecutor(max_workers=NEGOTIATION_FETCH_WORKERS, thread_name_prefix="negotiation-fetch")
+# Bounded pool for the sync Supabase client when called from async code
+_db_pool = ThreadPoolExecutor(max_workers=SUPABASE_MAX_WORKERS, thread_name_prefix="supabase")
+
+# Weather cache: keyed by normalized city; "sqlite" backend shares it across workers
+WEATHER_CACHE_TTL = float(os.environ.get("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.environ.get("WEATHER_CACHE_SIZE", "512"))
+WEATHER_CACHE_BACKEND = os.environ.get("WEATHER_CACHE_BACKEND", "memory")
+WEATHER_CACHE_PATH = os.environ.get("WEATHER_CACHE_PATH", os.path.join(".cache", "weather.sqlite3"))
+
+weather_cache = TTLCache(
+    "weather",
+    ttl=WEATHER_CACHE_TTL,
+    backend=make_backend(WEATHER_CACHE_BACKEND, WEATHER_CACHE_PATH, WEATHER_CACHE_SIZE, table="weather")
+)
+
+WEATHER_URL = f"{SERVICES['openweather']}/data/2.5/weather"
+GROQ_URL = f"{SERVICES['groq']}/openai/v1/chat/completions"
+
+# Cache of Groq agreements keyed on the negotiation context; "sqlite" persists it to disk
+GROQ_CACHE_TTL = float(os.environ.get("GROQ_CACHE_TTL", "3600"))
+GROQ_CACHE_SIZE = int(os.environ.get("GROQ_CACHE_SIZE", "256"))
+GROQ_CACHE_BACKEND = os.environ.get("GROQ_CACHE_BACKEND", "memory")
+GROQ_CACHE_PATH = os.environ.get("GROQ_CACHE_PATH", os.path.join(".cache", "negotiations.sqlite3"))
+
+negotiation_cache = TTLCache(
+    "negotiation",
+    ttl=GROQ_CACHE_TTL,
+    backend=make_backend(GROQ_CACHE_BACKEND, GROQ_CACHE_PATH, GROQ_CACHE_SIZE, table="negotiations")
+)
+
+# Skip straight to the fallback agreement while Groq is failing
+groq_breaker = CircuitBreaker(
+    "groq",
+    failure_threshold=int(os.environ.get("GROQ_BREAKER_THRESHOLD", "3")),
+    reset_timeout=float(os.environ.get("GROQ_BREAKER_RESET", "30"))
+)
+
+# Upper bound on Groq requests in flight from this process (tune to the account's rate limit)
+GROQ_MAX_CONCURRENCY = int(os.environ.get("GROQ_MAX_CONCURRENCY", "4"))
+groq_slots = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
 
 class CarrierLocation(BaseModel):
     carrier_id: str
@@ -26,217 +105,451 @@ class CarrierLocation(BaseModel):
     lng: float
     speed: float | None = 0
     heading: float | None = 0
+    # Epoch seconds the fix was taken; the receive time when absent
+    timestamp: float | None = None
 
-def get_weather_data(origin, destination):
-    """Fetch weather data for origin and destination."""
-    if not OPENWEATHER_API_KEY:
-        return {"origin": {"status": "unknown", "temp": 25, "condition": "clear"}, "destination": {"status": "unknown", "temp": 25, "condition": "clear"}}
-    
-    def fetch_weather(city):
-        try:
-            url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={OPENWEATHER_API_KEY}&units=metric"
-            res = requests.get(url, timeout=10)
-            if res.status_code == 200:
-                data = res.json()
-                return {
-                    "status": "good" if data['weather'][0]['main'] in ['Clear', 'Clouds'] else "moderate" if data['weather'][0]['main'] in ['Rain', 'Drizzle'] else "bad",
-                    "temp": data['main']['temp'],
-                    "condition": data['weather'][0]['description']
-                }
-        except:
-            pass
-        return {"status": "unknown", "temp": 25, "condition": "clear"}
-    
+def _weather_params(city):
+    return {"q": city, "appid": OPENWEATHER_API_KEY, "units": "metric"}
+
+def _parse_weather(data):
     return {
-        "origin": fetch_weather(origin.split(',')[0].strip()),
-        "destination": fetch_weather(destination.split(',')[0].strip())
+        "status": "good" if data['weather'][0]['main'] in ['Clear', 'Clouds'] else "moderate" if data['weather'][0]['main'] in ['Rain', 'Drizzle'] else "bad",
+        "temp": data['main']['temp'],
+        "condition": data['weather'][0]['description']
     }
 
-def get_news_data():
-    """Fetch recent logistics/transport news."""
-    if not NEWSAPI_KEY:
-        return ["No news data available"]
-    
+def weather_cache_key(city):
+    """Normalize a city name ("  Chennai " / "chennai") into a cache key."""
+    return " ".join(city.split()).lower()
+
+def weather_query(location):
+    """
+    (cache key, OpenWeather `q`) for a free-text location. Places the gazetteer
+    knows share one key however they are spelt ("Trichy" / "Tiruchirappalli, TN");
+    anything else falls back to its first comma-separated part.
+    """
+    place = gazetteer.resolve(location)
+    if place is not None:
+        return place.id, place.query
+    city = (location or "").split(',')[0].strip()
+    return weather_cache_key(city), city
+
+def _request_weather(city):
     try:
-        url = f"https://newsapi.org/v2/everything?q=logistics+OR+transportation+OR+shipping&sortBy=publishedAt&apiKey={NEWSAPI_KEY}&pageSize=5"
-        res = requests.get(url, timeout=10)
+        res = get_session().get(WEATHER_URL, params=_weather_params(city), timeout=10)
         if res.status_code == 200:
-            data = res.json()
-            return [article['title'] for article in data.get('articles', [])]
+            return _parse_weather(res.json())
     except:
         pass
-    return ["Market conditions stable"]
+    return None
+
+async def _request_weather_async(city):
+    try:
+        res = await request_with_retry("openweather", "GET", WEATHER_URL, params=_weather_params(city), timeout=10)
+        if res.status_code == 200:
+            return _parse_weather(res.json())
+    except Exception as e:
+        print(f"Weather API Error: {e}")
+    return None
+
+def fetch_weather(location):
+    """Fetch current weather for a free-text location (cached per place)."""
+    if not OPENWEATHER_API_KEY:
+        return dict(DEFAULT_WEATHER)
+    key, city = weather_query(location)
+    weather = weather_cache.get_or_load(key, lambda: _request_weather(city))
+    return weather or dict(DEFAULT_WEATHER)
+
+async def fetch_weather_async(location):
+    """Async variant of `fetch_weather` using the shared HTTP client."""
+    if not OPENWEATHER_API_KEY:
+        return dict(DEFAULT_WEATHER)
+    key, city = weather_query(location)
+    weather = await weather_cache.aget_or_load(key, lambda: _request_weather_async(city))
+    return weather or dict(DEFAULT_WEATHER)
+
+def get_weather_data(origin, destination):
+    """Fetch weather data for origin and destination."""
+    return {
+        "origin": fetch_weather(origin),
+        "destination": fetch_weather(destination)
+    }
+
+news_feed = NewsFeed(NEWSAPI_KEY, interval=NEWS_REFRESH_INTERVAL)
+
+def get_news_data(refresh_inline=True):
+    """Recent logistics/transport news, served from the in-memory feed."""
+    return news_feed.current(refresh_inline)
+
+# Errors a Supabase read can raise at runtime (bad request / RLS, network); anything else is a bug
+DB_ERRORS = (APIError, httpx.HTTPError)
 
 def fetch_shipper_data(shipment_id):
     """Fetch shipper details from database."""
-    if not supabase:
-        return {}
     try:
-        result = supabase.table("shipment_requests").select("*").eq("id", shipment_id).single().execute()
-        return result.data if result.data else {}
-    except:
+        return shipment_repo.get(shipment_id) or {}
+    except DB_ERRORS as e:
+        print(f"Shipment lookup failed for {shipment_id}: {e}")
         return {}
 
 def fetch_carrier_data(carrier_id):
     """Fetch carrier profile from database."""
-    if not supabase:
-        return {}
     try:
-        result = supabase.table("carrier_profiles").select("*").eq("carrier_id", carrier_id).single().execute()
-        return result.data if result.data else {}
-    except:
+        return profile_repo.get(carrier_id) or {}
+    except DB_ERRORS as e:
+        print(f"Carrier profile lookup failed for {carrier_id}: {e}")
         return {}
 
 def fetch_carrier_response_data(shipment_id, carrier_id):
     """Fetch specific carrier response details from database."""
-    if not supabase:
+    try:
+        return response_repo.get(shipment_id, carrier_id) or {}
+    except DB_ERRORS as e:
+        print(f"Carrier response lookup failed for {shipment_id}/{carrier_id}: {e}")
         return {}
+
+def fetch_shipment_responses(shipment_id):
+    """All carrier responses to a shipment, in one query."""
     try:
-        result = supabase.table("carrier_responses").select("*").eq("shipment_id", shipment_id).eq("carrier_id", carrier_id).single().execute()
-        return result.data if result.data else {}
-    except:
+        return response_repo.find(shipment_id=shipment_id)
+    except DB_ERRORS as e:
+        print(f"Carrier responses lookup failed for {shipment_id}: {e}")
+        return []
+
+def fetch_carrier_profiles(carrier_ids):
+    """Carrier profiles for many carriers in one query, keyed by carrier_id."""
+    try:
+        return profile_repo.get_many(carrier_ids)
+    except DB_ERRORS as e:
+        print(f"Carrier profiles lookup failed: {e}")
         return {}
 
-def call_groq_negotiator(user_context):
+def fetch_shipments(shipment_ids):
+    """Shipment requests for many ids in one query, keyed by id."""
+    try:
+        return shipment_repo.get_many(shipment_ids)
+    except DB_ERRORS as e:
+        print(f"Shipments lookup failed: {e}")
+        return {}
+
+async def run_db(fn, *args):
+    """Run a blocking Supabase call on the bounded DB pool."""
+    return await asyncio.get_running_loop().run_in_executor(_db_pool, fn, *args)
+
+def _negotiation_sources(shipper, shipment_id, carrier_id):
     """
-    Calls Groq AI to act as a neutral mediator and generate a dynamic agreement with external data.
+    Map each negotiation input to its (sync loader, async loader, arguments, fallback value).
     """
-    if not GROQ_API_KEY:
-        return None
+    origin = shipper.get('source')
+    destination = shipper.get('destination')
+    # No location, no weather lookup: the default weather stands in
+    return {
+        "weather_origin": (fetch_weather, fetch_weather_async, (origin,), DEFAULT_WEATHER) if origin else None,
+        "weather_destination": (fetch_weather, fetch_weather_async, (destination,), DEFAULT_WEATHER) if destination else None,
+        "shipper_db": (fetch_shipper_data, None, (shipment_id,), {}) if shipment_id else None,
+        "carrier_profile_db": (fetch_carrier_data, None, (carrier_id,), {}) if carrier_id else None,
+        "carrier_response_db": (fetch_carrier_response_data, None, (shipment_id, carrier_id), {}) if shipment_id and carrier_id else None,
+    }
+
+def _collect_inputs(results, news):
+    """Shape the raw fan-out results into the negotiation inputs."""
+    return {
+        "weather": {
+            "origin": results.get("weather_origin") or dict(DEFAULT_WEATHER),
+            "destination": results.get("weather_destination") or dict(DEFAULT_WEATHER)
+        },
+        "news": news,
+        "news_freshness": news_feed.freshness(),
+        "shipper_db": results.get("shipper_db") or {},
+        "carrier_profile_db": results.get("carrier_profile_db") or {},
+        "carrier_response_db": results.get("carrier_response_db") or {},
+    }
+
+def _source_default(name, default):
+    print(f"Negotiation input '{name}' failed or missed its deadline, using default")
+    return default.copy()
+
+def fetch_negotiation_inputs(shipper, shipment_id, carrier_id, timeout=NEGOTIATION_SOURCE_TIMEOUT):
+    """
+    Fetch weather and DB inputs in parallel on the shared thread pool.
+    Sources that fail or miss the deadline fall back to their default value.
+    """
+    sources = {name: source for name, source in _negotiation_sources(shipper, shipment_id, carrier_id).items() if source}
+    futures = {name: _fetch_pool.submit(loader, *args) for name, (loader, _, args, _) in sources.items()}
+    wait(futures.values(), timeout=timeout)
+
+    results = {}
+    for name, future in futures.items():
+        default = sources[name][3]
+        if future.done() and future.exception() is None:
+            results[name] = future.result()
+        else:
+            results[name] = _source_default(name, default)
+    return _collect_inputs(results, get_news_data())
+
+async def gather_negotiation_inputs(shipper, shipment_id, carrier_id, timeout=NEGOTIATION_SOURCE_TIMEOUT):
+    """
+    Async variant of `fetch_negotiation_inputs`. HTTP sources use the shared async
+    client and DB lookups go through the bounded Supabase pool.
+    """
+    sources = {name: source for name, source in _negotiation_sources(shipper, shipment_id, carrier_id).items() if source}
+
+    async def run(name, loader, async_loader, args, default):
+        try:
+            pending = async_loader(*args) if async_loader else run_db(loader, *args)
+            return await asyncio.wait_for(pending, timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return _source_default(name, default)
+
+    values = await asyncio.gather(*(run(name, *source) for name, source in sources.items()))
+    # Never refresh inline here: that would block the event loop
+    return _collect_inputs(dict(zip(sources, values)), get_news_data(refresh_inline=False))
+
+GROQ_SYSTEM_PROMPT = """
+You are 'NegotiateX AI', an advanced logistics mediator. Your goal is to finalize a fair, legally binding, and transparent transportation agreement (MTSA) between a Shipper and a Carrier. 
+
+You must build TRUST through DEEP TRANSPARENCY by considering and EXPLAINING the following 14-Factor Framework in your decision-making and agreement text:
+
+1. **Weather Conditions Impact**: Analyze real-time weather (provided) for route safety.
+2. **Public Peak Hour Congestion**: Shift schedules to avoid city-level rush hours (e.g., 8-10 AM).
+3. **Public Holidays & Festival Traffic**: Adjust timelines for regional holidays/festivals.
+4. **Real-Time Traffic Tracking (OpenStreetMap)**: Simulate route efficiency via OSM data analysis.
+5. **Route Selection & Alternative Paths**: Explain why a specific route (e.g., NH44 vs NH209) was chosen.
+6. **Delivery Time Risk Assessment**: Calculate the probability of delays based on external risks.
+7. **Carrier Availability Constraints**: Factor in vehicle limits and driver rest requirements.
+8. **Carrier Profit Margin Limits**: Ensure a fair profit (e.g., 10-15%) but strictly cap excessive scaling.
+9. **Fair Pricing & Cost Transparency**: Provide a logical breakdown of the negotiated price.
+10. **No Unjustified Extra Charges**: Explicitly reject and remove hidden/vague fees.
+11. **Penalty Adjustment Based on Risk**: Waive/reduce penalties if delays are caused by uncontrollable factors like Weather.
+12. **Customer Cost Protection Logic**: Prevent overcharging by comparing with market news and news/weather context.
+13. **Operational Feasibility Check**: Verify that the vehicle type and capacity match the cargo requirements.
+14. **Final Fairness & Trust Score**: Provide a final score (0-100) reflecting the balance of the agreement.
+
+EXTERNAL DATA PROVIDED:
+- Weather conditions, Logistics news, Carrier profile, and Shipper constraints.
+
+RESPONSE FORMAT (JSON ONLY):
+{
+  "agreement_text": "Full professional markdown MTSA. You MUST include a section titled 'AI EXPLAINABILITY: THE 14-FACTOR ANALYSIS' explaining how the factors above influenced this specific agreement.",
+  "justified_price": "e.g. $45,000",
+  "fixed_deadline": "DD Mon YYYY",
+  "clauses": [
+    {"id": "pricing", "title": "Base Price", "negotiated": "...", "reasoning": "...", "status": "agreed"}
+  ],
+  "transparency": {
+     "weather_traffic": {
+        "status": "...", 
+        "details": ["Factor 1: ...", "Factor 4: ...", "Factor 5: ..."],
+        "impact": "..."
+     },
+     "schedule_efficiency": {
+        "peak_hours_impact": "Factor 2: ...",
+        "holiday_impact": "Factor 3: ..."
+     },
+     "cost_transparency": {
+        "profit_limit_check": "Factor 8: ...",
+        "extra_charges_check": "Factor 10: ...",
+        "customer_protection": "Factor 9 & 12: ..."
+     },
+     "risk_assessment": {
+        "risk_level": "...",
+        "mitigation": "Factor 6 & 11: ..."
+     },
+     "operational_check": {
+        "feasibility": "Factor 13: ...",
+        "vehicle_match": "Factor 7: ..."
+     },
+     "trust_score": "Factor 14: ..."
+  },
+  "confidence_score": 95,
+  "summary": "..."
+}
+"""
 
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
+def _groq_headers():
+    return {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
     }
-    
-    system_prompt = """
-    You are 'NegotiateX AI', an advanced logistics mediator. Your goal is to finalize a fair, legally binding, and transparent transportation agreement (MTSA) between a Shipper and a Carrier. 
-    
-    You must build TRUST through DEEP TRANSPARENCY by considering and EXPLAINING the following 14-Factor Framework in your decision-making and agreement text:
-
-    1. **Weather Conditions Impact**: Analyze real-time weather (provided) for route safety.
-    2. **Public Peak Hour Congestion**: Shift schedules to avoid city-level rush hours (e.g., 8-10 AM).
-    3. **Public Holidays & Festival Traffic**: Adjust timelines for regional holidays/festivals.
-    4. **Real-Time Traffic Tracking (OpenStreetMap)**: Simulate route efficiency via OSM data analysis.
-    5. **Route Selection & Alternative Paths**: Explain why a specific route (e.g., NH44 vs NH209) was chosen.
-    6. **Delivery Time Risk Assessment**: Calculate the probability of delays based on external risks.
-    7. **Carrier Availability Constraints**: Factor in vehicle limits and driver rest requirements.
-    8. **Carrier Profit Margin Limits**: Ensure a fair profit (e.g., 10-15%) but strictly cap excessive scaling.
-    9. **Fair Pricing & Cost Transparency**: Provide a logical breakdown of the negotiated price.
-    10. **No Unjustified Extra Charges**: Explicitly reject and remove hidden/vague fees.
-    11. **Penalty Adjustment Based on Risk**: Waive/reduce penalties if delays are caused by uncontrollable factors like Weather.
-    12. **Customer Cost Protection Logic**: Prevent overcharging by comparing with market news and news/weather context.
-    13. **Operational Feasibility Check**: Verify that the vehicle type and capacity match the cargo requirements.
-    14. **Final Fairness & Trust Score**: Provide a final score (0-100) reflecting the balance of the agreement.
-
-    EXTERNAL DATA PROVIDED:
-    - Weather conditions, Logistics news, Carrier profile, and Shipper constraints.
-
-    RESPONSE FORMAT (JSON ONLY):
-    {
-      "agreement_text": "Full professional markdown MTSA. You MUST include a section titled 'AI EXPLAINABILITY: THE 14-FACTOR ANALYSIS' explaining how the factors above influenced this specific agreement.",
-      "justified_price": "e.g. $45,000",
-      "fixed_deadline": "07 Feb 2026",
-      "clauses": [
-        {"id": "pricing", "title": "Base Price", "negotiated": "...", "reasoning": "...", "status": "agreed"}
-      ],
-      "transparency": {
-         "weather_traffic": {
-            "status": "...", 
-            "details": ["Factor 1: ...", "Factor 4: ...", "Factor 5: ..."],
-            "impact": "..."
-         },
-         "schedule_efficiency": {
-            "peak_hours_impact": "Factor 2: ...",
-            "holiday_impact": "Factor 3: ..."
-         },
-         "cost_transparency": {
-            "profit_limit_check": "Factor 8: ...",
-            "extra_charges_check": "Factor 10: ...",
-            "customer_protection": "Factor 9 & 12: ..."
-         },
-         "risk_assessment": {
-            "risk_level": "...",
-            "mitigation": "Factor 6 & 11: ..."
-         },
-         "operational_check": {
-            "feasibility": "Factor 13: ...",
-            "vehicle_match": "Factor 7: ..."
-         },
-         "trust_score": "Factor 14: ..."
-      },
-      "confidence_score": 95,
-      "summary": "..."
+
+def _groq_payload(user_context):
+    """Build the chat completion request for a negotiation context."""
+    user_prompt = build_user_prompt(user_context)
+
+    return {
+        "model": "llama-3.3-70b-versatile",
+        "messages": [
+            {"role": "system", "content": GROQ_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.5
     }
+
+def _groq_content(res):
+    """Extract the completion from a Groq response (None for a non-2xx one)."""
+    if 200 <= res.status_code < 300:
+        return res.json()['choices'][0]['message']['content']
+    print(f"Groq API Error: HTTP {res.status_code}")
+    return None
+
+def negotiation_cache_key(user_context):
     """
+    Canonical hash of everything the agreement depends on (weather/news included).
+    Hashing the compacted context means row timestamps and ids do not split the cache.
+    """
+    stable = {**compact_context(user_context), "shipment_id": user_context.get("shipment_id")}
+    canonical = json.dumps(stable, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
 
-    user_prompt = f"""
-SHIPPER REQUEST (DB + INPUT): {json.dumps(user_context['shipper_request'])}
-CARRIER RESPONSE (DB + PROPOSAL): {json.dumps(user_context['carrier_response'])}
-CARRIER FLEET/PROFILE: {json.dumps(user_context['carrier_profile'])}
-EXTERNAL ENVIRONMENT (WEATHER/NEWS): {json.dumps({'weather': user_context['weather'], 'news': user_context['news']})}
-SHIPMENT_REFERENCE: {user_context['shipment_id']}
-NEGOTIATION_SESSION: {user_context['id']}
-"""
+def _cache_entry(user_context, content):
+    """Only cache completions that parse, remembering which session produced them."""
+    try:
+        json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    return {"session_id": user_context["id"], "content": content}
+
+def _record_groq_outcome(entry):
+    """Only a completion that parses counts as a success for the circuit breaker."""
+    if entry:
+        groq_breaker.record_success()
+    else:
+        groq_breaker.record_failure()
+    return entry
+
+def _from_cache_entry(user_context, entry):
+    if not entry:
+        return None
+    # The cached agreement quotes the session that produced it; re-label it for this one
+    return entry["content"].replace(entry["session_id"], user_context["id"])
 
+def _request_groq(user_context):
+    if not groq_breaker.allow():
+        print("Groq circuit open, using fallback agreement")
+        return None
     try:
-        payload = {
-            "model": "llama-3.3-70b-versatile",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "response_format": {"type": "json_object"},
-            "temperature": 0.5
-        }
-        res = requests.post(url, headers=headers, json=payload, timeout=30)
-        if res.status_code == 200:
-            return res.json()['choices'][0]['message']['content']
+        res = get_session().post(GROQ_URL, headers=_groq_headers(), json=_groq_payload(user_context), timeout=30)
+        return _record_groq_outcome(_cache_entry(user_context, _groq_content(res)))
     except Exception as e:
+        groq_breaker.record_failure()
         print(f"Groq API Error: {e}")
+    finally:
+        groq_breaker.release()
     return None
 
-def negotiate_contract_api(data):
+async def _request_groq_async(user_context):
+    if not groq_breaker.allow():
+        print("Groq circuit open, using fallback agreement")
+        return None
+    try:
+        async with groq_slots:
+            res = await request_with_retry("groq", "POST", GROQ_URL, headers=_groq_headers(), json=_groq_payload(user_context), timeout=30)
+        return _record_groq_outcome(_cache_entry(user_context, _groq_content(res)))
+    except Exception as e:
+        groq_breaker.record_failure()
+        print(f"Groq API Error: {e}")
+    finally:
+        # Cancelled (deadline, client gone): free the trial slot without a verdict
+        groq_breaker.release()
+    return None
+
+async def _stream_groq(user_context):
     """
-    Main entry point for AI negotiation. Uses external APIs and DB data with Groq.
+    Stream the Groq completion, yielding content chunks as they arrive.
+    JSON mode is not available for streamed completions, so the system
+    prompt alone asks for JSON.
+    """
+    payload = {**_groq_payload(user_context), "stream": True}
+    payload.pop("response_format", None)
+    client = get_async_client("groq")
+    async with groq_slots, client.stream("POST", GROQ_URL, headers=_groq_headers(), json=payload, timeout=30) as res:
+        if res.status_code != 200:
+            await res.aread()
+            _groq_content(res)
+            return
+        async for line in res.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+def call_groq_negotiator(user_context):
+    """
+    Calls Groq AI to act as a neutral mediator and generate a dynamic agreement with external data.
+    Identical contexts are answered from the negotiation cache.
     """
-    shipper = data.get("shipperTerms", {})
-    carrier = data.get("carrierConstraints", {})
-    shipment_id = data.get("shipment_id")
-    carrier_id = data.get("carrier_id")
+    if not GROQ_API_KEY:
+        return None
+
+    key = negotiation_cache_key(user_context)
+    entry = negotiation_cache.get_or_load(key, lambda: _request_groq(user_context))
+    return _from_cache_entry(user_context, entry)
+
+async def call_groq_negotiator_async(user_context):
+    """Async variant of `call_groq_negotiator`; cancelling the task aborts the request."""
+    if not GROQ_API_KEY:
+        return None
+
+    key = negotiation_cache_key(user_context)
+    entry = await negotiation_cache.aget_or_load(key, lambda: _request_groq_async(user_context))
+    return _from_cache_entry(user_context, entry)
+
+def _prepare_negotiation(data):
+    """Extract the request fields and assign a unique session ID."""
     user_email = data.get("userEmail", "shipper@negotiatex.ai")
-    
+
     # Generate unique session ID for this negotiation
     timestamp = int(time.time())
-    unique_id = f"NEG-{hashlib.md5(f'{user_email}-{timestamp}'.encode()).hexdigest()[:8].upper()}"
-    
-    # Fetch external data
-    weather_data = get_weather_data(shipper.get('source', 'Delhi'), shipper.get('destination', 'Mumbai'))
-    news_data = get_news_data()
-    
-    # Fetch DB data
-    shipper_db = fetch_shipper_data(shipment_id) if shipment_id else {}
-    carrier_profile_db = fetch_carrier_data(carrier_id) if carrier_id else {}
-    carrier_response_db = fetch_carrier_response_data(shipment_id, carrier_id) if shipment_id and carrier_id else {}
-    
-    # Priority: DB Data > Frontend Data
-    context = {
-        "id": unique_id,
-        "shipper_request": {**shipper, **shipper_db},
-        "carrier_response": {**carrier, **carrier_response_db},
-        "carrier_profile": carrier_profile_db,
-        "weather": weather_data,
-        "news": news_data,
-        "shipment_id": shipment_id
+    # The carrier keeps IDs distinct when one shipper negotiates with several carriers at once
+    session_key = f"{user_email}-{data.get('carrier_id')}-{timestamp}" if data.get("carrier_id") else f"{user_email}-{timestamp}"
+    unique_id = f"NEG-{hashlib.md5(session_key.encode()).hexdigest()[:8].upper()}"
+
+    return {
+        "shipper": data.get("shipperTerms", {}),
+        "carrier": data.get("carrierConstraints", {}),
+        "shipment_id": data.get("shipment_id"),
+        "carrier_id": data.get("carrier_id"),
+        "user_email": user_email,
+        "unique_id": unique_id
     }
 
-    # Attempt AI Negotiation via Groq
-    ai_result_raw = call_groq_negotiator(context)
-    
+def build_negotiation_context(request, inputs):
+    """Merge request and fetched inputs. Priority: DB Data > Frontend Data."""
+    return {
+        "id": request["unique_id"],
+        "shipper_request": {**request["shipper"], **inputs["shipper_db"]},
+        "carrier_response": {**request["carrier"], **inputs["carrier_response_db"]},
+        "carrier_profile": inputs["carrier_profile_db"],
+        "weather": inputs["weather"],
+        "news": inputs["news"],
+        "news_freshness": inputs["news_freshness"],
+        "shipment_id": request["shipment_id"]
+    }
+
+def build_negotiation_result(request, context, ai_result_raw):
+    """Turn the raw Groq output into the API response, falling back to a template."""
+    shipper = request["shipper"]
+    carrier = request["carrier"]
+    unique_id = request["unique_id"]
+    carrier_id = request["carrier_id"]
+    shipment_id = request["shipment_id"]
+
     if ai_result_raw:
         try:
             ai_data = json.loads(ai_result_raw)
+            transparency = ai_data.get("transparency")
+            if isinstance(transparency, dict):
+                transparency["news_freshness"] = context["news_freshness"]
+                # Absent when the agreement came from the negotiation cache (no prompt was sent)
+                if context.get("prompt_tokens"):
+                    transparency["prompt_tokens"] = context["prompt_tokens"]
             return {
                 "status": "success",
                 "agreement_id": unique_id,
@@ -246,40 +559,173 @@ def negotiate_contract_api(data):
                 "clauses": ai_data.get("clauses"),
                 "confidence_score": ai_data.get("confidence_score", 95),
                 "summary": ai_data.get("summary", "AI successfully mediated terms."),
-                "transparency_report": ai_data.get("transparency"),
+                "transparency_report": transparency,
                 "carrier_id": carrier_id,
                 "shipment_id": shipment_id
             }
         except:
             pass # Fallback to template if JSON parse fails
  
-    # FALLBACK ENGINE (If AI is down or no key)
-    rate = shipper.get('baseBudget', '$2,700')
-    origin = shipper.get('source', 'Chennai')
-    dest = shipper.get('destination', 'Mumbai')
-    
-    fallback_agreement = f"""
-# MASTER TRANSPORTATION SERVICES AGREEMENT (MTSA)
-## ID: {unique_id} (FALLBACK MODE)
- 
-**1. PARTIES:** {user_email} (Shipper) and {carrier.get('carrierName', 'Registered Carrier')}.
-**2. PERFORMANCE:** Fixed Rate of {rate} for route {origin} to {dest}.
-**3. AI EXPLAINABILITY:** Route analyzed with standard risk protocols. 
-**4. LIABILITY:** Carrier maintains full insurance coverage for cargo.
-"""
-    
+    # AI down, no key or unparseable output: build the agreement from the inputs by rules
+    return fallback_agreement(request, context)
+
+def negotiate_contract_api(data):
+    """
+    Main entry point for AI negotiation. Uses external APIs and DB data with Groq.
+    """
+    request = _prepare_negotiation(data)
+
+    # Fetch external and DB data concurrently
+    inputs = fetch_negotiation_inputs(request["shipper"], request["shipment_id"], request["carrier_id"])
+    context = build_negotiation_context(request, inputs)
+
+    # Uncontested cases are settled by rules; only the rest wait on Groq
+    settled = route_negotiation(request, context)
+    if settled is not None:
+        return settled
+    return build_negotiation_result(request, context, call_groq_negotiator(context))
+
+async def negotiate_contract_api_async(data, inputs=None):
+    """
+    Async entry point used by the FastAPI server. Nothing here blocks the event loop,
+    and cancelling the task aborts any in-flight HTTP call. `inputs` skips the
+    fetch when the caller already gathered them (see `negotiate_shipment_async`).
+    """
+    request = _prepare_negotiation(data)
+
+    if inputs is None:
+        inputs = await gather_negotiation_inputs(request["shipper"], request["shipment_id"], request["carrier_id"])
+    context = build_negotiation_context(request, inputs)
+
+    settled = route_negotiation(request, context)
+    if settled is not None:
+        return settled
+    return build_negotiation_result(request, context, await call_groq_negotiator_async(context))
+
+def price_value(price):
+    """Numeric value of a quoted price such as "$45,000" or "₹2,700.50" (None if absent)."""
+    if isinstance(price, (int, float)):
+        return float(price)
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", str(price or ""))
+    return float(match.group().replace(",", "")) if match else None
+
+def rank_negotiations(results):
+    """
+    Side-by-side comparison of several carriers' agreements for one shipment:
+    successful agreements first, then cheapest justified price, then confidence.
+    """
+    rows = []
+    for carrier_id, response, result in results:
+        rows.append({
+            "carrier_id": carrier_id,
+            "status": result.get("status"),
+            "proposed_price": response.get("proposed_price"),
+            "justified_price": result.get("justified_price"),
+            "justified_price_value": price_value(result.get("justified_price")),
+            "fixed_deadline": result.get("fixed_deadline"),
+            "confidence_score": result.get("confidence_score"),
+            "summary": result.get("summary"),
+            "agreement_id": result.get("agreement_id"),
+        })
+    rows.sort(key=lambda row: (
+        row["status"] != "success",
+        row["justified_price_value"] is None,
+        row["justified_price_value"] or 0,
+        -(row["confidence_score"] or 0),
+    ))
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+    return rows
+
+async def negotiate_shipment_async(shipment_id, data=None):
+    """
+    Negotiate with every carrier that responded to `shipment_id`, concurrently.
+    Shipment, weather and news inputs are fetched once and shared; only the
+    carrier profile and response differ per negotiation. Groq calls are bounded
+    by GROQ_MAX_CONCURRENCY.
+    """
+    data = data or {}
+    shipment, responses = await asyncio.gather(
+        run_db(fetch_shipper_data, shipment_id), run_db(fetch_shipment_responses, shipment_id)
+    )
+    responses = [r for r in responses if r.get("response_type") != "reject"]
+    shipper = {
+        "source": shipment.get("source_location"),
+        "destination": shipment.get("destination_location"),
+        **data.get("shipperTerms", {}),
+    }
+
+    # shipment_id=None: the shipment row was already loaded above
+    shared, profiles = await asyncio.gather(
+        gather_negotiation_inputs(shipper, None, None),
+        run_db(fetch_carrier_profiles, [r["carrier_id"] for r in responses])
+    )
+    shared["shipper_db"] = shipment
+
+    async def negotiate(response):
+        carrier_id = response["carrier_id"]
+        inputs = {**shared, "carrier_profile_db": profiles.get(carrier_id, {}), "carrier_response_db": response}
+        request = {**data, "shipperTerms": shipper, "shipment_id": shipment_id, "carrier_id": carrier_id}
+        return carrier_id, response, await negotiate_contract_api_async(request, inputs)
+
+    results = await asyncio.gather(*(negotiate(response) for response in responses))
     return {
-        "status": "success",
-        "agreement_id": unique_id,
-        "agreement": fallback_agreement.strip(),
-        "justified_price": rate,
-        "fixed_deadline": "07 Feb 2026",
-        "clauses": [{"id": "pricing", "title": "Base Price", "negotiated": rate, "reasoning": "Standard market rate fallback.", "status": "agreed"}],
-        "confidence_score": 85,
-        "transparency_report": {
-            "weather": {"status": "LOW", "details": ["Standard weather profile applied."]},
-            "fairness": {"profit_limit": "12% Cap", "extra_charges": "None detected"}
-        },
-        "carrier_id": carrier_id,
-        "shipment_id": shipment_id
+        "shipment_id": shipment_id,
+        "carriers": len(results),
+        "ranking": rank_negotiations(results),
+        "negotiations": {carrier_id: result for carrier_id, _, result in results},
     }
+
+# Agreement fields surfaced by /negotiate/stream as soon as they parse, with their response names
+STREAMED_FIELDS = {
+    "justified_price": "justified_price",
+    "fixed_deadline": "fixed_deadline",
+    "clauses": "clauses",
+    "transparency": "transparency_report",
+    "confidence_score": "confidence_score",
+    "summary": "summary",
+}
+
+async def stream_negotiation(data):
+    """
+    Async generator behind /negotiate/stream. Yields (event, payload) pairs:
+    "started", "agreement_delta" chunks of the agreement markdown, "field"
+    for each structured field once it parses, and finally "result" with the
+    same response body /negotiate returns.
+    """
+    request = _prepare_negotiation(data)
+    yield "started", {"agreement_id": request["unique_id"]}
+
+    inputs = await gather_negotiation_inputs(request["shipper"], request["shipment_id"], request["carrier_id"])
+    context = build_negotiation_context(request, inputs)
+
+    settled = route_negotiation(request, context)
+    if settled is not None:
+        yield "result", settled
+        return
+
+    ai_result_raw = None
+    if GROQ_API_KEY:
+        key = negotiation_cache_key(context)
+        ai_result_raw = _from_cache_entry(context, negotiation_cache.get(key))
+        if ai_result_raw is None and groq_breaker.allow():
+            parser = JsonFieldStream("agreement_text", STREAMED_FIELDS)
+            try:
+                async for chunk in _stream_groq(context):
+                    for kind, value in parser.feed(chunk):
+                        if kind == "delta":
+                            yield "agreement_delta", {"text": value}
+                        else:
+                            yield "field", {"name": STREAMED_FIELDS[value[0]], "value": value[1]}
+                entry = _record_groq_outcome(_cache_entry(context, parser.document()))
+                if entry:
+                    negotiation_cache.set(key, entry)
+                    ai_result_raw = entry["content"]
+            except Exception as e:
+                groq_breaker.record_failure()
+                print(f"Groq API Error: {e}")
+            finally:
+                # Also runs when the SSE client disconnects and the generator is closed
+                groq_breaker.release()
+
+    yield "result", build_negotiation_result(request, context, ai_result_raw)
@@ -0,0 +1,180 @@
+import os
+import time
+import asyncio
+import numpy as np
+from services.api import run_db, supabase, profile_repo
+from services.spatial import GridIndex
+from services.gazetteer import gazetteer
+from services import distance
+
+# Seconds between reloads of carrier_profiles into the base-location index
+CARRIER_INDEX_REFRESH = float(os.environ.get("CARRIER_INDEX_REFRESH", "300"))
+CARRIER_INDEX_PAGE_SIZE = 1000
+SPATIAL_CELL_DEG = float(os.environ.get("SPATIAL_CELL_DEG", "0.1"))
+
+# Center used when a search location names no known place
+SEARCH_DEFAULT_PLACE = os.environ.get("SEARCH_DEFAULT_PLACE", "Chennai")
+
+
+def match_city(location):
+    """
+    Coordinates of the gazetteer place named verbatim in a free-text location,
+    or None. Prefix and misspelling guesses are left out: geofences and
+    shipment matching must not act on a town that was only guessed.
+    """
+    return gazetteer.coordinates(location, exact=True)
+
+def resolve_search_center(source):
+    """Map a free-text source location to search coordinates (best guess, default: SEARCH_DEFAULT_PLACE)."""
+    return gazetteer.coordinates(source) or gazetteer.coordinates(SEARCH_DEFAULT_PLACE)
+
+
+class CarrierDirectory:
+    """
+    Carrier profiles plus two spatial indexes: carrier base coordinates
+    (reloaded from carrier_profiles on a schedule) and live truck positions
+    (updated incrementally by the telemetry ingest path).
+    """
+
+    def __init__(self, refresh_interval=300, cell_deg=0.1):
+        self.refresh_interval = refresh_interval
+        self.profiles = {}
+        self.bases = GridIndex(cell_deg)
+        self.live = GridIndex(cell_deg)
+        self.live_speeds = {}
+        self.loaded_at = None
+        self._task = None
+
+    def load(self, rows):
+        profiles = {}
+        bases = GridIndex(self.bases.cell_deg)
+        for row in rows:
+            profiles[row["carrier_id"]] = row
+            if row.get("latitude") is not None and row.get("longitude") is not None:
+                bases.upsert(row["carrier_id"], float(row["latitude"]), float(row["longitude"]))
+        self.profiles, self.bases = profiles, bases
+        self.loaded_at = time.time()
+
+    async def refresh(self):
+        if not supabase:
+            return
+        rows = []
+        start = 0
+        while True:
+            page = await run_db(
+                supabase.table("carrier_profiles").select("*").range(start, start + CARRIER_INDEX_PAGE_SIZE - 1).execute
+            )
+            rows.extend(page.data or [])
+            if len(page.data or []) < CARRIER_INDEX_PAGE_SIZE:
+                break
+            start += CARRIER_INDEX_PAGE_SIZE
+        self.load(rows)
+        # The full scan doubles as a warm-up of the negotiation profile cache
+        profile_repo.prime(rows)
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Carrier index refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def update_live(self, carrier_id, lat, lng, speed=None):
+        self.live.upsert(carrier_id, lat, lng)
+        self.live_speeds[carrier_id] = speed
+
+    def positions(self, carrier_ids=None, live=False):
+        """(carrier_ids, (N, 2) lat/lng array, live speeds) for the indexed carriers."""
+        index = self.live if live else self.bases
+        if carrier_ids is None:
+            carrier_ids = list(index._points)
+        found = [cid for cid in carrier_ids if cid in index]
+        coords = np.array([index.position(cid) for cid in found], dtype=np.float64).reshape(-1, 2)
+        speeds = [self.live_speeds.get(cid) for cid in found] if live else None
+        return found, coords, speeds
+
+    def route_matrix(self, origins, carrier_ids=None, live=False):
+        """Distance / bearing / ETA from every origin to every indexed carrier."""
+        found, coords, speeds = self.positions(carrier_ids, live)
+        return found, distance.route_matrix(origins, coords, speeds)
+
+    def nearest(self, lat, lng, k=10, radius_km=None, live=False):
+        """
+        k nearest carriers as (distance_km, carrier_id), optionally capped at
+        `radius_km`; with no `k`, every carrier within `radius_km`.
+        """
+        index = self.live if live else self.bases
+        if not k and radius_km is not None:
+            return index.within_radius(lat, lng, radius_km)
+        return index.nearest(lat, lng, k or 10, max_km=radius_km)
+
+    def stats(self):
+        return {
+            "profiles": len(self.profiles),
+            "indexed_bases": len(self.bases),
+            "indexed_live": len(self.live),
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None
+        }
+
+
+carrier_directory = CarrierDirectory(refresh_interval=CARRIER_INDEX_REFRESH, cell_deg=SPATIAL_CELL_DEG)
+
+
+def _search_entry(profile, carrier_id, distance_km, eta_hours=None):
+    """One carrier in the shape the shipper dashboard renders."""
+    email = profile.get("email") or f"carrier_{carrier_id[1:5]}@logistics.in"
+    if distance_km is None:
+        return {
+            "id": carrier_id,
+            "email": email,
+            "location": profile.get("base_location") or "Unknown",
+            "distance": "0.0",
+            "time": "N/A",
+            "reliability": profile.get("reliability_score") or 5.0,
+            "capacity": profile.get("available_capacity") or 0
+        }
+    return {
+        "id": carrier_id,
+        "email": email,
+        "location": profile.get("base_location"),
+        "distance": f"{distance_km:.1f}",
+        "time": distance.format_eta(eta_hours),
+        "reliability": profile.get("reliability_score") or 5.0,
+        "capacity": profile.get("available_capacity")
+    }
+
+
+def search_carriers(source=None, lat=None, lng=None, k=10, radius_km=None, live=False):
+    """
+    Nearest carriers to a source location (or explicit coordinates), using
+    live truck positions when `live` is set and base locations otherwise.
+    """
+    if lat is None or lng is None:
+        lat, lng = resolve_search_center(source)
+    directory = carrier_directory
+    matches = directory.nearest(lat, lng, k, radius_km, live)
+    speeds = [directory.live_speeds.get(carrier_id) for _, carrier_id in matches] if live else None
+    etas = distance.eta_hours(np.array([d for d, _ in matches], dtype=np.float64), speeds)
+    results = [
+        _search_entry(directory.profiles.get(carrier_id, {}), carrier_id, distance_km, eta)
+        for (distance_km, carrier_id), eta in zip(matches, etas)
+    ]
+    if not live and radius_km is None and k and len(results) < k:
+        # Carriers without base coordinates cannot be ranked; list them after the ranked ones
+        unlocated = [cid for cid in directory.profiles if cid not in directory.bases]
+        results.extend(_search_entry(directory.profiles[cid], cid, None) for cid in unlocated[:k - len(results)])
+    return results
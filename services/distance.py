@@ -0,0 +1,75 @@
+import os
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+# Assumed average truck speed when a carrier has no usable live speed
+AVERAGE_TRUCK_SPEED_KMH = float(os.environ.get("AVERAGE_TRUCK_SPEED_KMH", "60"))
+# Below this live speed (km/h) a truck is treated as stopped, not as its ETA speed
+MIN_MOVING_SPEED_KMH = 5.0
+
+
+def _grid(lat1, lng1, lat2, lng2):
+    """Radians, shaped (M, 1) for the origins and (1, N) for the targets."""
+    return (
+        np.radians(np.asarray(lat1, dtype=np.float64)).reshape(-1, 1),
+        np.radians(np.asarray(lng1, dtype=np.float64)).reshape(-1, 1),
+        np.radians(np.asarray(lat2, dtype=np.float64)).reshape(1, -1),
+        np.radians(np.asarray(lng2, dtype=np.float64)).reshape(1, -1),
+    )
+
+def _haversine(p1, l1, p2, l2):
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin((l2 - l1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_matrix(lat1, lng1, lat2, lng2):
+    """(M, N) great-circle distances in km from M origins to N targets."""
+    return _haversine(*_grid(lat1, lng1, lat2, lng2))
+
+def haversine_pairs(lat1, lng1, lat2, lng2):
+    """(M,) great-circle distances in km from the i-th origin to the i-th target."""
+    return _haversine(*(np.radians(np.asarray(v, dtype=np.float64)).reshape(-1) for v in (lat1, lng1, lat2, lng2)))
+
+def bearing_matrix(lat1, lng1, lat2, lng2):
+    """(M, N) initial compass bearings in degrees (0 = north) from origins to targets."""
+    p1, l1, p2, l2 = _grid(lat1, lng1, lat2, lng2)
+    dl = l2 - l1
+    y = np.sin(dl) * np.cos(p2)
+    x = np.cos(p1) * np.sin(p2) - np.sin(p1) * np.cos(p2) * np.cos(dl)
+    return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+def effective_speeds(speeds, count):
+    """
+    Per-carrier ETA speeds: live speed when moving, the fleet average otherwise
+    (None entries, i.e. no live speed known, also fall back to the average).
+    """
+    if speeds is None:
+        return np.full(count, AVERAGE_TRUCK_SPEED_KMH)
+    speeds = np.asarray(speeds, dtype=np.float64).reshape(-1)
+    return np.where(np.isfinite(speeds) & (speeds >= MIN_MOVING_SPEED_KMH), speeds, AVERAGE_TRUCK_SPEED_KMH)
+
+def eta_hours(distance_km, speeds_kmh=None):
+    """ETA matrix in hours; `speeds_kmh` is one speed per target column."""
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    return distance_km / effective_speeds(speeds_kmh, distance_km.shape[-1])
+
+def route_matrix(origins, targets, speeds_kmh=None):
+    """
+    Distance, bearing and ETA from every origin to every target in one call.
+    `origins` is (M, 2) and `targets` (N, 2) of (lat, lng).
+    """
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    targets = np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+    distance = haversine_matrix(origins[:, 0], origins[:, 1], targets[:, 0], targets[:, 1])
+    return {
+        "distance_km": distance,
+        "bearing_deg": bearing_matrix(origins[:, 0], origins[:, 1], targets[:, 0], targets[:, 1]),
+        "eta_hours": eta_hours(distance, speeds_kmh),
+    }
+
+def format_eta(hours):
+    """Render an ETA the way the dashboard shows it ("3h 25m")."""
+    whole = int(hours)
+    minutes = int(round((hours - whole) * 60))
+    if minutes == 60:
+        whole, minutes = whole + 1, 0
+    return f"{whole}h {minutes}m"
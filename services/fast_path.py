@@ -0,0 +1,296 @@
+import os
+import re
+import json
+from collections import Counter
+from datetime import date, timedelta
+from services.prompt import compact_context
+
+# Set to 0 to send every negotiation to the LLM
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH_ENABLED", "1") != "0"
+
+DEFAULT_DELAY_PENALTY_PCT = 5.0
+DEFAULT_DELAY_TOLERANCE_HOURS = 24.0
+# Transit days assumed when neither side gives a delivery date
+DEFAULT_TRANSIT_DAYS = 5
+
+# cost_structure line items as priced by the carrier response form
+COST_LINE_ITEMS = (
+    ("base_rate", "Base rate"),
+    ("petrol_allowance", "Petrol allowance"),
+    ("food_allowance", "Food allowance"),
+    ("fuel_charge", "Fuel charge"),
+    ("accommodation", "Driver accommodation"),
+)
+
+# OpenWeather main conditions by route risk
+HIGH_RISK_WEATHER = ("thunderstorm", "tornado", "squall", "snow", "storm", "cyclone")
+MEDIUM_RISK_WEATHER = ("rain", "drizzle", "fog", "mist", "haze", "dust", "sand", "smoke", "ash")
+# Penalty multiplier and extra grace hours for each weather risk level
+WEATHER_PENALTY_ADJUSTMENT = {"low": (1.0, 0), "medium": (0.5, 12), "high": (0.0, 48)}
+
+
+def _amount(value):
+    """Numeric value of a price field ("$2,700", "10%", 2700); None if absent."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", str(value or ""))
+    return float(match.group().replace(",", "")) if match else None
+
+def _amount_or(value, default):
+    """Like `_amount`, but `default` only when the field is absent (an explicit 0 stays 0)."""
+    amount = _amount(value)
+    return default if amount is None else amount
+
+def _mapping(value):
+    """A JSONB field as a dict; it may arrive as JSON text, and anything else counts as empty."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+def _date(value):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+def money(amount):
+    sign = "-" if amount < 0 else ""
+    amount = abs(amount)
+    return f"{sign}${amount:,.0f}" if float(amount).is_integer() else f"{sign}${amount:,.2f}"
+
+def cost_breakdown(cost_structure):
+    """Itemised (label, amount) lines of a carrier cost_structure; zero lines are skipped."""
+    cost = _mapping(cost_structure)
+    lines = [(label, _amount(cost.get(field)) or 0.0) for field, label in COST_LINE_ITEMS]
+    tolls = (_amount(cost.get("toll_gates_count")) or 0) * (_amount(cost.get("toll_gates_cost")) or 0)
+    lines.append(("Toll gates", tolls))
+    return [(label, amount) for label, amount in lines if amount]
+
+def weather_risk(weather, carrier_risk=None):
+    """low / medium / high for the route, from both endpoints and the carrier's own rating."""
+    level = "low"
+    for point in _mapping(weather).values():
+        condition = str(_mapping(point).get("condition", "")).lower()
+        if any(word in condition for word in HIGH_RISK_WEATHER):
+            return "high"
+        if any(word in condition for word in MEDIUM_RISK_WEATHER):
+            level = "medium"
+    if level == "low" and str(_mapping(carrier_risk).get("weather", "")).lower() == "high":
+        level = "medium"
+    return level
+
+
+def extract_terms(context, today=None):
+    """The handful of fields the rule engine works from, normalised."""
+    today = today or date.today()
+    compact = compact_context(context)
+    shipper = compact.get("shipper_request", {})
+    response = compact.get("carrier_response", {})
+    profile = compact.get("carrier_profile", {})
+
+    delivery = _date(response.get("estimated_delivery_date")) or _date(response.get("delivery_deadline"))
+    if delivery is None and _amount(response.get("estimated_delivery_days")) is not None:
+        delivery = today + timedelta(days=int(_amount(response["estimated_delivery_days"])))
+    sla = _mapping(shipper.get("sla_rules"))
+    return {
+        "source": shipper.get("source") or "Origin",
+        "destination": shipper.get("destination") or "Destination",
+        "price": _amount(response.get("proposed_price")),
+        "min_budget": _amount(shipper.get("min_budget")),
+        "max_budget": _amount_or(shipper.get("max_budget"), _amount(shipper.get("baseBudget"))),
+        "deadline": _date(shipper.get("deadline")),
+        "delivery": delivery,
+        "response_type": response.get("response_type"),
+        "special_terms": shipper.get("special_terms"),
+        "special_conditions": shipper.get("special_conditions") or [],
+        "delay_penalty_pct": _amount_or(sla.get("delayPenalty"), DEFAULT_DELAY_PENALTY_PCT),
+        "delay_tolerance_hours": _amount_or(sla.get("maxDelayTolerance"), DEFAULT_DELAY_TOLERANCE_HOURS),
+        "cost_structure": response.get("cost_structure") or profile.get("cost_structure"),
+        "vehicle_type": response.get("vehicle_type"),
+        "capacity": response.get("available_capacity") or profile.get("available_capacity"),
+        "capacity_unit": profile.get("capacity_unit", "tons"),
+        "reliability": _amount(profile.get("reliability_score")),
+        "weather_risk": weather_risk(context.get("weather"), _mapping(response.get("risk_factors")) or profile.get("risk_factors")),
+    }
+
+def contested_reasons(terms):
+    """Why a negotiation needs the LLM; an empty list means the rules can settle it."""
+    reasons = []
+    if terms["response_type"] == "reject":
+        reasons.append("carrier_rejected")
+    if terms["price"] is None:
+        reasons.append("no_proposed_price")
+    elif terms["max_budget"] is None:
+        reasons.append("no_budget")
+    elif terms["price"] > terms["max_budget"]:
+        reasons.append("price_above_budget")
+    elif terms["min_budget"] is not None and terms["price"] < terms["min_budget"]:
+        reasons.append("price_below_budget")
+    if terms["deadline"] is None:
+        reasons.append("no_deadline")
+    elif terms["delivery"] is None:
+        reasons.append("no_delivery_date")
+    elif terms["delivery"] > terms["deadline"]:
+        reasons.append("late_delivery")
+    if terms["special_terms"]:
+        reasons.append("special_terms")
+    return reasons
+
+
+def build_agreement(request, context, terms, fallback=False):
+    """
+    Agreement built by rules from the negotiation inputs, in the /negotiate
+    response shape. With `fallback` (LLM unavailable for a contested case)
+    price and date are clamped to the shipper's limits.
+    """
+    today = date.today()
+    price = terms["price"]
+    if fallback:
+        if price is None:
+            price = terms["max_budget"] or terms["min_budget"] or 0.0
+        if terms["max_budget"] is not None:
+            price = min(price, terms["max_budget"])
+        if terms["min_budget"] is not None:
+            price = max(price, terms["min_budget"])
+    deadline = terms["delivery"] or terms["deadline"] or today + timedelta(days=DEFAULT_TRANSIT_DAYS)
+    if fallback and terms["deadline"] is not None:
+        deadline = min(deadline, terms["deadline"])
+
+    lines = cost_breakdown(terms["cost_structure"])
+    itemised = sum(amount for _, amount in lines)
+    if lines and abs(price - itemised) > 0.005:
+        lines.append(("Carrier margin / other" if price > itemised else "Discount", price - itemised))
+    breakdown = "; ".join(f"{label} {money(amount)}" for label, amount in lines) or "Single all-in rate"
+
+    risk = terms["weather_risk"]
+    multiplier, extra_grace = WEATHER_PENALTY_ADJUSTMENT[risk]
+    penalty_pct = round(terms["delay_penalty_pct"] * multiplier, 2)
+    grace_hours = terms["delay_tolerance_hours"] + extra_grace
+    if penalty_pct:
+        penalty_text = f"{penalty_pct}% of the freight charge after a {grace_hours:g}h grace period"
+    elif terms["delay_penalty_pct"]:
+        penalty_text = f"Waived: {risk} weather risk on the route"
+    else:
+        penalty_text = "None: the shipper SLA sets no delay penalty"
+    price_text = money(price)
+    deadline_text = deadline.strftime("%d %b %Y")
+    budget_text = (
+        f"{money(terms['min_budget'])} - {money(terms['max_budget'])}"
+        if terms["min_budget"] is not None and terms["max_budget"] is not None else "not specified"
+    )
+
+    clauses = [
+        {"id": "pricing", "title": "Base Price", "negotiated": price_text,
+         "reasoning": f"Carrier proposal against the shipper budget ({budget_text}). Breakdown: {breakdown}.",
+         "status": "agreed"},
+        {"id": "delivery", "title": "Delivery Deadline", "negotiated": deadline_text,
+         "reasoning": f"Carrier delivery date against shipper deadline {terms['deadline'] or 'not specified'}.",
+         "status": "agreed"},
+        {"id": "penalty", "title": "Delay Penalty", "negotiated": penalty_text,
+         "reasoning": f"Shipper SLA of {terms['delay_penalty_pct']:g}% adjusted for {risk} weather risk.",
+         "status": "agreed"},
+        {"id": "extra_charges", "title": "Extra Charges", "negotiated": "None",
+         "reasoning": "Only the itemised cost structure above is billable.", "status": "agreed"},
+    ]
+    for condition in terms["special_conditions"]:
+        clauses.append({"id": f"condition_{len(clauses)}", "title": str(condition), "negotiated": "Included",
+                        "reasoning": "Shipper special condition accepted by the carrier.", "status": "agreed"})
+    if fallback:
+        for clause in clauses[:2]:
+            clause["status"] = "adjusted"
+            clause["reasoning"] += " Clamped to the shipper's limits while AI mediation is unavailable."
+
+    mode = "FALLBACK MODE" if fallback else "FAST PATH"
+    carrier_name = request["carrier"].get("carrierName", "Registered Carrier")
+    clause_lines = "\n".join(f"- **{c['title']}:** {c['negotiated']}. {c['reasoning']}" for c in clauses)
+    agreement = f"""
+# MASTER TRANSPORTATION SERVICES AGREEMENT (MTSA)
+## ID: {request["unique_id"]} ({mode})
+
+**1. PARTIES:** {request["user_email"]} (Shipper) and {carrier_name}.
+**2. PERFORMANCE:** Fixed rate of {price_text} for route {terms["source"]} to {terms["destination"]}, delivery by {deadline_text}.
+**3. PRICE BREAKDOWN:** {breakdown}.
+**4. DELAY PENALTY:** {penalty_text}.
+**5. LIABILITY:** Carrier maintains full insurance coverage for cargo.
+
+## RULE-BASED ANALYSIS
+{clause_lines}
+""".strip()
+
+    confidence = 70 if fallback else 90
+    if terms["reliability"] is not None:
+        confidence = min(99, confidence + int(terms["reliability"]))
+    return {
+        "status": "success",
+        "agreement_id": request["unique_id"],
+        "agreement": agreement,
+        "justified_price": price_text,
+        "fixed_deadline": deadline_text,
+        "clauses": clauses,
+        "confidence_score": confidence,
+        "summary": (
+            "AI mediation unavailable; terms clamped to the shipper's limits." if fallback
+            else "Proposal within budget and deadline; settled by the rule engine."
+        ),
+        "transparency_report": {
+            "engine": "fallback" if fallback else "fast_path",
+            "weather_traffic": {"status": risk.upper(), "details": [f"Route weather risk: {risk}"],
+                                "impact": penalty_text},
+            "cost_transparency": {"breakdown": breakdown, "budget": budget_text,
+                                  "extra_charges_check": "No charges outside the cost structure"},
+            "risk_assessment": {"risk_level": risk, "mitigation": penalty_text},
+            "operational_check": {
+                "vehicle_match": terms["vehicle_type"] or "not specified",
+                "capacity": f"{terms['capacity']} {terms['capacity_unit']}" if terms["capacity"] else "not specified",
+            },
+            "news_freshness": context["news_freshness"],
+        },
+        "carrier_id": request["carrier_id"],
+        "shipment_id": request["shipment_id"],
+    }
+
+
+class FastPathStats:
+    def __init__(self):
+        self.settled = 0
+        self.escalated = 0
+        self.reasons = Counter()
+
+    def stats(self):
+        total = self.settled + self.escalated
+        return {
+            "enabled": FAST_PATH_ENABLED,
+            "settled": self.settled,
+            "escalated": self.escalated,
+            "settled_ratio": round(self.settled / total, 3) if total else None,
+            "escalation_reasons": dict(self.reasons),
+        }
+
+
+fast_path_stats = FastPathStats()
+
+
+def route_negotiation(request, context):
+    """
+    Settle the negotiation by rules when it is uncontested. Returns the
+    agreement, or None when the case has to go to the LLM.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    terms = extract_terms(context)
+    reasons = contested_reasons(terms)
+    if reasons:
+        fast_path_stats.escalated += 1
+        fast_path_stats.reasons.update(reasons)
+        return None
+    fast_path_stats.settled += 1
+    return build_agreement(request, context, terms)
+
+def fallback_agreement(request, context):
+    """Agreement used when the LLM is unavailable for a contested case."""
+    return build_agreement(request, context, extract_terms(context), fallback=True)
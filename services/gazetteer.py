@@ -0,0 +1,244 @@
+import os
+import re
+import csv
+import bisect
+import difflib
+import threading
+import unicodedata
+from collections import OrderedDict, Counter
+
+# Bundled place list (name, state, country, lat, lng, population, |-separated aliases)
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH", os.path.join(os.path.dirname(__file__), "data", "places.csv"))
+# Resolved free-text locations remembered (misses included)
+GAZETTEER_MEMO_SIZE = int(os.environ.get("GAZETTEER_MEMO_SIZE", "10000"))
+# Similarity (0..1) a misspelt name needs to resolve to a place; its first letter must match too
+GAZETTEER_FUZZY_CUTOFF = float(os.environ.get("GAZETTEER_FUZZY_CUTOFF", "0.8"))
+# Shortest fragment completed by prefix when it is not a full name
+GAZETTEER_MIN_PREFIX = 4
+# Longest run of words tried as a name inside a longer location ("Chennai Port Trust")
+GAZETTEER_MAX_NGRAM = 3
+
+_SEPARATORS = re.compile(r"[,;/|()]+|\s-\s")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase ASCII words: "  Tiruchirāppalli, T.N. " -> "tiruchirappalli t n"."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    return " ".join(_NON_WORD.split(text)).strip()
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Place:
+    """Canonical place: one row of the bundled gazetteer."""
+
+    __slots__ = ("id", "name", "state", "country", "lat", "lng", "population")
+
+    def __init__(self, name, state, country, lat, lng, population=0):
+        self.id = normalize(name).replace(" ", "-")
+        self.name = name
+        self.state = state
+        self.country = country
+        self.lat = lat
+        self.lng = lng
+        self.population = population
+
+    @property
+    def query(self):
+        """Unambiguous "City,CC" form for upstream APIs (OpenWeather `q`)."""
+        return f"{self.name},{self.country}"
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "country": self.country,
+            "lat": self.lat,
+            "lng": self.lng,
+        }
+
+
+class Gazetteer:
+    """
+    Offline place index: exact names and aliases in a dict, a sorted key
+    list for prefix lookup and a trigram index for misspellings. `match`
+    maps a free-text location ("Guindy, Chennai, TN", "Trichy",
+    "Chenai port") to one canonical Place and a confidence without any
+    network call, and memoizes the answer per normalized text. Confidence
+    is 1 when a name or alias appears verbatim and the name similarity when
+    the place was guessed from a prefix or a misspelling.
+    """
+
+    def __init__(self, memo_size=10000, fuzzy_cutoff=0.8):
+        self.memo_size = memo_size
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.places = {}
+        self._by_key = {}
+        self._keys = []
+        self._trigram_keys = {}
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.unresolved = 0
+        self.guessed = 0
+
+    def add(self, place, aliases=()):
+        if place.id in self.places:
+            print(f"Gazetteer: duplicate place {place.name}, keeping the first")
+            return
+        self.places[place.id] = place
+        for name in (place.name, *aliases):
+            key = normalize(name)
+            current = self._by_key.get(key)
+            # A name shared by two places belongs to the bigger one
+            if key and (current is None or current.population < place.population):
+                self._by_key[key] = place
+
+    def load(self, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                place = Place(row["name"], row["state"], row["country"], float(row["lat"]), float(row["lng"]),
+                              int(row.get("population") or 0))
+                self.add(place, [alias for alias in (row.get("aliases") or "").split("|") if alias])
+        self._reindex()
+        return self
+
+    def _reindex(self):
+        self._keys = sorted(self._by_key)
+        self._trigram_keys = {}
+        for key in self._keys:
+            for trigram in _trigrams(key):
+                self._trigram_keys.setdefault(trigram, []).append(key)
+        with self._lock:
+            self._memo.clear()
+
+    def get(self, place_id):
+        return self.places.get(place_id)
+
+    def lookup(self, name):
+        """Place whose name or alias is exactly `name` (after normalizing)."""
+        return self._by_key.get(normalize(name))
+
+    def complete(self, prefix, limit=10):
+        """Places with a name or alias starting with `prefix`, most populous first."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = {}
+        for i in range(bisect.bisect_left(self._keys, prefix), len(self._keys)):
+            key = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            place = self._by_key[key]
+            found[place.id] = place
+        return sorted(found.values(), key=lambda place: -place.population)[:limit]
+
+    def fuzzy(self, text, limit=5):
+        """
+        Closest names to a misspelt `text` as [(similarity, Place)], best first.
+        Names starting with another letter are skipped: misspellings rarely
+        hit the first letter, while unlisted towns often differ from a listed
+        one only there ("Sanand" is not "Anand").
+        """
+        key = normalize(text)
+        if not key:
+            return []
+        shared = Counter(candidate for trigram in _trigrams(key) for candidate in self._trigram_keys.get(trigram, ()))
+        scored = {}
+        # Only the candidates sharing the most trigrams get the (slower) edit-similarity check
+        for candidate, _ in shared.most_common(limit * 4):
+            if candidate[0] != key[0]:
+                continue
+            ratio = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if ratio >= self.fuzzy_cutoff:
+                place = self._by_key[candidate]
+                if ratio > scored.get(place.id, (0, None))[0]:
+                    scored[place.id] = (ratio, place)
+        return sorted(scored.values(), key=lambda match: (-match[0], -match[1].population))[:limit]
+
+    def _match(self, text):
+        parts = [normalize(part) for part in _SEPARATORS.split(text)]
+        parts = [part for part in parts if part]
+        # 1. A whole comma-separated part names a place: "Guindy, Chennai, Tamil Nadu"
+        for part in parts:
+            place = self._by_key.get(part)
+            if place is not None:
+                return place, 1.0
+        # 2. A run of words inside a part does, longest run first: "Chennai Port Trust"
+        for size in range(GAZETTEER_MAX_NGRAM, 0, -1):
+            for part in parts:
+                words = part.split()
+                for i in range(len(words) - size + 1):
+                    place = self._by_key.get(" ".join(words[i:i + size]))
+                    if place is not None:
+                        return place, 1.0
+        # 3. A part is the start of a name: "Coimb"
+        for part in parts:
+            if len(part) >= GAZETTEER_MIN_PREFIX:
+                matches = self.complete(part, 1)
+                if matches:
+                    place = matches[0]
+                    return place, round(difflib.SequenceMatcher(None, part, normalize(place.name)).ratio(), 4)
+        # 4. A part or word is a misspelt name: "Chenai", "Tiruchirapalli"
+        for part in parts:
+            for candidate in (part, *part.split()):
+                if len(candidate) >= GAZETTEER_MIN_PREFIX:
+                    matches = self.fuzzy(candidate, 1)
+                    if matches:
+                        ratio, place = matches[0]
+                        return place, round(ratio, 4)
+        return None, 0.0
+
+    def match(self, location):
+        """(Place, confidence) named by a free-text location, or (None, 0.0); memoized."""
+        key = normalize(location)
+        if not key:
+            return None, 0.0
+        with self._lock:
+            if key in self._memo:
+                self.hits += 1
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        place, confidence = found = self._match(location)
+        with self._lock:
+            self.misses += 1
+            if place is None:
+                self.unresolved += 1
+            elif confidence < 1:
+                self.guessed += 1
+            self._memo[key] = found
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return found
+
+    def resolve(self, location, exact=False):
+        """
+        Canonical Place named by a free-text location, or None. With `exact`,
+        only a name or alias appearing verbatim counts, never a guess.
+        """
+        place, confidence = self.match(location)
+        return None if exact and confidence < 1 else place
+
+    def coordinates(self, location, exact=False):
+        """(lat, lng) of a free-text location, or None."""
+        place = self.resolve(location, exact)
+        return (place.lat, place.lng) if place is not None else None
+
+    def stats(self):
+        return {
+            "places": len(self.places),
+            "names": len(self._keys),
+            "memoized": len(self._memo),
+            "hits": self.hits,
+            "misses": self.misses,
+            "unresolved": self.unresolved,
+            "guessed": self.guessed,
+        }
+
+
+gazetteer = Gazetteer(memo_size=GAZETTEER_MEMO_SIZE, fuzzy_cutoff=GAZETTEER_FUZZY_CUTOFF).load(GAZETTEER_PATH)
@@ -0,0 +1,350 @@
+import os
+import time
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from services.api import run_db, supabase, shipment_repo
+from services.spatial import GridIndex, haversine_km
+from services.carrier_search import match_city, SPATIAL_CELL_DEG
+
+# Pickup / delivery zones around the shipment's source and destination
+GEOFENCE_PICKUP_RADIUS_KM = float(os.environ.get("GEOFENCE_PICKUP_RADIUS_KM", "10"))
+GEOFENCE_DELIVERY_RADIUS_KM = float(os.environ.get("GEOFENCE_DELIVERY_RADIUS_KM", "10"))
+# A truck only counts as having left once it is this factor beyond the radius (no flapping at the edge)
+GEOFENCE_EXIT_FACTOR = float(os.environ.get("GEOFENCE_EXIT_FACTOR", "1.2"))
+# Status changes are written to shipment_requests in batches this often
+GEOFENCE_FLUSH_INTERVAL = float(os.environ.get("GEOFENCE_FLUSH_INTERVAL", "2"))
+# Seconds between reloads of the active shipments and their assigned carriers
+GEOFENCE_REFRESH_INTERVAL = float(os.environ.get("GEOFENCE_REFRESH_INTERVAL", "60"))
+GEOFENCE_EVENT_BUFFER = int(os.environ.get("GEOFENCE_EVENT_BUFFER", "2000"))
+# Shipment ids per `in` filter when loading assignments
+GEOFENCE_QUERY_CHUNK = 200
+# Active shipments per page when reloading (Supabase caps a select at 1000 rows)
+GEOFENCE_PAGE_SIZE = 1000
+# Shipments fenced between yields to the event loop during a reload
+GEOFENCE_SYNC_SLICE = 500
+
+ACTIVE_STATUSES = ("matched", "in_progress")
+STATUS_RANK = {"pending": 0, "matched": 1, "in_progress": 2, "completed": 3}
+
+
+class Fence:
+    """Circular pickup or delivery zone of one shipment, watched for its assigned carrier."""
+
+    __slots__ = ("id", "shipment_id", "carrier_id", "kind", "lat", "lng", "radius_km", "exit_km", "cells")
+
+    def __init__(self, shipment_id, carrier_id, kind, lat, lng, radius_km, exit_km):
+        self.id = f"{shipment_id}:{kind}"
+        self.shipment_id = shipment_id
+        self.carrier_id = carrier_id
+        self.kind = kind
+        self.lat = lat
+        self.lng = lng
+        self.radius_km = radius_km
+        self.exit_km = exit_km
+        self.cells = ()
+
+
+class GeofenceEngine:
+    """
+    Pickup and delivery fences of every active shipment, hashed by
+    (assigned carrier, grid cell) over each fence's reach. A ping looks up
+    its own cell once and distance-checks only the fences found there plus
+    the ones the carrier is already inside, so the cost per ping does not
+    grow with the number of fences. Leaving the pickup zone moves a
+    shipment matched -> in_progress; entering the delivery zone completes
+    it, but only once it is in_progress (a truck passing through the
+    destination on its way to pickup has not delivered anything).
+    Transitions are written in batches.
+    """
+
+    def __init__(self, writer, cell_deg=0.1, exit_factor=1.2, flush_interval=2, refresh_interval=60,
+                 buffer_size=2000):
+        self.writer = writer
+        self.grid = GridIndex(cell_deg)
+        self.exit_factor = exit_factor
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.fences = {}
+        self.by_shipment = {}
+        self._by_cell = {}
+        self._inside = {}
+        self.statuses = {}
+        self._pending = {}
+        self.events = deque(maxlen=buffer_size)
+        self._task = None
+        self.last_id = 0
+        self.checks = 0
+        self.distance_checks = 0
+        self.transitions = 0
+        self.failed_batches = 0
+        self.unlocated = 0
+        self.loaded_at = None
+
+    def add_fence(self, fence):
+        self.remove_fence(fence.id)
+        fence.cells = tuple(self.grid.covering_cells(fence.lat, fence.lng, fence.exit_km))
+        self.fences[fence.id] = fence
+        self.by_shipment.setdefault(fence.shipment_id, set()).add(fence.id)
+        for cell in fence.cells:
+            self._by_cell.setdefault((fence.carrier_id, cell), set()).add(fence.id)
+
+    def remove_fence(self, fence_id):
+        fence = self.fences.pop(fence_id, None)
+        if fence is None:
+            return
+        for cell in fence.cells:
+            members = self._by_cell.get((fence.carrier_id, cell))
+            if members is not None:
+                members.discard(fence_id)
+                if not members:
+                    del self._by_cell[(fence.carrier_id, cell)]
+        inside = self._inside.get(fence.carrier_id)
+        if inside is not None:
+            inside.discard(fence_id)
+            if not inside:
+                del self._inside[fence.carrier_id]
+        fences = self.by_shipment.get(fence.shipment_id)
+        if fences is not None:
+            fences.discard(fence_id)
+            if not fences:
+                del self.by_shipment[fence.shipment_id]
+
+    def remove_shipment(self, shipment_id):
+        for fence_id in list(self.by_shipment.get(shipment_id, ())):
+            self.remove_fence(fence_id)
+        self.statuses.pop(shipment_id, None)
+
+    def track(self, shipment, carrier_id, pickup_radius_km, delivery_radius_km):
+        """Fence a shipment for its carrier; False when neither end can be located."""
+        zones = (
+            ("pickup", match_city(shipment.get("source_location")), pickup_radius_km),
+            ("delivery", match_city(shipment.get("destination_location")), delivery_radius_km),
+        )
+        located = False
+        for kind, center, radius_km in zones:
+            if center is None:
+                continue
+            located = True
+            fence = Fence(shipment["id"], carrier_id, kind, center[0], center[1], radius_km, radius_km * self.exit_factor)
+            existing = self.fences.get(fence.id)
+            if existing is not None and (existing.carrier_id, existing.lat, existing.lng, existing.radius_km) == \
+                    (fence.carrier_id, fence.lat, fence.lng, fence.radius_km):
+                continue
+            self.add_fence(fence)
+        return located
+
+    async def sync(self, shipments, assignments, pickup_radius_km, delivery_radius_km):
+        """Replace the fenced set with the active shipments and their assigned carriers."""
+        active = set()
+        self.unlocated = 0
+        for count, shipment in enumerate(shipments, 1):
+            if count % GEOFENCE_SYNC_SLICE == 0:
+                # A first load of tens of thousands of fences must not stall the ingest path
+                await asyncio.sleep(0)
+            carrier_id = assignments.get(shipment["id"])
+            if carrier_id is None:
+                continue
+            if not self.track(shipment, carrier_id, pickup_radius_km, delivery_radius_km):
+                self.unlocated += 1
+                continue
+            active.add(shipment["id"])
+            # A transition still waiting to be written is newer than what the DB returned
+            current = self._pending.get(shipment["id"]) or self.statuses.get(shipment["id"])
+            status = shipment.get("status")
+            if current is None or STATUS_RANK.get(status, 0) > STATUS_RANK.get(current, 0):
+                current = status
+            self.statuses[shipment["id"]] = current
+        for shipment_id in list(self.by_shipment):
+            if shipment_id not in active:
+                self.remove_shipment(shipment_id)
+        self.loaded_at = time.time()
+
+    def carrier_for(self, shipment_id):
+        """Carrier a fenced shipment is assigned to, or None."""
+        for fence_id in self.by_shipment.get(shipment_id, ()):
+            return self.fences[fence_id].carrier_id
+        return None
+
+    def active_routes(self):
+        """{shipment_id: (carrier_id, pickup (lat, lng), delivery (lat, lng))} of the fully fenced shipments."""
+        routes = {}
+        for shipment_id in self.by_shipment:
+            pickup = self.fences.get(f"{shipment_id}:pickup")
+            delivery = self.fences.get(f"{shipment_id}:delivery")
+            if pickup is not None and delivery is not None:
+                routes[shipment_id] = (pickup.carrier_id, (pickup.lat, pickup.lng), (delivery.lat, delivery.lng))
+        return routes
+
+    def emit(self, kind, fence, t, lat, lng, distance_km):
+        self.last_id += 1
+        self.events.append({
+            "id": self.last_id,
+            "type": kind,
+            "zone": fence.kind,
+            "shipment_id": fence.shipment_id,
+            "carrier_id": fence.carrier_id,
+            "at": datetime.fromtimestamp(t, timezone.utc).isoformat(),
+            "lat": lat,
+            "lng": lng,
+            "distance_km": round(distance_km, 3),
+        })
+
+    def check(self, carrier_id, lat, lng, t=None):
+        """Test one fix against the carrier's nearby fences; emits enter/exit events."""
+        self.checks += 1
+        nearby = self._by_cell.get((carrier_id, self.grid.cell(lat, lng)))
+        inside = self._inside.get(carrier_id)
+        if not nearby and not inside:
+            return
+        t = t or time.time()
+        candidates = (nearby | inside) if nearby and inside else (nearby or inside)
+        delivered = []
+        for fence_id in list(candidates):
+            fence = self.fences[fence_id]
+            self.distance_checks += 1
+            distance_km = haversine_km(lat, lng, fence.lat, fence.lng)
+            was_inside = inside is not None and fence_id in inside
+            if not was_inside and distance_km <= fence.radius_km:
+                inside = self._inside.setdefault(carrier_id, set())
+                inside.add(fence_id)
+                self.emit("enter", fence, t, lat, lng, distance_km)
+                if fence.kind == "delivery":
+                    delivered.append(fence.shipment_id)
+            elif was_inside and distance_km > fence.exit_km:
+                inside.discard(fence_id)
+                self.emit("exit", fence, t, lat, lng, distance_km)
+                if fence.kind == "pickup":
+                    self.advance(fence.shipment_id, "in_progress")
+                    # Same-city shipments: the truck may still be inside the delivery zone
+                    if f"{fence.shipment_id}:delivery" in inside:
+                        delivered.append(fence.shipment_id)
+        # The load has to be picked up (pickup zone left) before it can be delivered
+        for shipment_id in delivered:
+            if self.statuses.get(shipment_id) == "in_progress":
+                self.advance(shipment_id, "completed")
+        if inside is not None and not inside:
+            self._inside.pop(carrier_id, None)
+
+    def advance(self, shipment_id, status):
+        """Queue a forward-only status change for the next batch write."""
+        current = self.statuses.get(shipment_id)
+        if current not in ACTIVE_STATUSES or STATUS_RANK[status] <= STATUS_RANK[current]:
+            return
+        self.statuses[shipment_id] = status
+        self._pending[shipment_id] = status
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        by_status = {}
+        for shipment_id, status in batch.items():
+            by_status.setdefault(status, []).append(shipment_id)
+        for status, shipment_ids in by_status.items():
+            try:
+                await self.writer(status, shipment_ids)
+                self.transitions += len(shipment_ids)
+            except Exception as e:
+                self.failed_batches += 1
+                print(f"Geofence status update to {status} failed ({len(shipment_ids)} shipments): {e}")
+                for shipment_id in shipment_ids:
+                    self._pending.setdefault(shipment_id, status)
+                continue
+            if status == "completed":
+                for shipment_id in shipment_ids:
+                    self.remove_shipment(shipment_id)
+
+    async def refresh(self):
+        if not supabase:
+            return
+        shipments = []
+        start = 0
+        while True:
+            page = await run_db(
+                supabase.table("shipment_requests").select("id,source_location,destination_location,status")
+                .in_("status", list(ACTIVE_STATUSES)).order("id")
+                .range(start, start + GEOFENCE_PAGE_SIZE - 1).execute
+            )
+            shipments.extend(page.data or [])
+            if len(page.data or []) < GEOFENCE_PAGE_SIZE:
+                break
+            start += GEOFENCE_PAGE_SIZE
+        ids = [shipment["id"] for shipment in shipments]
+        assignments = {}
+        for i in range(0, len(ids), GEOFENCE_QUERY_CHUNK):
+            accepted = await run_db(
+                supabase.table("carrier_responses").select("shipment_id,carrier_id")
+                .eq("status", "accepted").in_("shipment_id", ids[i:i + GEOFENCE_QUERY_CHUNK]).execute
+            )
+            assignments.update((row["shipment_id"], row["carrier_id"]) for row in accepted.data or [])
+        await self.sync(shipments, assignments, GEOFENCE_PICKUP_RADIUS_KM, GEOFENCE_DELIVERY_RADIUS_KM)
+
+    async def run(self):
+        next_refresh = 0
+        while True:
+            if time.monotonic() >= next_refresh:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    print(f"Geofence refresh failed: {e}")
+                next_refresh = time.monotonic() + self.refresh_interval
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def recent(self, since=0, shipment_id=None, limit=100):
+        events = [
+            event for event in self.events
+            if event["id"] > since and (shipment_id is None or event["shipment_id"] == shipment_id)
+        ]
+        return events[:limit]
+
+    def stats(self):
+        return {
+            "fences": len(self.fences),
+            "shipments": len(self.by_shipment),
+            "carriers_inside": len(self._inside),
+            "checks": self.checks,
+            "distance_checks": self.distance_checks,
+            "events": self.last_id,
+            "pending_transitions": len(self._pending),
+            "transitions": self.transitions,
+            "failed_batches": self.failed_batches,
+            "unlocated_shipments": self.unlocated,
+            "loaded_at": self.loaded_at,
+        }
+
+
+async def update_shipment_statuses(status, shipment_ids):
+    """One UPDATE for every shipment moving to `status`."""
+    await run_db(
+        supabase.table("shipment_requests")
+        .update({"status": status, "updated_at": datetime.now(timezone.utc).isoformat()})
+        .in_("id", shipment_ids).execute
+    )
+    for shipment_id in shipment_ids:
+        shipment_repo.invalidate(shipment_id)
+
+
+geofence_engine = GeofenceEngine(
+    update_shipment_statuses,
+    cell_deg=SPATIAL_CELL_DEG,
+    exit_factor=GEOFENCE_EXIT_FACTOR,
+    flush_interval=GEOFENCE_FLUSH_INTERVAL,
+    refresh_interval=GEOFENCE_REFRESH_INTERVAL,
+    buffer_size=GEOFENCE_EVENT_BUFFER
+)
@@ -0,0 +1,406 @@
+import os
+import time
+import base64
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import numpy as np
+
+# Telemetry history: every accepted fix, kept per carrier in compact chunks.
+# Set HISTORY_DIR to persist sealed chunks as memory-mapped .npy files.
+HISTORY_DIR = os.environ.get("HISTORY_DIR", "")
+# Fixes per chunk before it is sealed and delta-encoded
+HISTORY_CHUNK_POINTS = int(os.environ.get("HISTORY_CHUNK_POINTS", "512"))
+# A chunk never spans more than this, so the time deltas fit in uint32 ms
+HISTORY_CHUNK_SPAN_SECONDS = float(os.environ.get("HISTORY_CHUNK_SPAN_SECONDS", "21600"))
+# Full-resolution data is kept this long, then downsampled
+HISTORY_RAW_SECONDS = float(os.environ.get("HISTORY_RAW_SECONDS", "86400"))
+HISTORY_DOWNSAMPLE_SECONDS = int(os.environ.get("HISTORY_DOWNSAMPLE_SECONDS", "60"))
+# Anything older is dropped
+HISTORY_RETENTION_SECONDS = float(os.environ.get("HISTORY_RETENTION_SECONDS", str(30 * 86400)))
+HISTORY_COMPACT_INTERVAL = float(os.environ.get("HISTORY_COMPACT_INTERVAL", "300"))
+# Persisted chunks kept memory-mapped at once (each open map holds a file descriptor)
+HISTORY_OPEN_CHUNKS = int(os.environ.get("HISTORY_OPEN_CHUNKS", "256"))
+
+# One record per fix. The first record of a chunk holds absolute lat/lng, the
+# rest hold deltas; lat/lng are in microdegrees (~0.1 m), speed in 0.1 km/h,
+# heading in 0.1 degrees. 16 bytes per fix against 40 for raw float64 columns.
+HISTORY_RECORD = np.dtype([
+    ("dt", "<u4"),
+    ("dlat", "<i4"),
+    ("dlng", "<i4"),
+    ("speed", "<u2"),
+    ("heading", "<u2"),
+])
+RAW_POINT_BYTES = 5 * 8
+COORD_SCALE = 1e6
+SPEED_SCALE = 10
+HEADING_SCALE = 10
+
+
+def encode_chunk(t_ms, lat, lng, speed, heading):
+    """Delta-encode one chunk of fixes (t in epoch ms) into HISTORY_RECORD rows."""
+    t_ms = np.asarray(t_ms, dtype=np.int64)
+    records = np.empty(len(t_ms), dtype=HISTORY_RECORD)
+    records["dt"] = np.diff(t_ms, prepend=t_ms[:1])
+    records["dlat"] = np.diff(np.round(np.asarray(lat) * COORD_SCALE).astype(np.int64), prepend=0)
+    records["dlng"] = np.diff(np.round(np.asarray(lng) * COORD_SCALE).astype(np.int64), prepend=0)
+    records["speed"] = np.clip(np.round(np.asarray(speed) * SPEED_SCALE), 0, np.iinfo(np.uint16).max)
+    records["heading"] = np.round(np.mod(heading, 360) * HEADING_SCALE)
+    return records
+
+def decode_chunk(t0, records):
+    """(t ms, lat, lng, speed, heading) arrays of an encoded chunk."""
+    return (
+        t0 + np.cumsum(records["dt"], dtype=np.int64),
+        np.cumsum(records["dlat"], dtype=np.int64) / COORD_SCALE,
+        np.cumsum(records["dlng"], dtype=np.int64) / COORD_SCALE,
+        records["speed"] / SPEED_SCALE,
+        records["heading"] / HEADING_SCALE,
+    )
+
+def downsample(t_ms, lat, lng, speed, heading, resolution):
+    """
+    One fix per `resolution`-second bucket: the bucket's last position and
+    heading, with the bucket's top speed so speeding incidents survive.
+    """
+    if len(t_ms) == 0 or not resolution:
+        return t_ms, lat, lng, speed, heading
+    bucket = t_ms // int(resolution * 1000)
+    firsts = np.flatnonzero(np.diff(bucket, prepend=bucket[0] - 1))
+    lasts = np.append(firsts[1:] - 1, len(bucket) - 1)
+    return t_ms[lasts], lat[lasts], lng[lasts], np.maximum.reduceat(speed, firsts), heading[lasts]
+
+
+class Chunk:
+    """
+    Sealed, immutable run of encoded fixes. In-memory chunks hold `records`;
+    persisted ones only their `path`, mapped on demand by TelemetryHistory.
+    """
+
+    __slots__ = ("t0", "t_end", "resolution", "records", "path", "points")
+
+    def __init__(self, t0, t_end, resolution, records=None, path=None, points=None):
+        self.t0 = t0
+        self.t_end = t_end
+        self.resolution = resolution
+        self.records = records
+        self.path = path
+        self.points = len(records) if points is None else points
+
+
+class CarrierTrack:
+    """Sealed chunks of one carrier in time order, plus the open tail still being appended to."""
+
+    def __init__(self):
+        self.chunks = []
+        self.starts = []
+        self.ends = []
+        self._reset_tail()
+
+    def _reset_tail(self):
+        self.t = array("q")
+        self.lat = array("d")
+        self.lng = array("d")
+        self.speed = array("d")
+        self.heading = array("d")
+
+    @property
+    def last_t(self):
+        if self.t:
+            return self.t[-1]
+        return self.ends[-1] if self.ends else None
+
+    def append(self, t_ms, lat, lng, speed, heading):
+        self.t.append(t_ms)
+        self.lat.append(lat)
+        self.lng.append(lng)
+        self.speed.append(speed)
+        self.heading.append(heading)
+
+    def tail(self):
+        return (np.frombuffer(self.t, dtype=np.int64), np.frombuffer(self.lat), np.frombuffer(self.lng),
+                np.frombuffer(self.speed), np.frombuffer(self.heading))
+
+    def seal(self):
+        """Encode and clear the open tail; returns the chunk (None if the tail was empty)."""
+        if not self.t:
+            return None
+        chunk = Chunk(self.t[0], self.t[-1], 0, encode_chunk(*self.tail()))
+        self._reset_tail()
+        return chunk
+
+    def add(self, chunk):
+        index = bisect_left(self.starts, chunk.t0)
+        self.chunks.insert(index, chunk)
+        self.starts.insert(index, chunk.t0)
+        self.ends.insert(index, chunk.t_end)
+
+    def replace(self, index, chunk):
+        if chunk is None:
+            del self.chunks[index], self.starts[index], self.ends[index]
+            return
+        self.chunks[index] = chunk
+        self.starts[index] = chunk.t0
+        self.ends[index] = chunk.t_end
+
+    def overlapping(self, start_ms, end_ms):
+        """Sealed chunks with fixes inside [start_ms, end_ms]."""
+        return self.chunks[bisect_left(self.ends, start_ms):bisect_right(self.starts, end_ms)]
+
+    def points(self):
+        return sum(chunk.points for chunk in self.chunks) + len(self.t)
+
+
+class TelemetryHistory:
+    """
+    Append-only per-carrier telemetry history. Fixes land in an in-memory
+    tail; every `chunk_points` fixes (or `chunk_span` seconds) the tail is
+    sealed into a delta-encoded chunk and, when `directory` is configured,
+    written there; persisted chunks are memory-mapped when a query needs
+    them, with at most `open_chunks` maps (file descriptors) kept open. A
+    chunk that cannot be written stays in memory: history never fails ingest.
+    A background pass downsamples chunks older than `raw_seconds` and drops
+    those past `retention`.
+    """
+
+    def __init__(self, directory="", chunk_points=512, chunk_span=21600, raw_seconds=86400,
+                 downsample_seconds=60, retention=30 * 86400, compact_interval=300, open_chunks=256):
+        self.directory = directory
+        self.open_chunks = open_chunks
+        self._maps = OrderedDict()
+        self.chunk_points = chunk_points
+        self.chunk_span_ms = int(chunk_span * 1000)
+        self.raw_seconds = raw_seconds
+        self.downsample_seconds = downsample_seconds
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.tracks = {}
+        self._task = None
+        self.appended = 0
+        self.out_of_order = 0
+        self.sealed = 0
+        self.downsampled = 0
+        self.expired = 0
+        self.persist_errors = 0
+        self.last_compact_ms = None
+
+    def _carrier_dir(self, carrier_id):
+        return os.path.join(self.directory, base64.urlsafe_b64encode(carrier_id.encode()).decode().rstrip("="))
+
+    def _persist(self, carrier_id, chunk):
+        """Write a sealed chunk to disk; the returned chunk only keeps its path. Kept in memory on failure."""
+        if not self.directory:
+            return chunk
+        try:
+            folder = self._carrier_dir(carrier_id)
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{chunk.t0}-{chunk.t_end}-{chunk.resolution}.npy")
+            np.save(path, chunk.records)
+        except OSError as e:
+            self.persist_errors += 1
+            print(f"Could not persist history chunk for {carrier_id}, keeping it in memory: {e}")
+            return chunk
+        return Chunk(chunk.t0, chunk.t_end, chunk.resolution, path=path, points=chunk.points)
+
+    def records(self, chunk):
+        """Encoded rows of a chunk, memory-mapping persisted ones through a small LRU of open maps."""
+        if chunk.records is not None:
+            return chunk.records
+        records = self._maps.get(chunk.path)
+        if records is not None:
+            self._maps.move_to_end(chunk.path)
+            return records
+        records = self._maps[chunk.path] = np.load(chunk.path, mmap_mode="r")
+        while len(self._maps) > self.open_chunks:
+            # The map (and its descriptor) closes once no query holds it any more
+            self._maps.popitem(last=False)
+        return records
+
+    def decode(self, chunk):
+        return decode_chunk(chunk.t0, self.records(chunk))
+
+    def _discard(self, chunk):
+        if chunk.path:
+            self._maps.pop(chunk.path, None)
+            try:
+                os.remove(chunk.path)
+            except OSError as e:
+                print(f"Could not remove history chunk {chunk.path}: {e}")
+
+    def load(self):
+        """
+        Re-open the chunks persisted under `directory` (after a restart). Entries
+        that are not carrier folders or chunk files are logged and skipped.
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for folder in os.listdir(self.directory):
+            if not os.path.isdir(os.path.join(self.directory, folder)):
+                continue
+            try:
+                carrier_id = base64.urlsafe_b64decode(folder + "=" * (-len(folder) % 4)).decode()
+                if os.path.basename(self._carrier_dir(carrier_id)) != folder:
+                    raise ValueError("does not round-trip")
+            except ValueError as e:
+                print(f"History: skipping {folder!r}, not a carrier folder: {e}")
+                continue
+            track = self.tracks.setdefault(carrier_id, CarrierTrack())
+            for name in os.listdir(os.path.join(self.directory, folder)):
+                if not name.endswith(".npy"):
+                    continue
+                try:
+                    t0, t_end, resolution = (int(part) for part in name[:-4].split("-"))
+                except ValueError:
+                    print(f"History: skipping {folder}/{name}, not a chunk file")
+                    continue
+                path = os.path.join(self.directory, folder, name)
+                with open(path, "rb") as f:
+                    version = np.lib.format.read_magic(f)
+                    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) \
+                        else np.lib.format.read_array_header_2_0
+                    shape, _, _ = read_header(f)
+                track.add(Chunk(t0, t_end, resolution, path=path, points=shape[0]))
+
+    def append(self, carrier_id, timestamp, lat, lng, speed=0, heading=0):
+        """Record one fix (`timestamp` in epoch seconds). Out-of-order fixes are dropped."""
+        t_ms = int(timestamp * 1000)
+        track = self.tracks.get(carrier_id)
+        if track is None:
+            track = self.tracks[carrier_id] = CarrierTrack()
+        last_t = track.last_t
+        if last_t is not None and t_ms < last_t:
+            self.out_of_order += 1
+            return False
+        if track.t and t_ms - track.t[0] > self.chunk_span_ms:
+            self._seal(carrier_id, track)
+        track.append(t_ms, lat, lng, speed or 0, heading or 0)
+        self.appended += 1
+        if len(track.t) >= self.chunk_points:
+            self._seal(carrier_id, track)
+        return True
+
+    def _seal(self, carrier_id, track):
+        chunk = track.seal()
+        if chunk is not None:
+            self.sealed += 1
+            track.add(self._persist(carrier_id, chunk))
+
+    def query(self, carrier_id, start, end, resolution=None):
+        """
+        Fixes of `carrier_id` between `start` and `end` (epoch seconds) as
+        columns, thinned to one per `resolution` seconds when given.
+        """
+        track = self.tracks.get(carrier_id)
+        start_ms, end_ms = int(start * 1000), int(end * 1000)
+        parts = [self.decode(chunk) for chunk in track.overlapping(start_ms, end_ms)] if track else []
+        if track and track.t and track.t[-1] >= start_ms and track.t[0] <= end_ms:
+            parts.append(track.tail())
+        if parts:
+            columns = [np.concatenate(column) for column in zip(*parts)]
+            inside = (columns[0] >= start_ms) & (columns[0] <= end_ms)
+            columns = downsample(*(column[inside] for column in columns), resolution)
+        else:
+            columns = [np.empty(0)] * 5
+        t_ms, lat, lng, speed, heading = columns
+        return {
+            "carrier_id": carrier_id,
+            "points": len(t_ms),
+            "t": (t_ms / 1000).tolist(),
+            "lat": np.round(lat, 6).tolist(),
+            "lng": np.round(lng, 6).tolist(),
+            "speed": np.round(speed, 1).tolist(),
+            "heading": np.round(heading, 1).tolist(),
+        }
+
+    def compact_track(self, carrier_id, track, now):
+        """Seal a stale tail, downsample old raw chunks, drop expired ones."""
+        now_ms = int(now * 1000)
+        raw_cutoff = now_ms - int(self.raw_seconds * 1000)
+        expire_cutoff = now_ms - int(self.retention * 1000)
+        if track.t and track.t[0] < raw_cutoff:
+            self._seal(carrier_id, track)
+        for index in range(len(track.chunks) - 1, -1, -1):
+            chunk = track.chunks[index]
+            if chunk.t_end < expire_cutoff:
+                self._discard(chunk)
+                track.replace(index, None)
+                self.expired += 1
+            elif chunk.t_end < raw_cutoff and chunk.resolution < self.downsample_seconds:
+                t_ms, lat, lng, speed, heading = downsample(*self.decode(chunk), self.downsample_seconds)
+                thinned = Chunk(int(t_ms[0]), int(t_ms[-1]), self.downsample_seconds,
+                                encode_chunk(t_ms, lat, lng, speed, heading))
+                track.replace(index, self._persist(carrier_id, thinned))
+                self._discard(chunk)
+                self.downsampled += 1
+
+    async def compact(self):
+        started = time.perf_counter()
+        now = time.time()
+        for carrier_id, track in list(self.tracks.items()):
+            self.compact_track(carrier_id, track, now)
+            if not track.chunks and not track.t:
+                del self.tracks[carrier_id]
+            # Keep the ingest path responsive between carriers
+            await asyncio.sleep(0)
+        self.last_compact_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            try:
+                await self.compact()
+            except Exception as e:
+                print(f"Telemetry history compaction failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self.load()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Persist the open tails so a restart keeps them
+        if self.directory:
+            for carrier_id, track in self.tracks.items():
+                self._seal(carrier_id, track)
+
+    def stats(self):
+        points = sum(track.points() for track in self.tracks.values())
+        encoded = sum(chunk.points for track in self.tracks.values() for chunk in track.chunks) * HISTORY_RECORD.itemsize
+        tail = sum(len(track.t) for track in self.tracks.values())
+        return {
+            "carriers": len(self.tracks),
+            "points": points,
+            "chunks": sum(len(track.chunks) for track in self.tracks.values()),
+            "bytes": encoded + tail * RAW_POINT_BYTES,
+            "raw_bytes": points * RAW_POINT_BYTES,
+            "appended": self.appended,
+            "out_of_order": self.out_of_order,
+            "sealed": self.sealed,
+            "downsampled": self.downsampled,
+            "expired": self.expired,
+            "last_compact_ms": self.last_compact_ms,
+            "persistent": bool(self.directory),
+            "open_maps": len(self._maps),
+            "persist_errors": self.persist_errors,
+        }
+
+
+telemetry_history = TelemetryHistory(
+    HISTORY_DIR,
+    chunk_points=HISTORY_CHUNK_POINTS,
+    chunk_span=HISTORY_CHUNK_SPAN_SECONDS,
+    raw_seconds=HISTORY_RAW_SECONDS,
+    downsample_seconds=HISTORY_DOWNSAMPLE_SECONDS,
+    retention=HISTORY_RETENTION_SECONDS,
+    compact_interval=HISTORY_COMPACT_INTERVAL,
+    open_chunks=HISTORY_OPEN_CHUNKS
+)
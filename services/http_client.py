@@ -0,0 +1,168 @@
+import os
+import time
+import asyncio
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Outbound HTTP settings shared by the sync and async negotiation pipelines
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", "0.5"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Upstream services (base URL overridable with <NAME>_BASE_URL, e.g. for the
+# benchmark stand-ins) and their connection pool sizes (HTTP_POOL_SIZE_<NAME>)
+SERVICES = {
+    "groq": os.environ.get("GROQ_BASE_URL", "https://api.groq.com"),
+    "openweather": os.environ.get("OPENWEATHER_BASE_URL", "http://api.openweathermap.org"),
+    "newsapi": os.environ.get("NEWSAPI_BASE_URL", "https://newsapi.org"),
+}
+POOL_SIZES = {name: int(os.environ.get(f"HTTP_POOL_SIZE_{name.upper()}", "10")) for name in SERVICES}
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that keeps failing. After `failure_threshold`
+    consecutive failures the circuit opens and calls are refused for
+    `reset_timeout` seconds, then a single trial call is let through.
+    Every allowed call must end in `record_success`, `record_failure` or
+    `release`, or the trial slot stays taken.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """
+        Free the half-open trial slot when a call ends without a verdict
+        (cancelled, client gone). Callers run it in a `finally` after every
+        allowed call; once the outcome was recorded it changes nothing.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    print(f"Circuit '{self.name}' opened after {self.failures} failures")
+                self.opened_at = time.time()
+
+    def stats(self):
+        return {"name": self.name, "state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+def _retry_policy():
+    return Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=0,
+        status=HTTP_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the process-wide keep-alive `requests` session with per-host pools."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            for name, base_url in SERVICES.items():
+                session.mount(base_url, HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZES[name], max_retries=_retry_policy()))
+            _session = session
+    return _session
+
+_async_clients: dict[str, httpx.AsyncClient] = {}
+
+def get_async_client(service=None):
+    """
+    Return the shared async HTTP client for `service` (one keep-alive pool
+    per upstream host), creating it on first use.
+    """
+    key = service or "default"
+    client = _async_clients.get(key)
+    if client is None or client.is_closed:
+        size = POOL_SIZES.get(service, HTTP_MAX_CONNECTIONS)
+        client = _async_clients[key] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=size,
+                max_keepalive_connections=min(size, HTTP_MAX_KEEPALIVE),
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+    return client
+
+async def request_with_retry(service, method, url, **kwargs):
+    """
+    Send a request on the pooled async client for `service`, retrying
+    429/5xx responses and connection errors with exponential backoff.
+    """
+    client = get_async_client(service)
+    for attempt in range(HTTP_RETRIES + 1):
+        last_attempt = attempt == HTTP_RETRIES
+        try:
+            res = await client.request(method, url, **kwargs)
+        except httpx.ConnectError:
+            if last_attempt:
+                raise
+        else:
+            if res.status_code not in RETRY_STATUSES or last_attempt:
+                return res
+            retry_after = res.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                await asyncio.sleep(float(retry_after))
+                continue
+        await asyncio.sleep(HTTP_RETRY_BACKOFF * (2 ** attempt))
+
+async def close_async_client():
+    """Close the shared async clients (called on server shutdown)."""
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
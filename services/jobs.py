@@ -0,0 +1,415 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from services.api import run_db, supabase, negotiate_contract_api_async, price_value
+
+# Negotiation job queue: a local SQLite file shared by every worker process on the host
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(".cache", "jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# Delay before retry n is JOB_RETRY_BACKOFF * 2 ** (n - 1) seconds
+JOB_RETRY_BACKOFF = float(os.environ.get("JOB_RETRY_BACKOFF", "2"))
+# A running job whose lease was not renewed for this many seconds is assumed lost (e.g. process
+# restart); workers renew the lease of the job they run every JOB_LEASE_SECONDS / 3
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "120"))
+# Threads running the (blocking) SQLite calls off the event loop
+JOB_DB_THREADS = int(os.environ.get("JOB_DB_THREADS", "4"))
+# How often idle workers look for jobs enqueued by other processes
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+# Finished jobs are kept this long for clients to collect
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "86400"))
+
+FINISHED_STATUSES = ("succeeded", "failed")
+RECOMMENDATIONS = ("accept", "counter", "reject")
+# Clause statuses that leave the carrier's offer unchanged
+AGREED_CLAUSE_STATUSES = ("agreed", "accepted")
+DEADLINE_FORMATS = ("%d %b %Y", "%d %B %Y", "%Y-%m-%d", "%b %d, %Y", "%B %d, %Y")
+
+
+class JobQueue:
+    """
+    Durable FIFO of negotiation jobs. Jobs move queued -> running -> succeeded
+    or failed; a failed attempt goes back to queued with exponential backoff
+    until `max_attempts` is reached. Claiming is atomic across processes, and
+    a running job whose lease expired is claimable again. Updates by a worker
+    carry the attempt number it claimed, so a worker that lost its lease
+    cannot overwrite the attempt that replaced it.
+
+    The methods are blocking SQLite calls; async code runs them through
+    `call`, on the queue's own threads. The file is opened on first use.
+    """
+
+    def __init__(self, path, max_attempts=3, retry_backoff=2, lease_seconds=120, db_threads=4):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self.db_threads = db_threads
+        self._local = threading.local()
+        self._waiters = {}
+        self._executor = None
+        self._opened = False
+        self._open_lock = threading.Lock()
+
+    def open(self):
+        """Create the queue file and table if needed; idempotent."""
+        with self._open_lock:
+            if self._opened:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = self._thread_connection()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, available_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, available_at)")
+            self._opened = True
+
+    def _thread_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        if not self._opened:
+            self.open()
+        return self._thread_connection()
+
+    async def call(self, fn, *args):
+        """Run a blocking queue method (`claim`, `get`, ...) off the event loop."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.db_threads, thread_name_prefix="jobs-db")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def enqueue(self, payload):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, payload, status, created_at, updated_at, available_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(payload), now, now, now)
+        )
+        return job_id
+
+    def claim(self):
+        """Take the oldest runnable job (or an expired lease); None when there is none."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                "OR (status = 'running' AND updated_at <= ?) ORDER BY created_at LIMIT 1",
+                (now, now - self.lease_seconds)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "payload": json.loads(row["payload"]),
+            "attempts": row["attempts"] + 1,
+            # Set when an earlier attempt negotiated but could not record the agreement
+            "result": json.loads(row["result"]) if row["result"] else None,
+        }
+
+    def renew(self, job_id, attempts):
+        """Extend the lease of a running job; False when this attempt no longer holds it."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+            (time.time(), job_id, attempts)
+        )
+        return cursor.rowcount > 0
+
+    def save_result(self, job_id, attempts, result):
+        """Keep a negotiated result on the job so a retry does not negotiate again."""
+        self._connect().execute(
+            "UPDATE jobs SET result = ?, updated_at = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+            (json.dumps(result), time.time(), job_id, attempts)
+        )
+
+    def complete(self, job_id, attempts, result):
+        self._finish(job_id, attempts, "succeeded", result=json.dumps(result))
+
+    def fail(self, job_id, attempts, error):
+        """Requeue with backoff, or mark failed once attempts are used up; True when the job is finished."""
+        if attempts < self.max_attempts:
+            delay = self.retry_backoff * 2 ** (attempts - 1)
+            now = time.time()
+            self._connect().execute(
+                "UPDATE jobs SET status = 'queued', error = ?, updated_at = ?, available_at = ? "
+                "WHERE id = ? AND status = 'running' AND attempts = ?",
+                (error, now, now + delay, job_id, attempts)
+            )
+            return False
+        self._finish(job_id, attempts, "failed", error=error)
+        return True
+
+    def _finish(self, job_id, attempts, status, result=None, error=None):
+        # A failed job keeps a result saved by an earlier attempt
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'running' AND attempts = ?",
+            (status, result, error, time.time(), job_id, attempts)
+        )
+
+    def wake(self, job_id):
+        """Release long-polls on a job this process just finished; call on the event loop."""
+        waiter = self._waiters.pop(job_id, None)
+        if waiter is not None:
+            waiter.set()
+
+    def get(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": datetime.fromtimestamp(row["created_at"]).isoformat(),
+            "updated_at": datetime.fromtimestamp(row["updated_at"]).isoformat(),
+        }
+
+    async def wait(self, job_id, timeout):
+        """
+        Long-poll: return the job once it has finished or `timeout` seconds
+        have passed. Jobs finished by this process wake the waiter at once;
+        jobs run by another process are noticed on the next poll.
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                job = await self.call(self.get, job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in FINISHED_STATUSES or remaining <= 0:
+                    return job
+                waiter = self._waiters.setdefault(job_id, asyncio.Event())
+                try:
+                    await asyncio.wait_for(waiter.wait(), min(remaining, JOB_POLL_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters.pop(job_id, None)
+
+    def purge(self, older_than):
+        self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?", (time.time() - older_than,)
+        )
+
+    def stats(self):
+        if not self._opened:
+            return {}
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def _parse_deadline(text):
+    for fmt in DEADLINE_FORMATS:
+        try:
+            return datetime.strptime(str(text).strip(), fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def recommendation(result):
+    """
+    accept / counter / reject for ai_negotiations. An explicit recommendation
+    wins; otherwise only an agreement whose clauses were all agreed as offered
+    is an accept, and anything adjusted (or unknown) is a counter.
+    """
+    explicit = str(result.get("recommendation") or "").lower()
+    if explicit in RECOMMENDATIONS:
+        return explicit
+    clauses = [clause for clause in result.get("clauses") or [] if isinstance(clause, dict)]
+    if result.get("status") != "success" or not clauses:
+        return "counter"
+    agreed = all(str(clause.get("status", "")).lower() in AGREED_CLAUSE_STATUSES for clause in clauses)
+    return "accept" if agreed else "counter"
+
+def save_negotiation_record(data, result):
+    """Store a finished agreement in ai_negotiations for shipper approval; returns the row id."""
+    if not supabase or not data.get("shipment_id") or not data.get("carrier_id"):
+        return None
+    row = {
+        "shipment_id": data["shipment_id"],
+        "carrier_id": data["carrier_id"],
+        "shipper_requirements": data.get("shipperTerms", {}),
+        "carrier_offer": data.get("carrierConstraints", {}),
+        "ai_recommendation": recommendation(result),
+        "final_price": price_value(result.get("justified_price")),
+        "final_deadline": _parse_deadline(result.get("fixed_deadline")),
+        "penalty_terms": {"clauses": result.get("clauses") or []},
+        "reasoning": result.get("summary"),
+        "status": "pending_approval",
+    }
+    inserted = supabase.table("ai_negotiations").insert(row).execute()
+    return inserted.data[0]["id"] if inserted.data else None
+
+
+class NegotiationWorkers:
+    """
+    Pool of async workers draining the job queue. Each job runs the full
+    negotiation and records the agreement; throughput scales with `concurrency`
+    (and with more server processes sharing the same queue file). Only the
+    negotiation itself is retried: once the agreement is saved on the job,
+    the ai_negotiations insert is best-effort.
+    """
+
+    def __init__(self, queue, concurrency=4, poll_interval=1):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wakeup = None
+        self._tasks = []
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.record_errors = 0
+        self.queue_errors = 0
+
+    def notify(self):
+        """Wake idle workers after a local enqueue instead of waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def heartbeat(self, job):
+        """Renew the job's lease while it runs, so a slow negotiation is not claimed twice."""
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            if not await self.queue.call(self.queue.renew, job["id"], job["attempts"]):
+                print(f"Negotiation job {job['id']} attempt {job['attempts']} lost its lease")
+                return
+
+    async def process(self, job):
+        heartbeat = asyncio.create_task(self.heartbeat(job))
+        try:
+            await self._process(job)
+        except sqlite3.Error as e:
+            # The job stays claimed until its lease expires, then runs again
+            self.queue_errors += 1
+            print(f"Negotiation job {job['id']} attempt {job['attempts']}: queue update failed: {e}")
+        finally:
+            heartbeat.cancel()
+
+    async def _process(self, job):
+        data = job["payload"]
+        queue = self.queue
+        try:
+            result = job["result"]
+            if result is None:
+                result = await negotiate_contract_api_async(data)
+                # Saved first: from here on the job succeeds even if recording it fails
+                await queue.call(queue.save_result, job["id"], job["attempts"], result)
+        except asyncio.CancelledError:
+            # Shutdown mid-job: the lease expires and another worker picks it up
+            raise
+        except Exception as e:
+            print(f"Negotiation job {job['id']} attempt {job['attempts']} failed: {e}")
+            if await queue.call(queue.fail, job["id"], job["attempts"], str(e)):
+                self.failed += 1
+                queue.wake(job["id"])
+            else:
+                self.retried += 1
+            return
+        try:
+            result["negotiation_record_id"] = await run_db(save_negotiation_record, data, result)
+        except Exception as e:
+            self.record_errors += 1
+            result["negotiation_record_id"] = None
+            print(f"Negotiation job {job['id']}: agreement not recorded in ai_negotiations: {e}")
+        await queue.call(queue.complete, job["id"], job["attempts"], result)
+        queue.wake(job["id"])
+        self.completed += 1
+
+    async def run(self):
+        while True:
+            try:
+                job = await self.queue.call(self.queue.claim)
+            except sqlite3.Error as e:
+                print(f"Negotiation queue claim failed: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            await self.process(job)
+
+    async def _start(self):
+        await self.queue.call(self.queue.open)
+        await self.queue.call(self.queue.purge, JOB_RETENTION_SECONDS)
+        await asyncio.gather(*(self.run() for _ in range(self.concurrency)))
+
+    def start(self):
+        if not self._tasks:
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._start())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.queue.close()
+
+    async def stats(self):
+        try:
+            jobs = await self.queue.call(self.queue.stats)
+        except sqlite3.Error as e:
+            jobs = {"error": str(e)}
+        return {
+            "workers": self.concurrency if self._tasks else 0,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "record_errors": self.record_errors,
+            "queue_errors": self.queue_errors,
+            "jobs": jobs,
+        }
+
+
+negotiation_queue = JobQueue(
+    JOB_DB_PATH,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    retry_backoff=JOB_RETRY_BACKOFF,
+    lease_seconds=JOB_LEASE_SECONDS,
+    db_threads=JOB_DB_THREADS
+)
+negotiation_workers = NegotiationWorkers(negotiation_queue, concurrency=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL)
+
+
+async def submit_negotiation(data):
+    """Queue a negotiation and return its job id right away."""
+    job_id = await negotiation_queue.call(negotiation_queue.enqueue, data)
+    negotiation_workers.notify()
+    return job_id
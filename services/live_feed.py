@@ -0,0 +1,88 @@
+import os
+import asyncio
+
+# Minimum seconds between two pushes on one connection; updates in between coalesce
+LIVE_FEED_MIN_INTERVAL = float(os.environ.get("LIVE_FEED_MIN_INTERVAL", "0.25"))
+# Upper bound on carriers a single connection may watch
+LIVE_FEED_MAX_CARRIERS = int(os.environ.get("LIVE_FEED_MAX_CARRIERS", "200"))
+
+
+class Subscription:
+    """
+    One watcher connection. Pushed positions are coalesced per carrier until
+    the connection is ready to send, and sends are spaced `min_interval` apart.
+    """
+
+    __slots__ = ("carriers", "pending", "ready", "min_interval")
+
+    def __init__(self, min_interval=LIVE_FEED_MIN_INTERVAL):
+        self.carriers = set()
+        self.pending = {}
+        self.ready = asyncio.Event()
+        self.min_interval = min_interval
+
+    def push(self, record):
+        self.pending[record.carrier_id] = record
+        self.ready.set()
+
+    async def updates(self):
+        """Yield lists of location rows, at most once per `min_interval`."""
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            batch, self.pending = self.pending, {}
+            # Records are updated in place, so this is the latest position even if it moved again
+            yield [record.as_row() for record in batch.values()]
+            await asyncio.sleep(self.min_interval)
+
+
+class LiveFeed:
+    """Fans positions out from the ingest path to the subscriptions watching each carrier."""
+
+    def __init__(self):
+        self._watchers = {}
+        self.subscriptions = 0
+        self.published = 0
+
+    def subscribe(self, subscription, carrier_ids):
+        """Watch more carriers; returns the ones actually added (capped per connection)."""
+        added = []
+        for carrier_id in carrier_ids:
+            if carrier_id in subscription.carriers or len(subscription.carriers) >= LIVE_FEED_MAX_CARRIERS:
+                continue
+            subscription.carriers.add(carrier_id)
+            self._watchers.setdefault(carrier_id, set()).add(subscription)
+            added.append(carrier_id)
+        return added
+
+    def unsubscribe(self, subscription, carrier_ids):
+        for carrier_id in carrier_ids:
+            subscription.carriers.discard(carrier_id)
+            subscription.pending.pop(carrier_id, None)
+            watchers = self._watchers.get(carrier_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._watchers[carrier_id]
+
+    def open(self):
+        self.subscriptions += 1
+        return Subscription()
+
+    def close(self, subscription):
+        self.unsubscribe(subscription, list(subscription.carriers))
+        self.subscriptions -= 1
+
+    def publish(self, record):
+        """Called for every ingested fix; O(watchers of that carrier)."""
+        watchers = self._watchers.get(record.carrier_id)
+        if watchers:
+            self.published += 1
+            for subscription in watchers:
+                subscription.push(record)
+
+    def stats(self):
+        return {"subscriptions": self.subscriptions, "watched_carriers": len(self._watchers), "published": self.published}
+
+
+live_feed = LiveFeed()
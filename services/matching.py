@@ -0,0 +1,287 @@
+import os
+import asyncio
+from datetime import datetime, date, time as dt_time
+import numpy as np
+from services.api import run_db, supabase, negotiate_contract_api_async, shipment_repo
+from services.carrier_search import carrier_directory, match_city
+from services import distance
+
+# Relative weight of each pair-score component (they are all scaled to 0..1)
+MATCH_WEIGHTS = {
+    "distance": 0.3,
+    "budget": 0.25,
+    "reliability": 0.2,
+    "deadline": 0.15,
+    "capacity": 0.1,
+}
+# Pickup distance (km) at which the distance score has decayed to ~37%
+MATCH_DISTANCE_SCALE_KM = float(os.environ.get("MATCH_DISTANCE_SCALE_KM", "100"))
+# Pairs whose carrier is further than this from the pickup are never matched
+MATCH_MAX_PICKUP_KM = float(os.environ.get("MATCH_MAX_PICKUP_KM", "500"))
+# How far over max_budget an estimated price may go before the pair is ruled out
+MATCH_BUDGET_TOLERANCE = float(os.environ.get("MATCH_BUDGET_TOLERANCE", "0.25"))
+# Hours of slack before the deadline that earn a full deadline score
+MATCH_DEADLINE_SLACK_HOURS = float(os.environ.get("MATCH_DEADLINE_SLACK_HOURS", "24"))
+# Upper bound on Groq negotiations a single match run may start
+MATCH_MAX_NEGOTIATIONS = int(os.environ.get("MATCH_MAX_NEGOTIATIONS", "10"))
+
+KM_PER_MILE = 1.609344
+# Cost paid for an infeasible pair; large but finite so the solver stays numeric
+INFEASIBLE_COST = 1e6
+
+# capacity_unit assumed for shipments and carriers that do not set one
+DEFAULT_CAPACITY_UNIT = "tons"
+
+# Flat charges in cost_structure, as priced by the carrier response form
+FLAT_COST_FIELDS = ("base_rate", "petrol_allowance", "food_allowance", "fuel_charge", "accommodation")
+
+# shipperTerms key sent by the shipper dashboard -> shipment_requests column it is stored in
+SHIPPER_TERMS_COLUMNS = {
+    "source": "source_location",
+    "destination": "destination_location",
+    "minBudget": "min_budget",
+    "maxBudget": "max_budget",
+    "deadline": "deadline",
+    "timeWindow": "time_window",
+    "priorityLevel": "priority_level",
+    "slaRules": "sla_rules",
+    "specialConditions": "special_conditions",
+    "specialTerms": "special_terms",
+}
+
+
+def solve_assignment(cost):
+    """
+    Minimum-cost assignment (Hungarian algorithm, shortest augmenting path with
+    potentials) for a rectangular cost matrix. Returns (row, col) pairs, one per
+    row or column, whichever is fewer. O(n^2 m), with the column scans in NumPy.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return []
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # owner[j]: 1-based row holding column j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            used_cols = np.nonzero(used)[0]
+            u[owner[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    pairs = [(int(owner[j]) - 1, j - 1) for j in range(1, m + 1) if owner[j]]
+    if transposed:
+        pairs = [(col, row) for row, col in pairs]
+    return sorted(pairs)
+
+
+def _number(value, default=0.0):
+    """Numeric cost_structure value; accepts strings like "10%"."""
+    if value is None:
+        return default
+    try:
+        return float(str(value).strip().rstrip("%"))
+    except ValueError:
+        return default
+
+def carrier_price_terms(cost_structure):
+    """(flat charges, per-mile rate, fuel surcharge fraction) from a cost_structure."""
+    cost = cost_structure or {}
+    flat = sum(_number(cost.get(field)) for field in FLAT_COST_FIELDS)
+    flat += _number(cost.get("toll_gates_count")) * _number(cost.get("toll_gates_cost"))
+    return flat, _number(cost.get("per_mile")), _number(cost.get("fuel_surcharge")) / 100
+
+def _coordinates(location):
+    """(lat, lng) of a shipment location, or (nan, nan) when it names no known place."""
+    return match_city(location) or (np.nan, np.nan)
+
+def _unit(row):
+    """Normalized capacity_unit of a shipment or carrier row."""
+    return str(row.get("capacity_unit") or DEFAULT_CAPACITY_UNIT).strip().lower()
+
+def _deadline_hours(deadline, now):
+    """Hours from `now` until the end of the deadline day (None if unknown)."""
+    if not deadline:
+        return None
+    try:
+        day = deadline if isinstance(deadline, date) else date.fromisoformat(str(deadline)[:10])
+    except ValueError:
+        return None
+    return (datetime.combine(day, dt_time.max) - now).total_seconds() / 3600
+
+
+def score_pairs(shipments, carriers, now=None):
+    """
+    Score every (shipment, carrier) pair at once. Returns a dict of (M, N)
+    matrices: the weighted "score", each component, the feasibility mask and
+    the distance / ETA / price figures the score was built from. Shipments
+    whose source or destination is not a known place are never feasible.
+    """
+    now = now or datetime.now()
+    origins = np.array([_coordinates(s.get("source_location")) for s in shipments], dtype=np.float64).reshape(-1, 2)
+    dests = np.array([_coordinates(s.get("destination_location")) for s in shipments], dtype=np.float64).reshape(-1, 2)
+    resolved = ~(np.isnan(origins).any(axis=1) | np.isnan(dests).any(axis=1))
+    bases = np.array([(float(c["latitude"]), float(c["longitude"])) for c in carriers], dtype=np.float64).reshape(-1, 2)
+
+    pickup_km = distance.haversine_matrix(origins[:, 0], origins[:, 1], bases[:, 0], bases[:, 1])
+    trip_km = distance.haversine_pairs(origins[:, 0], origins[:, 1], dests[:, 0], dests[:, 1])[:, None]
+    eta = distance.eta_hours(pickup_km + trip_km)
+
+    terms = np.array([carrier_price_terms(c.get("cost_structure")) for c in carriers], dtype=np.float64).reshape(-1, 3)
+    flat, per_mile, surcharge = terms[:, 0], terms[:, 1], terms[:, 2]
+    price = (flat[None, :] + per_mile[None, :] * trip_km / KM_PER_MILE) * (1 + surcharge[None, :])
+
+    max_budget = np.array([_number(s.get("max_budget"), np.inf) for s in shipments], dtype=np.float64)[:, None]
+    capacity = np.array([_number(c.get("available_capacity")) for c in carriers], dtype=np.float64)
+    load = np.array([_number(s.get("required_capacity")) for s in shipments], dtype=np.float64)[:, None]
+    # A load can only be compared with a capacity in the same unit
+    same_unit = np.array([[_unit(s) == _unit(c) for c in carriers] for s in shipments], dtype=bool).reshape(load.shape[0], -1)
+    reliability = np.array([_number(c.get("reliability_score"), 5.0) for c in carriers], dtype=np.float64)
+    available = np.array([
+        np.inf if (hours := _deadline_hours(s.get("deadline"), now)) is None else hours for s in shipments
+    ], dtype=np.float64)[:, None]
+
+    limit = np.where(np.isfinite(max_budget) & (max_budget > 0), max_budget, np.nan)
+    over_budget = np.nan_to_num((price - limit) / limit, nan=0.0)
+    slack = available - eta
+    components = {
+        "distance": np.exp(-pickup_km / MATCH_DISTANCE_SCALE_KM),
+        "budget": np.where(price <= max_budget, 1.0, np.clip(1 - over_budget / MATCH_BUDGET_TOLERANCE, 0, 1)),
+        "reliability": np.broadcast_to(np.clip(reliability / 5, 0, 1), pickup_km.shape),
+        "deadline": np.clip(slack / MATCH_DEADLINE_SLACK_HOURS, 0, 1),
+        "capacity": np.broadcast_to(capacity / max(capacity.max(initial=0), 1), pickup_km.shape),
+    }
+    feasible = (
+        resolved[:, None]
+        & (pickup_km <= MATCH_MAX_PICKUP_KM)
+        & (slack >= 0)
+        & (over_budget <= MATCH_BUDGET_TOLERANCE)
+        & (capacity > 0)[None, :]
+        & (capacity[None, :] >= load)
+        & ((load <= 0) | same_unit)
+    )
+    score = sum(MATCH_WEIGHTS[name] * values for name, values in components.items())
+    return {
+        "score": score,
+        "components": components,
+        "feasible": feasible,
+        "resolved": resolved,
+        "pickup_km": pickup_km,
+        "trip_km": np.broadcast_to(trip_km, pickup_km.shape),
+        "eta_hours": eta,
+        "price": price,
+    }
+
+
+def match_shipments(shipments, carriers, now=None):
+    """
+    Assign at most one carrier per shipment (and one shipment per carrier) so
+    the total pair score is maximal. Returns (pairs ranked best first,
+    ids of shipments left without a feasible carrier).
+    """
+    carriers = [c for c in carriers if c.get("latitude") is not None and c.get("longitude") is not None]
+    if not shipments or not carriers:
+        return [], [s.get("id") for s in shipments]
+
+    scored = score_pairs(shipments, carriers, now)
+    cost = np.where(scored["feasible"], -scored["score"], INFEASIBLE_COST)
+    pairs = []
+    for i, j in solve_assignment(cost):
+        if not scored["feasible"][i, j]:
+            continue
+        shipment, carrier = shipments[i], carriers[j]
+        pairs.append({
+            "shipment_id": shipment.get("id"),
+            "carrier_id": carrier.get("carrier_id"),
+            "score": round(float(scored["score"][i, j]), 4),
+            "components": {name: round(float(values[i, j]), 4) for name, values in scored["components"].items()},
+            "pickup_km": round(float(scored["pickup_km"][i, j]), 1),
+            "trip_km": round(float(scored["trip_km"][i, j]), 1),
+            "eta": distance.format_eta(float(scored["eta_hours"][i, j])),
+            "estimated_price": round(float(scored["price"][i, j]), 2),
+            "source_location": shipment.get("source_location"),
+            "destination_location": shipment.get("destination_location"),
+        })
+    pairs.sort(key=lambda pair: pair["score"], reverse=True)
+    matched = {pair["shipment_id"] for pair in pairs}
+    return pairs, [s.get("id") for s in shipments if s.get("id") not in matched]
+
+
+async def load_pending_shipments(shipment_ids=None):
+    if not supabase:
+        return []
+    query = supabase.table("shipment_requests").select("*").eq("status", "pending")
+    if shipment_ids:
+        query = query.in_("id", list(shipment_ids))
+    result = await run_db(query.execute)
+    shipment_repo.prime(result.data or [])
+    return result.data or []
+
+def shipper_terms(shipment):
+    """A shipment_requests row in the shape of the dashboard's shipperTerms."""
+    return {key: shipment[column] for key, column in SHIPPER_TERMS_COLUMNS.items() if shipment.get(column) is not None}
+
+def _negotiation_request(shipment, pair):
+    """Body for negotiate_contract_api_async, as the shipper dashboard would send it."""
+    return {
+        "shipment_id": pair["shipment_id"],
+        "carrier_id": pair["carrier_id"],
+        "shipperTerms": shipper_terms(shipment),
+        "carrierConstraints": {"proposed_price": pair["estimated_price"]},
+    }
+
+async def run_matching(shipment_ids=None, negotiate_top=0):
+    """
+    Match pending shipments against the indexed carrier profiles, then send
+    only the `negotiate_top` best pairs on to the Groq negotiator, concurrently.
+    """
+    shipments = await load_pending_shipments(shipment_ids)
+    pairs, unmatched = match_shipments(shipments, list(carrier_directory.profiles.values()))
+
+    top = pairs[:max(0, min(negotiate_top, MATCH_MAX_NEGOTIATIONS))]
+    if top:
+        by_id = {s.get("id"): s for s in shipments}
+        results = await asyncio.gather(
+            *(negotiate_contract_api_async(_negotiation_request(by_id[pair["shipment_id"]], pair)) for pair in top),
+            return_exceptions=True
+        )
+        for pair, result in zip(top, results):
+            if isinstance(result, Exception):
+                print(f"Negotiation for {pair['shipment_id']} / {pair['carrier_id']} failed: {result}")
+                result = {"status": "error", "message": str(result)}
+            pair["negotiation"] = result
+
+    return {
+        "shipments": len(shipments),
+        "carriers": len(carrier_directory.profiles),
+        "pairs": pairs,
+        "unmatched_shipments": unmatched,
+        "negotiated": len(top),
+    }
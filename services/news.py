@@ -0,0 +1,110 @@
+import time
+import asyncio
+from datetime import datetime, timezone
+from services.http_client import SERVICES, get_session, request_with_retry
+
+NEWS_URL = f"{SERVICES['newsapi']}/v2/everything"
+
+DEFAULT_NEWS = ["Market conditions stable"]
+
+
+def _news_params(api_key):
+    return {"q": "logistics OR transportation OR shipping", "sortBy": "publishedAt", "apiKey": api_key, "pageSize": 5}
+
+def request_headlines(api_key):
+    """Fetch the latest logistics headlines, or None on failure."""
+    try:
+        res = get_session().get(NEWS_URL, params=_news_params(api_key), timeout=10)
+        if res.status_code == 200:
+            return [article['title'] for article in res.json().get('articles', [])]
+    except Exception as e:
+        print(f"News API Error: {e}")
+    return None
+
+async def request_headlines_async(api_key):
+    """Async variant of `request_headlines`."""
+    try:
+        res = await request_with_retry("newsapi", "GET", NEWS_URL, params=_news_params(api_key), timeout=10)
+        if res.status_code == 200:
+            return [article['title'] for article in res.json().get('articles', [])]
+    except Exception as e:
+        print(f"News API Error: {e}")
+    return None
+
+
+class NewsFeed:
+    """
+    Keeps the last good set of logistics headlines in memory.
+    The server refreshes it on a schedule in the background, so negotiations
+    read headlines with no network round trip.
+    """
+
+    def __init__(self, api_key, interval=900, retry_interval=60):
+        self.api_key = api_key
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.headlines = None
+        self.fetched_at = None
+        self.last_error_at = None
+        self._task = None
+
+    def _store(self, headlines):
+        if headlines is None:
+            self.last_error_at = time.time()
+            return False
+        self.headlines = headlines
+        self.fetched_at = time.time()
+        return True
+
+    async def refresh(self):
+        if not self.api_key:
+            return False
+        return self._store(await request_headlines_async(self.api_key))
+
+    def refresh_sync(self):
+        if not self.api_key:
+            return False
+        return self._store(request_headlines(self.api_key))
+
+    async def run(self):
+        """Refresh forever; retry sooner after a failed fetch."""
+        while True:
+            ok = await self.refresh()
+            await asyncio.sleep(self.interval if ok else self.retry_interval)
+
+    def start(self):
+        if self.api_key and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def current(self, refresh_inline=True):
+        """
+        Headlines for a negotiation. Without the background task (e.g. the
+        Streamlit app) a missing or expired snapshot is refreshed inline.
+        """
+        if not self.api_key:
+            return ["No news data available"]
+        if refresh_inline and self._task is None and (self.fetched_at is None or self.age() > self.interval):
+            self.refresh_sync()
+        return list(self.headlines) if self.headlines is not None else list(DEFAULT_NEWS)
+
+    def age(self):
+        return time.time() - self.fetched_at if self.fetched_at is not None else None
+
+    def freshness(self):
+        """How stale the served headlines are, for the transparency report."""
+        age = self.age()
+        return {
+            "source": "newsapi" if self.api_key else "unavailable",
+            "fetched_at": datetime.fromtimestamp(self.fetched_at, timezone.utc).isoformat() if self.fetched_at else None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": age is None or age > 2 * self.interval
+        }
@@ -0,0 +1,280 @@
+import os
+import math
+import time
+import asyncio
+from datetime import datetime, timezone, timedelta
+from services.spatial import KM_PER_DEGREE
+from services.distance import AVERAGE_TRUCK_SPEED_KMH, MIN_MOVING_SPEED_KMH, format_eta
+from services.geofence import geofence_engine
+
+# Segments ahead of (and behind) the last match that a ping is snapped against
+ROUTE_SNAP_LOOKAHEAD = int(os.environ.get("ROUTE_SNAP_LOOKAHEAD", "8"))
+ROUTE_SNAP_LOOKBEHIND = int(os.environ.get("ROUTE_SNAP_LOOKBEHIND", "1"))
+# A truck this far from the matched segment is off the local window; after
+# ROUTE_RESCAN_AFTER such pings in a row the whole route is searched once
+ROUTE_OFF_ROUTE_KM = float(os.environ.get("ROUTE_OFF_ROUTE_KM", "2"))
+ROUTE_RESCAN_AFTER = int(os.environ.get("ROUTE_RESCAN_AFTER", "3"))
+# Time constant of the smoothed speed, in seconds
+ROUTE_SPEED_TAU_SECONDS = float(os.environ.get("ROUTE_SPEED_TAU_SECONDS", "120"))
+# Progress rates above this are GPS noise, not driving
+ROUTE_MAX_SPEED_KMH = 150.0
+ROUTE_MAX_POINTS = int(os.environ.get("ROUTE_MAX_POINTS", "20000"))
+# Routes with no ping for this long are dropped
+ROUTE_IDLE_SECONDS = float(os.environ.get("ROUTE_IDLE_SECONDS", "86400"))
+ROUTE_REFRESH_INTERVAL = float(os.environ.get("ROUTE_REFRESH_INTERVAL", "30"))
+
+
+class Route:
+    """
+    Polyline of one shipment, pre-projected per segment onto a local flat
+    plane (km) so a snap is a handful of multiplications.
+    """
+
+    __slots__ = ("points", "ax", "ay", "dx", "dy", "length2", "cos_lat", "seg_km", "cum_km", "length_km", "source")
+
+    def __init__(self, points, source="explicit"):
+        self.points = [(float(lat), float(lng)) for lat, lng in points]
+        self.source = source
+        self.ax, self.ay, self.dx, self.dy, self.length2, self.cos_lat, self.seg_km, self.cum_km = ([] for _ in range(8))
+        total = 0.0
+        for (lat1, lng1), (lat2, lng2) in zip(self.points, self.points[1:]):
+            cos_lat = math.cos(math.radians((lat1 + lat2) / 2))
+            ax, ay = lng1 * cos_lat * KM_PER_DEGREE, lat1 * KM_PER_DEGREE
+            dx, dy = (lng2 - lng1) * cos_lat * KM_PER_DEGREE, (lat2 - lat1) * KM_PER_DEGREE
+            seg_km = math.hypot(dx, dy)
+            self.ax.append(ax)
+            self.ay.append(ay)
+            self.dx.append(dx)
+            self.dy.append(dy)
+            self.length2.append(seg_km * seg_km)
+            self.cos_lat.append(cos_lat)
+            self.seg_km.append(seg_km)
+            self.cum_km.append(total)
+            total += seg_km
+        self.length_km = total
+
+    def __len__(self):
+        return len(self.seg_km)
+
+    def snap_segment(self, index, lat, lng):
+        """(offset km, km along the route) of the point's projection onto segment `index`."""
+        px = lng * self.cos_lat[index] * KM_PER_DEGREE - self.ax[index]
+        py = lat * KM_PER_DEGREE - self.ay[index]
+        dx, dy, length2 = self.dx[index], self.dy[index], self.length2[index]
+        t = min(1.0, max(0.0, (px * dx + py * dy) / length2)) if length2 else 0.0
+        return math.hypot(px - t * dx, py - t * dy), self.cum_km[index] + t * self.seg_km[index]
+
+    def snap(self, lat, lng, first, last):
+        """Best (offset km, km along, segment) over segments first..last."""
+        best = None
+        for index in range(max(first, 0), min(last, len(self) - 1) + 1):
+            offset, along = self.snap_segment(index, lat, lng)
+            if best is None or offset < best[0]:
+                best = (offset, along, index)
+        return best
+
+
+class Progress:
+    """Where one shipment's truck is along its route."""
+
+    __slots__ = ("shipment_id", "carrier_id", "route", "segment", "along_km", "offset_km", "speed_kmh",
+                 "created_at", "updated_at", "misses", "rescans", "active")
+
+    def __init__(self, shipment_id, carrier_id, route):
+        self.shipment_id = shipment_id
+        self.carrier_id = carrier_id
+        self.route = route
+        self.segment = 0
+        self.along_km = None
+        self.offset_km = None
+        self.speed_kmh = None
+        self.created_at = time.time()
+        self.updated_at = None
+        self.misses = 0
+        self.rescans = 0
+        # Seen among the geofenced active shipments
+        self.active = False
+
+    def as_dict(self, now=None):
+        route = self.route
+        along = self.along_km or 0.0
+        remaining = max(route.length_km - along, 0.0)
+        # Same rule as carrier search ETAs: a stopped or unknown truck is assumed to drive at the average
+        speed = self.speed_kmh if self.speed_kmh is not None and self.speed_kmh >= MIN_MOVING_SPEED_KMH \
+            else AVERAGE_TRUCK_SPEED_KMH
+        eta_hours = remaining / speed
+        reference = datetime.fromtimestamp(self.updated_at or now or time.time(), timezone.utc)
+        return {
+            "shipment_id": self.shipment_id,
+            "carrier_id": self.carrier_id,
+            "route_source": route.source,
+            "route_km": round(route.length_km, 2),
+            "travelled_km": round(along, 2),
+            "remaining_km": round(remaining, 2),
+            "progress_pct": round(100 * along / route.length_km, 1) if route.length_km else None,
+            "offset_km": round(self.offset_km, 3) if self.offset_km is not None else None,
+            "speed_kmh": round(self.speed_kmh, 1) if self.speed_kmh is not None else None,
+            "eta_hours": round(eta_hours, 3),
+            "eta": format_eta(eta_hours),
+            "eta_at": (reference + timedelta(hours=eta_hours)).isoformat(),
+            "updated_at": reference.isoformat() if self.updated_at else None,
+        }
+
+
+class RouteTracker:
+    """
+    Route progress of every active shipment. Each ping from a carrier is
+    snapped to its shipments' polylines starting at the segment matched
+    last time (a fixed window around it), so the work per ping does not
+    depend on the route length; only a truck that stays off the window for
+    several pings triggers one full rescan. Speed is a time-weighted moving
+    average of progress along the route.
+    """
+
+    def __init__(self, lookahead=8, lookbehind=1, off_route_km=2, rescan_after=3, speed_tau=120,
+                 idle_seconds=86400, refresh_interval=30):
+        self.lookahead = lookahead
+        self.lookbehind = lookbehind
+        self.off_route_km = off_route_km
+        self.rescan_after = rescan_after
+        self.speed_tau = speed_tau
+        self.idle_seconds = idle_seconds
+        self.refresh_interval = refresh_interval
+        self.shipments = {}
+        self.by_carrier = {}
+        self._task = None
+        self.updates = 0
+        self.snaps = 0
+        self.rescans = 0
+
+    def track(self, shipment_id, carrier_id, points, source="explicit"):
+        """Start (or restart) tracking a shipment along `points` [(lat, lng), ...]."""
+        if len(points) < 2:
+            raise ValueError("A route needs at least two points")
+        if len(points) > ROUTE_MAX_POINTS:
+            raise ValueError(f"A route may have at most {ROUTE_MAX_POINTS} points")
+        self.untrack(shipment_id)
+        progress = self.shipments[shipment_id] = Progress(shipment_id, carrier_id, Route(points, source))
+        self.by_carrier.setdefault(carrier_id, set()).add(shipment_id)
+        return progress
+
+    def untrack(self, shipment_id):
+        progress = self.shipments.pop(shipment_id, None)
+        if progress is None:
+            return
+        shipments = self.by_carrier.get(progress.carrier_id)
+        if shipments is not None:
+            shipments.discard(shipment_id)
+            if not shipments:
+                del self.by_carrier[progress.carrier_id]
+
+    def update(self, carrier_id, lat, lng, speed=None, t=None):
+        """Advance every shipment the carrier is tracked on; O(window) per shipment."""
+        shipment_ids = self.by_carrier.get(carrier_id)
+        if not shipment_ids:
+            return
+        t = t or time.time()
+        self.updates += 1
+        for shipment_id in shipment_ids:
+            self._advance(self.shipments[shipment_id], lat, lng, speed, t)
+
+    def _advance(self, progress, lat, lng, speed, t):
+        route = progress.route
+        self.snaps += 1
+        offset, along, segment = route.snap(lat, lng, progress.segment - self.lookbehind,
+                                            progress.segment + self.lookahead)
+        if offset > self.off_route_km:
+            progress.misses += 1
+            if progress.misses >= self.rescan_after:
+                # Lost the window (detour, GPS dropout): search the whole route once
+                offset, along, segment = route.snap(lat, lng, 0, len(route) - 1)
+                progress.rescans += 1
+                self.rescans += 1
+                progress.misses = 0
+        else:
+            progress.misses = 0
+
+        previous_along, previous_t = progress.along_km, progress.updated_at
+        if previous_along is None or previous_t is None or t <= previous_t:
+            if progress.speed_kmh is None and speed:
+                progress.speed_kmh = float(speed)
+        else:
+            rate = min(max((along - previous_along) / ((t - previous_t) / 3600), 0.0), ROUTE_MAX_SPEED_KMH)
+            weight = 1 - math.exp(-(t - previous_t) / self.speed_tau)
+            progress.speed_kmh = rate if progress.speed_kmh is None else \
+                progress.speed_kmh + weight * (rate - progress.speed_kmh)
+        progress.segment = segment
+        progress.along_km = along
+        progress.offset_km = offset
+        progress.updated_at = t
+
+    def get(self, shipment_id):
+        progress = self.shipments.get(shipment_id)
+        return progress.as_dict() if progress is not None else None
+
+    def for_carrier(self, carrier_id):
+        return [self.shipments[shipment_id].as_dict() for shipment_id in self.by_carrier.get(carrier_id, ())]
+
+    def sync(self, active):
+        """
+        Follow the active shipments {shipment_id: (carrier_id, pickup, delivery)}:
+        new ones get a straight pickup -> delivery route until a real polyline
+        is posted. Routes of shipments that left the active set (completed,
+        cancelled) are dropped, as are routes with no ping for `idle_seconds`.
+        """
+        now = time.time()
+        for shipment_id, (carrier_id, pickup, delivery) in active.items():
+            progress = self.shipments.get(shipment_id)
+            if progress is None or progress.carrier_id != carrier_id:
+                progress = self.track(shipment_id, carrier_id, [pickup, delivery], source="straight_line")
+            progress.active = True
+        for shipment_id, progress in list(self.shipments.items()):
+            finished = progress.active and shipment_id not in active
+            idle = now - (progress.updated_at or progress.created_at) > self.idle_seconds
+            if finished or idle:
+                self.untrack(shipment_id)
+
+    async def refresh(self):
+        # The geofence engine already loads the active shipments and their carriers
+        self.sync(geofence_engine.active_routes())
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Route tracker refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "shipments": len(self.shipments),
+            "carriers": len(self.by_carrier),
+            "updates": self.updates,
+            "snaps": self.snaps,
+            "rescans": self.rescans,
+        }
+
+
+route_tracker = RouteTracker(
+    lookahead=ROUTE_SNAP_LOOKAHEAD,
+    lookbehind=ROUTE_SNAP_LOOKBEHIND,
+    off_route_km=ROUTE_OFF_ROUTE_KM,
+    rescan_after=ROUTE_RESCAN_AFTER,
+    speed_tau=ROUTE_SPEED_TAU_SECONDS,
+    idle_seconds=ROUTE_IDLE_SECONDS,
+    refresh_interval=ROUTE_REFRESH_INTERVAL
+)
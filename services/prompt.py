@@ -0,0 +1,212 @@
+import os
+import json
+
+# Token budget for the negotiation user prompt (the system prompt is fixed)
+GROQ_PROMPT_TOKEN_BUDGET = int(os.environ.get("GROQ_PROMPT_TOKEN_BUDGET", "1200"))
+# Rough chars-per-token ratio for English/JSON under Llama tokenizers
+CHARS_PER_TOKEN = 4
+# Free-text fields are cut to this many characters once the budget is tight
+MAX_TEXT_CHARS = 240
+
+# Fields the 14-factor framework actually uses; frontend (camelCase) and DB names both appear
+SHIPPER_FIELDS = (
+    "source", "destination", "source_location", "destination_location",
+    "minBudget", "maxBudget", "baseBudget", "min_budget", "max_budget",
+    "deadline", "timeWindow", "time_window", "priorityLevel", "priority_level",
+    "slaRules", "sla_rules", "specialConditions", "special_conditions", "specialTerms", "special_terms",
+)
+CARRIER_RESPONSE_FIELDS = (
+    "response_type", "proposed_price", "estimated_delivery_date", "estimated_delivery_days",
+    "delivery_deadline", "delivery_speed", "vehicle_type", "available_capacity", "insurance_coverage",
+    "tracking_available", "available_routes", "base_location", "cost_structure", "risk_factors", "notes",
+)
+CARRIER_PROFILE_FIELDS = (
+    "base_location", "available_capacity", "capacity_unit", "available_routes", "delivery_speed_options",
+    "risk_factors", "cost_structure", "reliability_score", "total_deliveries", "on_time_deliveries",
+)
+NEWS_FIELDS = ("title", "source")
+
+# What to give up, in order, when the prompt is over budget
+DROP_ORDER = (
+    ("carrier_profile", "available_routes"),
+    ("carrier_response", "available_routes"),
+    ("carrier_profile", "delivery_speed_options"),
+    ("carrier_profile", "total_deliveries"),
+    ("carrier_profile", "on_time_deliveries"),
+    ("carrier_response", "base_location"),
+    ("shipper_request", "special_terms"),
+    ("carrier_response", "notes"),
+)
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _is_empty(value):
+    return value is None or value == "" or value == [] or value == {}
+
+def prune(value):
+    """Recursively drop None / empty strings / empty containers."""
+    if isinstance(value, dict):
+        pruned = {k: prune(v) for k, v in value.items()}
+        return {k: v for k, v in pruned.items() if not _is_empty(v)}
+    if isinstance(value, list):
+        return [v for v in (prune(v) for v in value) if not _is_empty(v)]
+    return value
+
+def project(row, fields):
+    return {field: row[field] for field in fields if field in (row or {})}
+
+def parse_notes(notes):
+    """`notes` is often the whole carrier form serialised to a string; parse it once."""
+    if isinstance(notes, str):
+        try:
+            notes = json.loads(notes)
+        except ValueError:
+            return notes
+    return notes
+
+def _canonical_shipper(shipper):
+    """Fold the frontend and DB spellings of the same shipper field into one key."""
+    aliases = {
+        "source_location": "source", "destination_location": "destination",
+        "minBudget": "min_budget", "maxBudget": "max_budget", "timeWindow": "time_window",
+        "priorityLevel": "priority_level", "slaRules": "sla_rules",
+        "specialConditions": "special_conditions", "specialTerms": "special_terms",
+    }
+    canonical = {}
+    for field, value in shipper.items():
+        key = aliases.get(field, field)
+        if _is_empty(canonical.get(key)):
+            canonical[key] = value
+    return canonical
+
+def _carrier_response(response):
+    """Project the response, lifting useful fields out of JSON-encoded notes."""
+    projected = project(response, CARRIER_RESPONSE_FIELDS)
+    notes = parse_notes(projected.pop("notes", None))
+    if isinstance(notes, dict):
+        for field, value in project(notes, CARRIER_RESPONSE_FIELDS).items():
+            if field == "notes":
+                continue
+            if _is_empty(projected.get(field)):
+                projected[field] = value
+        notes = notes.get("notes")
+    if isinstance(notes, str) and notes.strip():
+        projected["notes"] = notes.strip()
+    return projected
+
+def compact_context(user_context):
+    """The negotiation inputs reduced to what the prompt needs."""
+    news = user_context.get("news")
+    if isinstance(news, list):
+        news = [project(item, NEWS_FIELDS) if isinstance(item, dict) else item for item in news]
+    return prune({
+        "shipper_request": _canonical_shipper(project(user_context.get("shipper_request") or {}, SHIPPER_FIELDS)),
+        "carrier_response": _carrier_response(user_context.get("carrier_response") or {}),
+        "carrier_profile": project(user_context.get("carrier_profile") or {}, CARRIER_PROFILE_FIELDS),
+        "weather": user_context.get("weather"),
+        "news": news,
+    })
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def render_prompt(context, shipment_id, session_id):
+    return (
+        f"SHIPPER REQUEST: {_dumps(context.get('shipper_request', {}))}\n"
+        f"CARRIER RESPONSE: {_dumps(context.get('carrier_response', {}))}\n"
+        f"CARRIER PROFILE: {_dumps(context.get('carrier_profile', {}))}\n"
+        f"WEATHER: {_dumps(context.get('weather', {}))}\n"
+        f"NEWS: {_dumps(context.get('news', []))}\n"
+        f"SHIPMENT_REFERENCE: {shipment_id}\n"
+        f"NEGOTIATION_SESSION: {session_id}\n"
+    )
+
+def _truncate_text(context):
+    changed = False
+    for section in context.values():
+        if not isinstance(section, dict):
+            continue
+        for field, value in section.items():
+            if isinstance(value, str) and len(value) > MAX_TEXT_CHARS:
+                section[field] = value[:MAX_TEXT_CHARS] + "..."
+                changed = True
+    return changed
+
+def fit_budget(context, shipment_id, session_id, budget):
+    """
+    Trim `context` in priority order until the prompt fits `budget` tokens:
+    the last headlines first, then long free text, then low-value fields.
+    Returns (prompt, steps taken).
+    """
+    steps = 0
+    prompt = render_prompt(context, shipment_id, session_id)
+    while estimate_tokens(prompt) > budget:
+        if context.get("news"):
+            context["news"].pop()
+        elif not _truncate_text(context):
+            drop = next(((section, field) for section, field in DROP_ORDER if field in context.get(section, {})), None)
+            if drop is None:
+                break
+            del context[drop[0]][drop[1]]
+        steps += 1
+        prompt = render_prompt(context, shipment_id, session_id)
+    return prompt, steps
+
+
+class PromptStats:
+    """Running totals of how much compaction saves."""
+
+    def __init__(self):
+        self.prompts = 0
+        self.raw_tokens = 0
+        self.prompt_tokens = 0
+        self.truncated = 0
+
+    def record(self, raw_tokens, prompt_tokens, truncated):
+        self.prompts += 1
+        self.raw_tokens += raw_tokens
+        self.prompt_tokens += prompt_tokens
+        self.truncated += 1 if truncated else 0
+
+    def stats(self):
+        saved = self.raw_tokens - self.prompt_tokens
+        return {
+            "prompts": self.prompts,
+            "raw_tokens": self.raw_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "tokens_saved": saved,
+            "saved_ratio": round(saved / self.raw_tokens, 3) if self.raw_tokens else None,
+            "truncated": self.truncated,
+            "budget": GROQ_PROMPT_TOKEN_BUDGET,
+        }
+
+
+prompt_stats = PromptStats()
+
+
+def raw_prompt_tokens(user_context):
+    """Size of the prompt as it was built before compaction (full rows, default json.dumps)."""
+    raw = f"""
+SHIPPER REQUEST (DB + INPUT): {json.dumps(user_context.get('shipper_request'), default=str)}
+CARRIER RESPONSE (DB + PROPOSAL): {json.dumps(user_context.get('carrier_response'), default=str)}
+CARRIER FLEET/PROFILE: {json.dumps(user_context.get('carrier_profile'), default=str)}
+EXTERNAL ENVIRONMENT (WEATHER/NEWS): {json.dumps({'weather': user_context.get('weather'), 'news': user_context.get('news')}, default=str)}
+SHIPMENT_REFERENCE: {user_context.get('shipment_id')}
+NEGOTIATION_SESSION: {user_context.get('id')}
+"""
+    return estimate_tokens(raw)
+
+def build_user_prompt(user_context, budget=GROQ_PROMPT_TOKEN_BUDGET):
+    """
+    Compact, budgeted user prompt for a negotiation. Records the savings in prompt_stats
+    and this call's counts on user_context["prompt_tokens"] for the transparency report.
+    """
+    context = compact_context(user_context)
+    prompt, steps = fit_budget(context, user_context.get("shipment_id"), user_context.get("id"), budget)
+    raw_tokens = raw_prompt_tokens(user_context)
+    prompt_tokens = estimate_tokens(prompt)
+    prompt_stats.record(raw_tokens, prompt_tokens, steps)
+    user_context["prompt_tokens"] = {"raw": raw_tokens, "compacted": prompt_tokens, "trim_steps": steps}
+    return prompt
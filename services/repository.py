@@ -0,0 +1,195 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from supabase import acreate_client
+from services.cache import TTLCache, MISSING
+
+# Latency samples kept per query name for the percentile metrics
+LATENCY_WINDOW = 512
+
+
+class QueryMetrics:
+    """Per-query latency and error counters for the data-access layer."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._queries = {}
+
+    @contextmanager
+    def timed(self, name):
+        entry = self._queries.setdefault(name, {"count": 0, "errors": 0, "samples": deque(maxlen=self.window)})
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            entry["errors"] += 1
+            raise
+        finally:
+            entry["count"] += 1
+            entry["samples"].append((time.perf_counter() - started) * 1000)
+
+    def stats(self):
+        report = {}
+        for name, entry in self._queries.items():
+            samples = sorted(entry["samples"])
+            report[name] = {
+                "count": entry["count"],
+                "errors": entry["errors"],
+                "p50_ms": round(samples[len(samples) // 2], 2) if samples else None,
+                "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2) if samples else None,
+                "max_ms": round(samples[-1], 2) if samples else None,
+            }
+        return report
+
+
+query_metrics = QueryMetrics()
+
+
+class TableRepository:
+    """
+    Read-through cache over one Supabase table. Rows are cached by their key
+    columns for `ttl` seconds; batch reads fetch every missing key in a single
+    `.in_()` query. Realtime change events call `invalidate_row`.
+    """
+
+    def __init__(self, client, table, key_columns, ttl, max_entries=1024):
+        self.client = client
+        self.table = table
+        self.key_columns = tuple(key_columns)
+        self.cache = TTLCache(table, ttl=ttl, max_entries=max_entries)
+
+    def _key(self, values):
+        return ":".join(str(v) for v in values)
+
+    def _row_key(self, row):
+        if any(row.get(column) is None for column in self.key_columns):
+            return None
+        return self._key(row[column] for column in self.key_columns)
+
+    def prime(self, rows):
+        """Cache rows read elsewhere (e.g. a full-table scan)."""
+        for row in rows:
+            key = self._row_key(row)
+            if key is not None:
+                self.cache.set(key, row)
+
+    def _query_one(self, values):
+        query = self.client.table(self.table).select("*")
+        for column, value in zip(self.key_columns, values):
+            query = query.eq(column, value)
+        with query_metrics.timed(f"{self.table}.get"):
+            result = query.limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def get(self, *values):
+        """One row by its key columns, or None. Missing rows are not cached."""
+        if not self.client:
+            return None
+        return self.cache.get_or_load(self._key(values), lambda: self._query_one(values))
+
+    def get_many(self, keys):
+        """Rows for many single-column keys, keyed by that column; one query for the misses."""
+        if len(self.key_columns) != 1:
+            raise ValueError(f"{self.table}: batch reads need a single key column")
+        column = self.key_columns[0]
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            row = self.cache.get(self._key((key,)), MISSING)
+            if row is MISSING:
+                missing.append(key)
+            else:
+                found[key] = row
+        if missing and self.client:
+            with query_metrics.timed(f"{self.table}.get_many"):
+                result = self.client.table(self.table).select("*").in_(column, missing).execute()
+            rows = result.data or []
+            self.prime(rows)
+            found.update((row[column], row) for row in rows)
+        return found
+
+    def find(self, **filters):
+        """Uncached filtered read; the rows it returns warm the per-row cache."""
+        if not self.client:
+            return []
+        query = self.client.table(self.table).select("*")
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        with query_metrics.timed(f"{self.table}.find"):
+            rows = query.execute().data or []
+        self.prime(rows)
+        return rows
+
+    def invalidate(self, *values):
+        self.cache.invalidate(self._key(values))
+
+    def invalidate_row(self, record, old_record=None):
+        """Drop a changed row; without its key columns (e.g. a bare DELETE) drop the whole table."""
+        keys = {self._row_key(row) for row in (record, old_record) if row}
+        keys.discard(None)
+        if not keys:
+            self.cache.clear()
+            return
+        for key in keys:
+            self.cache.invalidate(key)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class RealtimeInvalidator:
+    """
+    Subscribes to Supabase realtime postgres_changes for the cached tables and
+    invalidates the matching rows, so long TTLs do not serve stale data.
+    Needs the tables to be in the supabase_realtime publication.
+    """
+
+    def __init__(self, url, key, repositories, enabled=True):
+        self.url = url
+        self.key = key
+        self.enabled = enabled
+        self.repositories = {repo.table: repo for repo in repositories}
+        self.client = None
+        self._task = None
+        self.events = 0
+
+    def _on_change(self, payload):
+        data = payload.get("data", payload)
+        repo = self.repositories.get(data.get("table"))
+        if repo is not None:
+            self.events += 1
+            repo.invalidate_row(data.get("record"), data.get("old_record"))
+
+    async def connect(self):
+        try:
+            self.client = await acreate_client(self.url, self.key)
+            channel = self.client.channel("repository-invalidation")
+            for table in self.repositories:
+                channel = channel.on_postgres_changes("*", schema="public", table=table, callback=self._on_change)
+            await channel.subscribe()
+        except Exception as e:
+            print(f"Realtime cache invalidation unavailable, relying on TTLs: {e}")
+            self.client = None
+
+    def start(self):
+        """Connect in the background; the caches work on TTLs alone until then."""
+        if self.enabled and self.url and self.key and self._task is None:
+            self._task = asyncio.create_task(self.connect())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.client is not None:
+            try:
+                await asyncio.wait_for(self.client.remove_all_channels(), timeout=5)
+            except Exception as e:
+                print(f"Realtime shutdown failed: {e}")
+            self.client = None
+
+    def stats(self):
+        return {"connected": self.client is not None, "events": self.events}
@@ -0,0 +1,133 @@
+import math
+import heapq
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dlat = p2 - p1
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    Uniform lat/lng grid over point objects (carriers, fences, ...).
+    Updates are O(1), so moving trucks can be re-indexed on every ping;
+    k-nearest and radius queries only visit the cells around the query point.
+    Longitudes do not wrap at the antimeridian.
+    """
+
+    def __init__(self, cell_deg=0.1):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self._points = {}
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def upsert(self, key, lat, lng):
+        cell = self._cell(lat, lng)
+        previous = self._points.get(key)
+        if previous is not None and previous[2] != cell:
+            self._discard(key, previous[2])
+        if previous is None or previous[2] != cell:
+            self._cells.setdefault(cell, set()).add(key)
+        self._points[key] = (lat, lng, cell)
+
+    def remove(self, key):
+        previous = self._points.pop(key, None)
+        if previous is not None:
+            self._discard(key, previous[2])
+
+    def _discard(self, key, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._cells[cell]
+
+    def position(self, key):
+        point = self._points.get(key)
+        return (point[0], point[1]) if point else None
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def _cell_km(self, lat, span_deg=0.0):
+        """Smallest side, in km, of any cell within `span_deg` of `lat` (cells narrow towards the poles)."""
+        edge = min(abs(lat) + span_deg + self.cell_deg, 89.9)
+        return self.cell_deg * KM_PER_DEGREE * max(math.cos(math.radians(edge)), 1e-6)
+
+    def _ring(self, center, r):
+        ci, cj = center
+        if r == 0:
+            yield center
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def _scan(self, cells, lat, lng, radius_km=None):
+        for cell in cells:
+            for key in self._cells.get(cell, ()):
+                p_lat, p_lng, _ = self._points[key]
+                distance = haversine_km(lat, lng, p_lat, p_lng)
+                if radius_km is None or distance <= radius_km:
+                    yield distance, key
+
+    def nearest(self, lat, lng, k=10, max_km=None):
+        """The `k` closest (distance_km, key) pairs, nearest first."""
+        if k <= 0 or not self._points:
+            return []
+        center = self._cell(lat, lng)
+        best = []
+        r = 0
+        while True:
+            ring_cells = 8 * r if r else 1
+            if ring_cells > len(self._cells):
+                # The ring is now larger than the occupied grid: finish with a full scan
+                candidates = self._scan(list(self._cells), lat, lng, max_km)
+                return heapq.nsmallest(k, candidates)
+            best.extend(self._scan(self._ring(center, r), lat, lng, max_km))
+            # Anything in ring r+1 is at least r cells away; measure a cell where the
+            # band of rows searched so far is narrowest, i.e. closest to the pole
+            reach = r * self._cell_km(lat, r * self.cell_deg)
+            if len(best) >= k and heapq.nsmallest(k, best)[-1][0] <= reach:
+                return heapq.nsmallest(k, best)
+            if max_km is not None and reach > max_km:
+                return heapq.nsmallest(k, best)
+            r += 1
+
+    def cell(self, lat, lng):
+        """Grid cell of a point."""
+        return self._cell(lat, lng)
+
+    def covering_cells(self, lat, lng, radius_km):
+        """Every cell overlapping the bounding box of a `radius_km` circle around the point."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6))
+        i0, j0 = self._cell(lat - dlat, lng - dlng)
+        i1, j1 = self._cell(lat + dlat, lng + dlng)
+        return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+    def within_radius(self, lat, lng, radius_km):
+        """All (distance_km, key) pairs within `radius_km`, nearest first."""
+        rows = int(math.ceil(radius_km / (self.cell_deg * KM_PER_DEGREE)))
+        cols = int(math.ceil(radius_km / self._cell_km(lat, radius_km / KM_PER_DEGREE)))
+        ci, cj = self._cell(lat, lng)
+        if (2 * rows + 1) * (2 * cols + 1) > len(self._cells):
+            cells = [cell for cell in self._cells if abs(cell[0] - ci) <= rows and abs(cell[1] - cj) <= cols]
+        else:
+            cells = [(i, j) for i in range(ci - rows, ci + rows + 1) for j in range(cj - cols, cj + cols + 1)]
+        return sorted(self._scan(cells, lat, lng, radius_km))
@@ -0,0 +1,94 @@
+import re
+import json
+
+_decoder = json.JSONDecoder()
+
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+def _string_prefix(buf, start):
+    """
+    Scan a JSON string body beginning at `start` (just after the opening quote).
+    Returns (end, closed): `end` is the index up to which the body can be decoded
+    safely (never splitting an escape sequence), `closed` whether the closing
+    quote was reached.
+    """
+    i = start
+    n = len(buf)
+    while i < n:
+        ch = buf[i]
+        if ch == '"':
+            return i, True
+        if ch == "\\":
+            width = 6 if buf[i + 1:i + 2] == "u" else 2
+            if i + width > n:
+                break
+            i += width
+            continue
+        i += 1
+    return i, False
+
+
+class JsonFieldStream:
+    """
+    Incrementally extracts top-level fields from a JSON object that arrives
+    in chunks (a streamed LLM completion).
+
+    - `text_field` is surfaced as text deltas while it is still being written.
+    - Every key in `fields` is surfaced once its value parses completely.
+    """
+
+    def __init__(self, text_field, fields):
+        self.text_field = text_field
+        self.pending = set(fields)
+        self.buf = ""
+        self._text_pos = None
+        self._text_done = False
+        self._key_patterns = {key: re.compile(r'"%s"\s*:\s*' % re.escape(key)) for key in (text_field, *fields)}
+
+    def _value_start(self, key):
+        match = self._key_patterns[key].search(self.buf)
+        return match.end() if match else None
+
+    def feed(self, chunk):
+        """Add a chunk; returns a list of ("delta", text) and ("field", (key, value)) events."""
+        self.buf += chunk
+        events = []
+
+        if not self._text_done:
+            if self._text_pos is None:
+                start = self._value_start(self.text_field)
+                if start is not None and self.buf[start:start + 1] == '"':
+                    self._text_pos = start + 1
+            if self._text_pos is not None:
+                end, closed = _string_prefix(self.buf, self._text_pos)
+                if end > self._text_pos:
+                    events.append(("delta", json.loads('"' + self.buf[self._text_pos:end] + '"')))
+                    self._text_pos = end
+                self._text_done = closed
+
+        for key in list(self.pending):
+            start = self._value_start(key)
+            if start is None:
+                continue
+            try:
+                value, end = _decoder.raw_decode(self.buf, start)
+            except ValueError:
+                continue
+            # A number at the very end of the buffer may still be growing
+            if end == len(self.buf) and isinstance(value, (int, float)):
+                continue
+            self.pending.discard(key)
+            events.append(("field", (key, value)))
+        return events
+
+    def document(self):
+        """The full JSON text, with any markdown code fence stripped."""
+        text = self.buf.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+            text = text.rsplit("```", 1)[0]
+        return text.strip()
@@ -0,0 +1,319 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+from services.api import run_db, supabase
+from services.live_feed import live_feed
+from services.carrier_search import carrier_directory
+from services.history import telemetry_history
+from services.anomaly import anomaly_detector
+from services.geofence import geofence_engine
+from services.progress import route_tracker
+
+# Live-location ingestion: pings are buffered and written in bulk
+TELEMETRY_FLUSH_INTERVAL = float(os.environ.get("TELEMETRY_FLUSH_INTERVAL", "0.5"))
+TELEMETRY_FLUSH_SIZE = int(os.environ.get("TELEMETRY_FLUSH_SIZE", "500"))
+TELEMETRY_MAX_PENDING = int(os.environ.get("TELEMETRY_MAX_PENDING", "20000"))
+# Seconds a position loaded from the DB (cold carrier) is served before re-reading it
+HOT_STORE_DB_TTL = float(os.environ.get("HOT_STORE_DB_TTL", "5"))
+# Seconds a position from this process's own pings is served before the DB is checked
+# again: the carrier may have moved on to reporting through another worker
+HOT_STORE_PING_TTL = float(os.environ.get("HOT_STORE_PING_TTL", "30"))
+# Carriers kept in memory; the least recently updated are evicted first
+HOT_STORE_MAX_CARRIERS = int(os.environ.get("HOT_STORE_MAX_CARRIERS", "100000"))
+# Carriers not updated for this long are evicted even below the cap
+HOT_STORE_IDLE_SECONDS = float(os.environ.get("HOT_STORE_IDLE_SECONDS", "3600"))
+
+
+class LocationRecord:
+    """Latest known position of one carrier."""
+
+    __slots__ = ("carrier_id", "lat", "lng", "speed", "heading", "updated_at", "loaded_at")
+
+    def __init__(self, carrier_id, lat, lng, speed, heading, updated_at, loaded_at=None):
+        self.carrier_id = carrier_id
+        self.lat = lat
+        self.lng = lng
+        self.speed = speed
+        self.heading = heading
+        self.updated_at = updated_at
+        # Set when the record came from the DB rather than from a ping
+        self.loaded_at = loaded_at
+
+    @property
+    def fresh_at(self):
+        """When this process last learned the position (ping or DB read)."""
+        return self.loaded_at if self.loaded_at is not None else self.updated_at
+
+    def as_row(self):
+        """Shape of a carrier_live_location row."""
+        return {
+            "carrier_id": self.carrier_id,
+            "latitude": self.lat,
+            "longitude": self.lng,
+            "speed": self.speed,
+            "heading": self.heading,
+            "updated_at": datetime.fromtimestamp(self.updated_at, timezone.utc).isoformat()
+        }
+
+
+class HotLocationStore:
+    """
+    In-process latest-position store fed by the ingest path. Reads are a dict
+    lookup while the position is fresh: `ping_ttl` seconds after this process
+    last received a ping for the carrier, `db_ttl` seconds after it last read
+    the carrier from the DB. After that the DB is consulted again, since
+    another worker may be receiving that carrier's pings. Records are kept in
+    least-recently-updated order; at most `max_carriers` are kept and those
+    idle for `idle_seconds` are evicted.
+    """
+
+    def __init__(self, db_ttl=5, ping_ttl=30, max_carriers=100000, idle_seconds=3600):
+        self.db_ttl = db_ttl
+        self.ping_ttl = ping_ttl
+        self.max_carriers = max_carriers
+        self.idle_seconds = idle_seconds
+        self._records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evicted = 0
+        self.out_of_order = 0
+
+    def update(self, carrier_id, lat, lng, speed, heading, updated_at):
+        """Store a fix as the carrier's latest position; None (and no change) if a newer one is known."""
+        record = self._records.get(carrier_id)
+        if record is not None and updated_at < record.updated_at:
+            self.out_of_order += 1
+            return None
+        if record is None:
+            record = self._records[carrier_id] = LocationRecord(carrier_id, lat, lng, speed, heading, updated_at)
+            if len(self._records) > self.max_carriers:
+                self.evict()
+            return record
+        self._records.move_to_end(carrier_id)
+        record.lat = lat
+        record.lng = lng
+        record.speed = speed
+        record.heading = heading
+        record.updated_at = updated_at
+        record.loaded_at = None
+        return record
+
+    def load_row(self, row):
+        """Cache a carrier_live_location row read from the DB (unless ours is newer, e.g. not yet flushed)."""
+        updated_at = datetime.fromisoformat(row["updated_at"]).timestamp() if row.get("updated_at") else time.time()
+        carrier_id = row["carrier_id"]
+        record = self._records.get(carrier_id)
+        if record is not None and record.updated_at >= updated_at:
+            record.loaded_at = time.time()
+        else:
+            record = self._records[carrier_id] = LocationRecord(
+                carrier_id, float(row["latitude"]), float(row["longitude"]),
+                float(row.get("speed") or 0), float(row.get("heading") or 0), updated_at, loaded_at=time.time()
+            )
+        self._records.move_to_end(carrier_id)
+        if len(self._records) > self.max_carriers:
+            self.evict()
+        return record
+
+    def peek(self, carrier_id):
+        """Record as stored, without expiry checks or counters."""
+        return self._records.get(carrier_id)
+
+    def get(self, carrier_id):
+        record = self._records.get(carrier_id)
+        if record is None:
+            self.misses += 1
+            return None
+        ttl = self.db_ttl if record.loaded_at is not None else self.ping_ttl
+        if time.time() - record.fresh_at > ttl:
+            self.stale += 1
+            return None
+        self.hits += 1
+        return record
+
+    def evict(self, now=None):
+        """Drop the least recently updated records over the cap and every idle one; O(evicted)."""
+        cutoff = (now or time.time()) - self.idle_seconds
+        records = self._records
+        while records:
+            record = next(iter(records.values()))
+            if len(records) <= self.max_carriers and record.fresh_at >= cutoff:
+                break
+            records.popitem(last=False)
+            self.evicted += 1
+
+    def records(self):
+        return self._records.values()
+
+    def __len__(self):
+        return len(self._records)
+
+    def stats(self):
+        return {
+            "carriers": len(self._records),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evicted": self.evicted,
+            "out_of_order": self.out_of_order,
+        }
+
+
+class TelemetryBuffer:
+    """
+    Tracks carriers whose position changed since the last write and flushes
+    their latest position to the database in bulk, every `flush_interval`
+    seconds or as soon as `flush_size` carriers are pending. Repeated pings
+    from one carrier coalesce (latest wins). Once `max_pending` carriers are
+    queued, pings from new carriers are refused so callers can back off.
+    """
+
+    def __init__(self, writer, store, flush_interval=0.5, flush_size=500, max_pending=20000):
+        self.writer = writer
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        self._pending = {}
+        self._wakeup = None
+        self._task = None
+        self.accepted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.failed_batches = 0
+        self.last_flush_ms = None
+
+    def has_room(self, carrier_id):
+        """Whether a ping from `carrier_id` can be queued right now."""
+        if carrier_id in self._pending or len(self._pending) < self.max_pending:
+            return True
+        self.rejected += 1
+        return False
+
+    def mark(self, carrier_id):
+        """Queue `carrier_id` for the next flush."""
+        if carrier_id in self._pending:
+            self.coalesced += 1
+            return
+        self._pending[carrier_id] = None
+        self.accepted += 1
+        if len(self._pending) >= self.flush_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        # A carrier evicted as idle while its write kept failing has nothing left to write
+        records = (self.store.peek(carrier_id) for carrier_id in batch)
+        rows = [record.as_row() for record in records if record is not None]
+        started = time.perf_counter()
+        for i in range(0, len(rows), self.flush_size):
+            chunk = rows[i:i + self.flush_size]
+            try:
+                await self.writer(chunk)
+                self.flushed_rows += len(chunk)
+            except Exception as e:
+                self.failed_batches += 1
+                print(f"Telemetry flush failed ({len(chunk)} rows): {e}")
+                # Retry on the next flush with whatever position is latest by then
+                for row in chunk:
+                    self._pending.setdefault(row["carrier_id"], None)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            self.store.evict()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "accepted": self.accepted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "flushed_rows": self.flushed_rows,
+            "failed_batches": self.failed_batches,
+            "last_flush_ms": self.last_flush_ms
+        }
+
+
+async def upsert_live_locations(rows):
+    """Bulk upsert into carrier_live_location (one row per carrier)."""
+    await run_db(supabase.table("carrier_live_location").upsert(rows, on_conflict="carrier_id").execute)
+
+
+hot_locations = HotLocationStore(
+    db_ttl=HOT_STORE_DB_TTL,
+    ping_ttl=HOT_STORE_PING_TTL,
+    max_carriers=HOT_STORE_MAX_CARRIERS,
+    idle_seconds=HOT_STORE_IDLE_SECONDS
+)
+
+telemetry_buffer = TelemetryBuffer(
+    upsert_live_locations,
+    hot_locations,
+    flush_interval=TELEMETRY_FLUSH_INTERVAL,
+    flush_size=TELEMETRY_FLUSH_SIZE,
+    max_pending=TELEMETRY_MAX_PENDING
+)
+
+
+def record_location(carrier_id, lat, lng, speed=0, heading=0, taken_at=None):
+    """
+    Single ingest path for every live-location fix (single and batch endpoints).
+    `taken_at` is when the fix was taken (default: now); a fix older than the
+    carrier's latest known position is acknowledged but ignored. Returns
+    False when the fix was refused because the buffer is full.
+    """
+    if not telemetry_buffer.has_room(carrier_id):
+        return False
+    timestamp = taken_at.timestamp() if taken_at else time.time()
+    record = hot_locations.update(carrier_id, lat, lng, speed or 0, heading or 0, timestamp)
+    if record is None:
+        return True
+    telemetry_buffer.mark(carrier_id)
+    carrier_directory.update_live(carrier_id, lat, lng, record.speed)
+    telemetry_history.append(carrier_id, timestamp, lat, lng, record.speed, record.heading)
+    anomaly_detector.observe(carrier_id, timestamp, lat, lng, record.speed)
+    geofence_engine.check(carrier_id, lat, lng, timestamp)
+    route_tracker.update(carrier_id, lat, lng, record.speed, timestamp)
+    live_feed.publish(record)
+    return True
+
+
+async def get_location(carrier_id):
+    """Latest position of a carrier: hot store first, DB for cold carriers."""
+    record = hot_locations.get(carrier_id)
+    if record is not None:
+        return record
+    if supabase:
+        result = await run_db(supabase.table("carrier_live_location").select("*").eq("carrier_id", carrier_id).limit(1).execute)
+        if result.data:
+            return hot_locations.load_row(result.data[0])
+    # Stale but still the best position known
+    return hot_locations.peek(carrier_id)
@@ -0,0 +1,146 @@
+import json
+import uuid
+from datetime import datetime, timezone
+import numpy as np
+
+# Compact binary encoding: one fixed-size little-endian record per fix
+# (carrier UUID as 16 raw bytes, lat/lng as float64, speed/heading as float32,
+# fix time as float64 epoch seconds, 0 when the device did not record one)
+BINARY_CONTENT_TYPE = "application/octet-stream"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+LOCATION_RECORD = np.dtype([
+    ("carrier_id", "S16"),
+    ("lat", "<f8"),
+    ("lng", "<f8"),
+    ("speed", "<f4"),
+    ("heading", "<f4"),
+    ("timestamp", "<f8"),
+])
+
+# Cap on the number of per-point errors echoed back to the client
+MAX_REPORTED_ERRORS = 20
+
+
+class LocationBatch:
+    """
+    Column-oriented batch of location fixes, validated in one pass. Each fix
+    may carry the epoch time it was taken; NaN where it was not given.
+    """
+
+    def __init__(self, carrier_ids, lat, lng, speed, heading, timestamp=None):
+        self.carrier_ids = carrier_ids
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.speed = np.asarray(speed, dtype=np.float64)
+        self.heading = np.asarray(heading, dtype=np.float64)
+        self.timestamp = np.full(len(carrier_ids), np.nan) if timestamp is None else \
+            np.asarray(timestamp, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.carrier_ids)
+
+    def validate(self):
+        """Return (valid mask, list of (index, reason)) for every fix."""
+        has_id = np.fromiter((bool(cid) for cid in self.carrier_ids), dtype=bool, count=len(self))
+        checks = [
+            (has_id, "missing carrier_id"),
+            (np.isfinite(self.lat) & (np.abs(self.lat) <= 90), "lat out of range"),
+            (np.isfinite(self.lng) & (np.abs(self.lng) <= 180), "lng out of range"),
+            (np.isfinite(self.speed) & (self.speed >= 0), "invalid speed"),
+            (np.isfinite(self.heading), "invalid heading"),
+            (np.isnan(self.timestamp) | (np.isfinite(self.timestamp) & (self.timestamp > 0)), "invalid timestamp"),
+        ]
+        valid = np.ones(len(self), dtype=bool)
+        errors = []
+        for ok, reason in checks:
+            for index in np.flatnonzero(valid & ~ok)[:MAX_REPORTED_ERRORS - len(errors)]:
+                errors.append((int(index), reason))
+            valid &= ok
+        return valid, errors
+
+    def rows(self, mask):
+        """Yield (carrier_id, lat, lng, speed, heading, timestamp or None) for the selected fixes."""
+        for index in np.flatnonzero(mask):
+            t = self.timestamp[index]
+            yield (self.carrier_ids[index], float(self.lat[index]), float(self.lng[index]),
+                   float(self.speed[index]), float(self.heading[index]), None if np.isnan(t) else float(t))
+
+
+def _number(value, default=np.nan):
+    """Coerce to float; None takes `default`, anything unparseable becomes NaN."""
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _timestamp(value):
+    """Epoch seconds of a fix time (number, or ISO 8601 read as UTC if naive); NaN if absent, inf if unparseable."""
+    if value is None or value == "":
+        return np.nan
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return np.inf
+        return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+    number = _number(value)
+    return np.inf if np.isnan(number) else number
+
+def from_points(points):
+    """Build a batch from dicts shaped like `CarrierLocation`."""
+    points = [p if isinstance(p, dict) else {} for p in points]
+    return LocationBatch(
+        [str(p.get("carrier_id") or "") for p in points],
+        [_number(p.get("lat")) for p in points],
+        [_number(p.get("lng")) for p in points],
+        # speed/heading are optional, as on CarrierLocation
+        [_number(p.get("speed"), 0.0) for p in points],
+        [_number(p.get("heading"), 0.0) for p in points],
+        [_timestamp(p.get("timestamp")) for p in points],
+    )
+
+def decode_json(body):
+    """Accept a JSON array of points or an object with a "points" array."""
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get("points", [])
+    if not isinstance(data, list):
+        raise ValueError("expected a JSON array of points")
+    return from_points(data)
+
+def decode_ndjson(body):
+    """One JSON point per line; blank lines are ignored."""
+    lines = body.decode().splitlines() if isinstance(body, bytes) else body.splitlines()
+    return from_points([json.loads(line) for line in lines if line.strip()])
+
+def decode_binary(body):
+    """Decode packed `LOCATION_RECORD`s without a per-field Python loop."""
+    if len(body) % LOCATION_RECORD.itemsize:
+        raise ValueError(f"binary body must be a multiple of {LOCATION_RECORD.itemsize} bytes")
+    records = np.frombuffer(body, dtype=LOCATION_RECORD)
+    carrier_ids = [str(uuid.UUID(bytes=raw.ljust(16, b"\0"))) for raw in records["carrier_id"]]
+    timestamp = np.where(records["timestamp"] == 0, np.nan, records["timestamp"])
+    return LocationBatch(carrier_ids, records["lat"], records["lng"], records["speed"], records["heading"], timestamp)
+
+def encode_binary(points):
+    """Pack points (dicts with a UUID carrier_id) into the binary batch format."""
+    records = np.zeros(len(points), dtype=LOCATION_RECORD)
+    for i, p in enumerate(points):
+        records[i] = (uuid.UUID(p["carrier_id"]).bytes, p["lat"], p["lng"], p.get("speed") or 0, p.get("heading") or 0,
+                      p.get("timestamp") or 0)
+    return records.tobytes()
+
+def decode(body, content_type):
+    """Pick the decoder for a request's Content-Type."""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type == BINARY_CONTENT_TYPE:
+        return decode_binary(body)
+    if media_type == NDJSON_CONTENT_TYPE:
+        return decode_ndjson(body)
+    return decode_json(body)
@@ -20,8 +20,8 @@ ROUTE = [
 ]
 
 def calculate_heading(p1, p2):
-    lat1, lon1 = p1
-    lat2, lon2 = p2
+    lat1, lon1 = map(math.radians, p1)
+    lat2, lon2 = map(math.radians, p2)
     dLon = (lon2 - lon1)
     y = math.sin(dLon) * math.cos(lat2)
     x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dLon)
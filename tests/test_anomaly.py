@@ -0,0 +1,37 @@
+from services.anomaly import AnomalyDetector
+from services.spatial import KM_PER_DEGREE
+
+
+def kinds(detector):
+    return [event["type"] for event in detector.recent()]
+
+
+def test_implausible_move_is_a_position_jump():
+    detector = AnomalyDetector()
+    detector.observe("c1", 1000, 13.0, 80.0, 40)
+    detector.observe("c1", 1060, 13.0 + 50 / KM_PER_DEGREE, 80.0, 40)
+    assert kinds(detector) == ["position_jump"]
+    assert detector.recent()[0]["details"]["implied_speed_kmh"] > 2000
+
+
+def test_plausible_move_is_not_a_jump():
+    detector = AnomalyDetector()
+    detector.observe("c1", 1000, 13.0, 80.0, 60)
+    detector.observe("c1", 1060, 13.0 + 1 / KM_PER_DEGREE, 80.0, 60)
+    assert kinds(detector) == []
+
+
+def test_fixes_with_the_same_timestamp_are_not_a_jump():
+    detector = AnomalyDetector()
+    detector.observe("c1", 1000, 13.0, 80.0, 40)
+    detector.observe("c1", 1000, 13.0 + 5 / KM_PER_DEGREE, 80.0, 40)
+    detector.observe("c1", 999, 13.0 + 10 / KM_PER_DEGREE, 80.0, 40)
+    assert "position_jump" not in kinds(detector)
+
+
+def test_speed_spike_then_gap_then_stall():
+    detector = AnomalyDetector(stall_seconds=600, dropout_seconds=120)
+    for t, speed in ((0, 40), (10, 130), (20, 0), (100, 0), (700, 0)):
+        detector.observe("c1", t, 13.0, 80.0, speed)
+    # The 600 s silence before the last fix is reported as a dropout when fixes resume
+    assert kinds(detector) == ["speed_spike", "dropout", "stall"]
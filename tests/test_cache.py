@@ -0,0 +1,141 @@
+import time
+import asyncio
+import threading
+import pytest
+from services.cache import TTLCache, MemoryBackend, MISSING
+
+
+def test_get_or_load_caches_value():
+    cache = TTLCache("test", ttl=60)
+    calls = []
+    assert cache.get_or_load("k", lambda: calls.append(1) or "v") == "v"
+    assert cache.get_or_load("k", lambda: calls.append(1) or "other") == "v"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_none_is_not_cached():
+    cache = TTLCache("test", ttl=60)
+    assert cache.get_or_load("k", lambda: None) is None
+    assert cache.get_or_load("k", lambda: "v") == "v"
+
+
+def test_entries_expire():
+    backend = MemoryBackend()
+    backend.set("k", "v", ttl=0.01)
+    time.sleep(0.02)
+    assert backend.get("k") is MISSING
+    assert len(backend) == 0
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", 1, 60)
+    backend.set("b", 2, 60)
+    backend.get("a")
+    backend.set("c", 3, 60)
+    assert backend.get("a") == 1
+    assert backend.get("c") == 3
+    assert len(backend) == 2
+
+
+def test_concurrent_threads_share_one_load():
+    cache = TTLCache("test", ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "v"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", loader))) for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while cache.coalesced < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["v"] * 5
+    assert len(calls) == 1
+
+
+def test_async_callers_share_one_load():
+    cache = TTLCache("test", ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "v"
+
+    async def run():
+        return await asyncio.gather(*(cache.aget_or_load("k", loader) for _ in range(10)))
+
+    assert asyncio.run(run()) == ["v"] * 10
+    assert len(calls) == 1
+    assert cache.coalesced == 9
+
+
+def test_async_loader_error_reaches_every_caller():
+    cache = TTLCache("test", ttl=60)
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(*(cache.aget_or_load("k", loader) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    cache = TTLCache("test", ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "v"
+
+    async def run():
+        leader = asyncio.create_task(cache.aget_or_load("k", loader))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.aget_or_load("k", loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(run()) == ["v"] * 3
+    # The first follower took over the load once
+    assert len(calls) == 2
+    assert cache.get("k") == "v"
+
+
+def test_cancelled_follower_leaves_load_running():
+    cache = TTLCache("test", ttl=60)
+
+    async def loader():
+        await asyncio.sleep(0.02)
+        return "v"
+
+    async def run():
+        leader = asyncio.create_task(cache.aget_or_load("k", loader))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.aget_or_load("k", loader))
+        await asyncio.sleep(0.005)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(run()) == "v"
@@ -0,0 +1,33 @@
+from fastapi.testclient import TestClient
+import server
+
+client = TestClient(server.app)
+
+
+def test_bad_search_values_are_rejected():
+    for body in (
+        {"lat": "north", "lng": 80.2},
+        {"lat": 13.0},
+        {"lat": 91, "lng": 80.2},
+        {"lat": 13.0, "lng": -181},
+        {"lat": 13.0, "lng": 80.2, "radius_km": 0},
+        {"lat": 13.0, "lng": 80.2, "radius_km": "far"},
+        {"lat": 13.0, "lng": 80.2, "radius_km": "NaN"},
+        {"lat": 13.0, "lng": 80.2, "k": -1},
+        {"lat": 13.0, "lng": 80.2, "k": "ten"},
+    ):
+        response = client.post("/carriers/search", json=body)
+        assert response.status_code == 400, body
+        assert response.json()["detail"].startswith("Invalid search")
+
+
+def test_valid_search_is_served():
+    response = client.post("/carriers/search", json={"lat": "13.0", "lng": 80.2, "k": 5, "radius_km": 50})
+    assert response.status_code == 200
+    assert "carriers" in response.json()
+
+
+def test_bad_distance_matrix_origin_is_rejected():
+    for origins in ([{"lat": 100, "lng": 80.2}], [{"lat": "x", "lng": 80.2}], ["Chennai"]):
+        response = client.post("/carriers/distance-matrix", json={"origins": origins})
+        assert response.status_code == 400
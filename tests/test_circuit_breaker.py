@@ -0,0 +1,80 @@
+import asyncio
+import httpx
+import pytest
+from services import api
+from services.http_client import CircuitBreaker
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout
+    assert breaker.state == "half_open"
+
+
+def test_single_trial_when_half_open():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_release_frees_trial_without_verdict():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+@pytest.fixture
+def groq_breaker(monkeypatch):
+    breaker = CircuitBreaker("groq-test", failure_threshold=1, reset_timeout=30)
+    monkeypatch.setattr(api, "groq_breaker", breaker)
+    open_breaker(breaker)
+    return breaker
+
+def context():
+    return {"id": "NEG-TEST", "shipment_id": None}
+
+
+def test_client_error_on_trial_counts_as_failure(monkeypatch, groq_breaker):
+    async def bad_request(*args, **kwargs):
+        return httpx.Response(400, json={"error": "bad request"})
+    monkeypatch.setattr(api, "request_with_retry", bad_request)
+
+    assert asyncio.run(api._request_groq_async(context())) is None
+    assert groq_breaker.state == "open"
+    groq_breaker.opened_at -= groq_breaker.reset_timeout
+    assert groq_breaker.allow()
+
+
+def test_unparseable_completion_counts_as_failure(monkeypatch, groq_breaker):
+    async def not_json(*args, **kwargs):
+        return httpx.Response(200, json={"choices": [{"message": {"content": "not json"}}]})
+    monkeypatch.setattr(api, "request_with_retry", not_json)
+
+    assert asyncio.run(api._request_groq_async(context())) is None
+    assert groq_breaker.state == "open"
+
+
+def test_cancelled_trial_releases_slot(monkeypatch, groq_breaker):
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(60)
+    monkeypatch.setattr(api, "request_with_retry", hang)
+
+    async def run():
+        task = asyncio.create_task(api._request_groq_async(context()))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert groq_breaker.state == "half_open"
+    assert groq_breaker.allow()
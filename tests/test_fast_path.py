@@ -0,0 +1,66 @@
+import json
+from datetime import date
+from services.fast_path import (
+    extract_terms, contested_reasons, build_agreement, cost_breakdown, weather_risk,
+    DEFAULT_DELAY_PENALTY_PCT, DEFAULT_DELAY_TOLERANCE_HOURS,
+)
+
+TODAY = date(2026, 1, 1)
+
+
+def context(sla_rules=None, risk_factors=None, price="$2,700", delivery="2026-01-04"):
+    return {
+        "shipper_request": {"source_location": "Chennai", "destination_location": "Madurai",
+                            "min_budget": 2000, "max_budget": 3000, "deadline": "2026-01-05",
+                            "sla_rules": sla_rules},
+        "carrier_response": {"proposed_price": price, "estimated_delivery_date": delivery,
+                             "cost_structure": json.dumps({"base_rate": 2000, "fuel_charge": "500"})},
+        "carrier_profile": {"risk_factors": risk_factors, "reliability_score": 4.5},
+        "weather": {},
+        "news_freshness": None,
+    }
+
+
+def request():
+    return {"carrier": {}, "unique_id": "NEG-1", "user_email": "s@example.com", "carrier_id": "c", "shipment_id": "s"}
+
+
+def test_uncontested_terms_are_extracted():
+    terms = extract_terms(context(), TODAY)
+    assert terms["price"] == 2700
+    assert terms["delivery"] == date(2026, 1, 4)
+    assert contested_reasons(terms) == []
+
+
+def test_missing_sla_uses_defaults():
+    terms = extract_terms(context(), TODAY)
+    assert terms["delay_penalty_pct"] == DEFAULT_DELAY_PENALTY_PCT
+    assert terms["delay_tolerance_hours"] == DEFAULT_DELAY_TOLERANCE_HOURS
+
+
+def test_explicit_zero_sla_is_kept():
+    terms = extract_terms(context({"delayPenalty": 0, "maxDelayTolerance": "0 h"}), TODAY)
+    assert terms["delay_penalty_pct"] == 0
+    assert terms["delay_tolerance_hours"] == 0
+    agreement = build_agreement(request(), context(), terms)
+    penalty = next(c for c in agreement["clauses"] if c["id"] == "penalty")
+    assert penalty["negotiated"].startswith("None")
+
+
+def test_jsonb_fields_stored_as_text_are_parsed():
+    terms = extract_terms(context('{"delayPenalty": "10%"}', '{"weather": "high"}'), TODAY)
+    assert terms["delay_penalty_pct"] == 10
+    assert terms["weather_risk"] == "medium"
+    assert cost_breakdown(terms["cost_structure"]) == [("Base rate", 2000.0), ("Fuel charge", 500.0)]
+
+
+def test_malformed_jsonb_fields_count_as_empty():
+    terms = extract_terms(context("not json", ["high"]), TODAY)
+    assert terms["delay_penalty_pct"] == DEFAULT_DELAY_PENALTY_PCT
+    assert terms["weather_risk"] == "low"
+    assert weather_risk({"origin": "storm"}) == "low"
+
+
+def test_contested_cases_are_escalated():
+    assert "price_above_budget" in contested_reasons(extract_terms(context(price=3500), TODAY))
+    assert "late_delivery" in contested_reasons(extract_terms(context(delivery="2026-01-09"), TODAY))
@@ -0,0 +1,38 @@
+from services.gazetteer import Gazetteer, GAZETTEER_PATH
+from services.carrier_search import match_city, resolve_search_center
+
+
+def gazetteer():
+    return Gazetteer().load(GAZETTEER_PATH)
+
+
+def test_verbatim_names_resolve_with_full_confidence():
+    places = gazetteer()
+    place, confidence = places.match("Guindy, Chennai, Tamil Nadu")
+    assert place.name == "Chennai" and confidence == 1.0
+    assert places.match("Chennai Port Trust") == (place, 1.0)
+
+
+def test_misspelling_resolves_with_its_similarity():
+    place, confidence = gazetteer().match("Chenai")
+    assert place.name == "Chennai"
+    assert 0.8 <= confidence < 1
+
+
+def test_other_first_letter_is_not_a_misspelling():
+    places = gazetteer()
+    assert places.match("Sanand") == (None, 0.0)
+    assert places.fuzzy("Sanand") == []
+
+
+def test_exact_lookup_ignores_guesses():
+    places = gazetteer()
+    assert places.resolve("Chenai").name == "Chennai"
+    assert places.resolve("Chenai", exact=True) is None
+    assert places.stats()["guessed"] == 1
+
+
+def test_geofences_and_matching_do_not_use_guesses():
+    assert match_city("Chennai") is not None
+    assert match_city("Chenai") is None
+    assert resolve_search_center("Chenai") == match_city("Chennai")
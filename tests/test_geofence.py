@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+from services import geofence
+from services.geofence import GeofenceEngine
+from services.spatial import KM_PER_DEGREE
+
+# Chennai -> Bangalore, and a point between them
+CHENNAI = (13.0827, 80.2707)
+BANGALORE = (12.9716, 77.5946)
+HIGHWAY = (12.9, 79.1)
+
+
+def engine(status="matched"):
+    async def writer(status, shipment_ids):
+        pass
+
+    engine = GeofenceEngine(writer)
+    shipment = {"id": "s1", "source_location": "Chennai", "destination_location": "Bangalore", "status": status}
+    asyncio.run(engine.sync([shipment], {"s1": "c1"}, 10, 10))
+    return engine
+
+
+def test_passing_the_destination_before_pickup_does_not_deliver():
+    fences = engine()
+    fences.check("c1", *BANGALORE, t=1)
+    assert fences.statuses["s1"] == "matched"
+    fences.check("c1", *HIGHWAY, t=2)
+    fences.check("c1", *CHENNAI, t=3)
+    assert fences.statuses["s1"] == "matched"
+
+
+def test_pickup_then_delivery_completes():
+    fences = engine()
+    fences.check("c1", *CHENNAI, t=1)
+    fences.check("c1", *HIGHWAY, t=2)
+    assert fences.statuses["s1"] == "in_progress"
+    fences.check("c1", *BANGALORE, t=3)
+    assert fences.statuses["s1"] == "completed"
+    assert [event["type"] for event in fences.recent()] == ["enter", "exit", "enter"]
+
+
+def test_shipment_already_in_progress_completes_on_arrival():
+    fences = engine("in_progress")
+    fences.check("c1", *BANGALORE, t=1)
+    assert fences.statuses["s1"] == "completed"
+
+
+def test_same_city_delivery_completes_when_pickup_zone_is_left():
+    async def writer(status, shipment_ids):
+        pass
+
+    fences = GeofenceEngine(writer)
+    shipment = {"id": "s1", "source_location": "Chennai", "destination_location": "Chennai", "status": "matched"}
+    asyncio.run(fences.sync([shipment], {"s1": "c1"}, 10, 30))
+    fences.check("c1", *CHENNAI, t=1)
+    assert fences.statuses["s1"] == "matched"
+    # Beyond the pickup exit radius, still inside the wider delivery zone
+    fences.check("c1", CHENNAI[0] + 15 / KM_PER_DEGREE, CHENNAI[1], t=2)
+    assert fences.statuses["s1"] == "completed"
+
+
+class FakeQuery:
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = rows
+        self.window = None
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def range(self, start, end):
+        self.window = (start, end)
+        return self
+
+    def execute(self):
+        if self.table == "carrier_responses":
+            return SimpleNamespace(data=[{"shipment_id": row["id"], "carrier_id": "c1"} for row in self.rows])
+        start, end = self.window
+        return SimpleNamespace(data=self.rows[start:end + 1])
+
+
+def test_refresh_pages_through_every_active_shipment(monkeypatch):
+    rows = [{"id": f"s{i:04}", "source_location": "Chennai", "destination_location": "Bangalore",
+             "status": "matched"} for i in range(2500)]
+    monkeypatch.setattr(geofence, "supabase", SimpleNamespace(table=lambda name: FakeQuery(name, rows)))
+    monkeypatch.setattr(geofence, "GEOFENCE_PAGE_SIZE", 1000)
+
+    async def run_db(fn, *args):
+        return fn(*args)
+
+    monkeypatch.setattr(geofence, "run_db", run_db)
+    fences = engine()
+    asyncio.run(fences.refresh())
+    assert len(fences.by_shipment) == 2500
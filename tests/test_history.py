@@ -0,0 +1,74 @@
+import os
+import numpy as np
+from services.history import TelemetryHistory, encode_chunk, decode_chunk
+
+
+def fill(history, carrier_id, count, t0=1_700_000_000):
+    for i in range(count):
+        history.append(carrier_id, t0 + i, 13.0 + i * 1e-4, 80.0 - i * 1e-4, 40 + i % 20, (i * 7) % 360)
+
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def test_encode_round_trip():
+    t_ms = np.array([1000, 2500, 4000], dtype=np.int64)
+    lat, lng = np.array([13.0827, 13.0830, 13.0841]), np.array([80.2707, 80.2701, 80.2690])
+    speed, heading = np.array([0.0, 35.5, 61.2]), np.array([0.0, 359.9, 12.3])
+    decoded = decode_chunk(1000, encode_chunk(t_ms, lat, lng, speed, heading))
+    for original, restored in zip((t_ms, lat, lng, speed, heading), decoded):
+        np.testing.assert_allclose(restored, original, atol=1e-6)
+
+
+def test_query_spans_sealed_chunks_and_tail():
+    history = TelemetryHistory(chunk_points=100)
+    fill(history, "c1", 250)
+    result = history.query("c1", 1_700_000_000, 1_700_000_249)
+    assert result["points"] == 250
+    assert history.stats()["chunks"] == 2
+    assert history.query("c1", 1_700_000_000, 1_700_000_249, resolution=60)["points"] == 5
+
+
+def test_persisted_chunks_keep_few_descriptors_open(tmp_path):
+    history = TelemetryHistory(str(tmp_path), chunk_points=10, open_chunks=4)
+    before = open_fds()
+    fill(history, "c1", 1000)
+    assert history.stats()["chunks"] == 100
+    assert open_fds() - before <= 4
+    assert history.query("c1", 1_700_000_000, 1_700_001_000)["points"] == 1000
+    assert open_fds() - before <= 4
+    assert history.stats()["open_maps"] == 4
+
+
+def test_reload_after_restart(tmp_path):
+    history = TelemetryHistory(str(tmp_path), chunk_points=10)
+    fill(history, "carrier/1", 25)
+    for track_id, track in history.tracks.items():
+        history._seal(track_id, track)
+    restored = TelemetryHistory(str(tmp_path))
+    restored.load()
+    assert restored.query("carrier/1", 1_700_000_000, 1_700_000_100)["points"] == 25
+    assert restored.stats()["open_maps"] == 3
+
+
+def test_reload_skips_foreign_entries(tmp_path):
+    history = TelemetryHistory(str(tmp_path), chunk_points=10)
+    fill(history, "c1", 10)
+    (tmp_path / "lost+found").mkdir()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "README").write_text("")
+    (tmp_path / os.path.basename(history._carrier_dir("c1")) / "notes.npy").write_text("")
+    restored = TelemetryHistory(str(tmp_path))
+    restored.load()
+    assert list(restored.tracks) == ["c1"]
+    assert restored.query("c1", 1_700_000_000, 1_700_000_100)["points"] == 10
+
+
+def test_write_failure_keeps_chunk_in_memory(tmp_path):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    history = TelemetryHistory(str(blocker), chunk_points=10)
+    fill(history, "c1", 30)
+    assert history.stats()["persist_errors"] == 3
+    assert history.query("c1", 1_700_000_000, 1_700_000_100)["points"] == 30
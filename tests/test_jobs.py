@@ -0,0 +1,167 @@
+import os
+import time
+import asyncio
+import sqlite3
+import pytest
+from services import jobs
+from services.jobs import JobQueue, NegotiationWorkers, recommendation
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2, retry_backoff=0, lease_seconds=60)
+    yield queue
+    queue.close()
+
+
+def test_file_is_created_on_first_use(tmp_path):
+    path = tmp_path / "sub" / "jobs.sqlite3"
+    queue = JobQueue(str(path))
+    assert not os.path.exists(path)
+    assert queue.stats() == {}
+    queue.enqueue({"n": 1})
+    assert os.path.exists(path)
+
+
+def test_claim_runs_jobs_in_order(queue):
+    first = queue.enqueue({"n": 1})
+    queue.enqueue({"n": 2})
+    job = queue.claim()
+    assert job["id"] == first and job["payload"] == {"n": 1} and job["attempts"] == 1
+    queue.complete(job["id"], job["attempts"], {"ok": True})
+    assert queue.get(first)["status"] == "succeeded"
+    assert queue.get(first)["result"] == {"ok": True}
+    assert queue.claim()["payload"] == {"n": 2}
+    assert queue.claim() is None
+
+
+def test_failed_attempt_is_retried_then_failed(queue):
+    job_id = queue.enqueue({})
+    job = queue.claim()
+    assert queue.fail(job_id, job["attempts"], "boom") is False
+    assert queue.get(job_id)["status"] == "queued"
+    job = queue.claim()
+    assert job["attempts"] == 2
+    assert queue.fail(job_id, job["attempts"], "boom again") is True
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_expired_lease_is_reclaimed_and_fences_the_old_attempt(queue):
+    job_id = queue.enqueue({})
+    stale = queue.claim()
+    queue._connect().execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - 120, job_id))
+    fresh = queue.claim()
+    assert fresh["id"] == job_id and fresh["attempts"] == 2
+    assert queue.renew(job_id, stale["attempts"]) is False
+    queue.complete(job_id, stale["attempts"], {"from": "stale"})
+    assert queue.get(job_id)["status"] == "running"
+    assert queue.renew(job_id, fresh["attempts"]) is True
+
+
+def test_renewed_lease_is_not_reclaimed(queue):
+    job_id = queue.enqueue({})
+    job = queue.claim()
+    queue._connect().execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - 50, job_id))
+    assert queue.renew(job_id, job["attempts"])
+    queue.lease_seconds = 40
+    assert queue.claim() is None
+
+
+def test_saved_result_survives_a_failed_attempt(queue):
+    job_id = queue.enqueue({})
+    job = queue.claim()
+    queue.save_result(job_id, job["attempts"], {"price": 10})
+    queue.fail(job_id, job["attempts"], "insert failed")
+    assert queue.claim()["result"] == {"price": 10}
+
+
+def test_failed_record_insert_does_not_fail_the_job(queue, monkeypatch):
+    negotiations = []
+
+    async def negotiate(data):
+        negotiations.append(data)
+        return {"status": "success", "clauses": []}
+
+    def save(data, result):
+        raise RuntimeError("ai_negotiations insert failed")
+
+    monkeypatch.setattr(jobs, "negotiate_contract_api_async", negotiate)
+    monkeypatch.setattr(jobs, "save_negotiation_record", save)
+    workers = NegotiationWorkers(queue)
+
+    async def run():
+        job_id = await queue.call(queue.enqueue, {"shipment_id": "s"})
+        await workers.process(await queue.call(queue.claim))
+        return await queue.call(queue.get, job_id), await workers.stats()
+
+    job, stats = asyncio.run(run())
+    assert len(negotiations) == 1
+    assert job["status"] == "succeeded"
+    assert job["result"]["negotiation_record_id"] is None
+    assert stats["record_errors"] == 1 and stats["jobs"] == {"succeeded": 1}
+
+
+def test_reclaimed_job_with_saved_result_does_not_negotiate_again(queue, monkeypatch):
+    async def negotiate(data):
+        raise AssertionError("negotiated twice")
+
+    monkeypatch.setattr(jobs, "negotiate_contract_api_async", negotiate)
+    monkeypatch.setattr(jobs, "save_negotiation_record", lambda data, result: "row-1")
+    job_id = queue.enqueue({})
+    job = queue.claim()
+    queue.save_result(job_id, job["attempts"], {"price": 10})
+    queue.fail(job_id, job["attempts"], "worker died")
+    asyncio.run(NegotiationWorkers(queue).process(queue.claim()))
+    assert queue.get(job_id)["result"] == {"price": 10, "negotiation_record_id": "row-1"}
+
+
+def test_queue_errors_do_not_kill_the_worker(queue, monkeypatch):
+    async def negotiate(data):
+        return {"status": "success"}
+
+    def broken(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(jobs, "negotiate_contract_api_async", negotiate)
+    monkeypatch.setattr(jobs, "save_negotiation_record", lambda data, result: None)
+    queue.enqueue({})
+    job = queue.claim()
+    monkeypatch.setattr(queue, "complete", broken)
+    monkeypatch.setattr(queue, "fail", broken)
+    workers = NegotiationWorkers(queue)
+    asyncio.run(workers.process(job))
+    assert workers.queue_errors == 1
+    assert queue.get(job["id"])["status"] == "running"
+
+
+def test_heartbeat_keeps_long_job_leased(queue, monkeypatch):
+    queue.lease_seconds = 0.15
+
+    async def slow_negotiation(data):
+        await asyncio.sleep(0.4)
+        return {"status": "success"}
+
+    monkeypatch.setattr(jobs, "negotiate_contract_api_async", slow_negotiation)
+    monkeypatch.setattr(jobs, "save_negotiation_record", lambda data, result: None)
+    workers = NegotiationWorkers(queue)
+
+    async def run():
+        await queue.call(queue.enqueue, {})
+        job = await queue.call(queue.claim)
+        task = asyncio.create_task(workers.process(job))
+        await asyncio.sleep(0.3)
+        stolen = await queue.call(queue.claim)
+        await task
+        return stolen
+
+    assert asyncio.run(run()) is None
+    assert workers.completed == 1
+
+
+def test_recommendation():
+    agreed = {"status": "agreed"}
+    assert recommendation({"status": "success", "clauses": [agreed, agreed]}) == "accept"
+    assert recommendation({"status": "success", "clauses": [agreed, {"status": "adjusted"}]}) == "counter"
+    assert recommendation({"status": "success"}) == "counter"
+    assert recommendation({"status": "success", "recommendation": "Reject", "clauses": [agreed]}) == "reject"
+    assert recommendation({"status": "error", "clauses": [agreed]}) == "counter"
@@ -0,0 +1,38 @@
+import time
+from fastapi.testclient import TestClient
+import server
+from services.telemetry import hot_locations, telemetry_buffer
+from services.history import telemetry_history
+
+client = TestClient(server.app)
+
+
+def post(points, monkeypatch):
+    monkeypatch.setattr(server, "supabase", object())
+    return client.post("/carrier/live-location/batch", json=points)
+
+
+def test_fixes_are_applied_in_the_order_they_were_taken(monkeypatch):
+    now = time.time()
+    points = [
+        {"carrier_id": "batch-carrier", "lat": 13.2, "lng": 80.2, "timestamp": now - 10},
+        {"carrier_id": "batch-carrier", "lat": 13.0, "lng": 80.0, "timestamp": now - 30},
+        {"carrier_id": "batch-carrier", "lat": 13.1, "lng": 80.1, "timestamp": now - 20},
+    ]
+    response = post(points, monkeypatch)
+    assert response.json()["accepted"] == 3
+    assert hot_locations.peek("batch-carrier").lat == 13.2
+    history = telemetry_history.query("batch-carrier", now - 60, now)
+    assert history["lat"] == [13.0, 13.1, 13.2]
+    assert [round(t) for t in history["t"]] == [round(now - 30), round(now - 20), round(now - 10)]
+    telemetry_buffer._pending.clear()
+
+
+def test_future_timestamps_are_clamped_and_older_fixes_ignored(monkeypatch):
+    now = time.time()
+    post([{"carrier_id": "clock-skew", "lat": 13.0, "lng": 80.0, "timestamp": now + 3600}], monkeypatch)
+    assert hot_locations.peek("clock-skew").updated_at <= time.time()
+    post([{"carrier_id": "clock-skew", "lat": 14.0, "lng": 81.0, "timestamp": now - 60}], monkeypatch)
+    assert hot_locations.peek("clock-skew").lat == 13.0
+    telemetry_buffer._pending.clear()
+
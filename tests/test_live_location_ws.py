@@ -0,0 +1,28 @@
+import time
+from fastapi.testclient import TestClient
+import server
+from services.telemetry import hot_locations
+
+
+def test_non_object_messages_are_rejected_without_closing():
+    hot_locations.update("ws-carrier", 13.08, 80.27, 30, 90, time.time())
+    client = TestClient(server.app)
+    with client.websocket_connect("/ws/live-location") as websocket:
+        for message in ([], 1, "text"):
+            websocket.send_json(message)
+            assert websocket.receive_json() == {"type": "error", "message": "Expected a JSON object"}
+        websocket.send_text("{not json")
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"subscribe": ["ws-carrier"]})
+        update = websocket.receive_json()
+        assert update["type"] == "locations"
+        assert update["locations"][0]["carrier_id"] == "ws-carrier"
+
+
+def test_disconnect_leaves_no_unretrieved_task_errors(capsys):
+    client = TestClient(server.app)
+    with client.websocket_connect("/ws/live-location?carrier_ids=a,b") as websocket:
+        websocket.send_json({"unsubscribe": ["a"]})
+    captured = capsys.readouterr()
+    assert "never retrieved" not in captured.err
+    assert "Live location feed closed on error" not in captured.out
@@ -0,0 +1,65 @@
+from datetime import datetime
+import numpy as np
+from services import distance
+from services.matching import score_pairs, match_shipments, solve_assignment, shipper_terms
+
+NOW = datetime(2026, 1, 1, 8)
+
+
+def shipment(id, source="Chennai", destination="Bangalore", **fields):
+    return {"id": id, "source_location": source, "destination_location": destination,
+            "max_budget": 100000, "deadline": "2026-01-05", **fields}
+
+
+def carrier(id, lat=13.08, lng=80.27, capacity=10, **fields):
+    return {"carrier_id": id, "latitude": lat, "longitude": lng, "available_capacity": capacity,
+            "cost_structure": {"base_rate": 500, "per_mile": 2}, **fields}
+
+
+def test_solve_assignment_finds_minimum_cost():
+    cost = [[4, 1, 3], [2, 0, 5], [3, 2, 2]]
+    pairs = solve_assignment(cost)
+    assert sum(cost[i][j] for i, j in pairs) == 5
+    assert solve_assignment(np.zeros((0, 3))) == []
+
+
+def test_best_carrier_is_assigned():
+    pairs, unmatched = match_shipments([shipment("s1")], [carrier("far", 28.6, 77.2), carrier("near")], NOW)
+    assert [pair["carrier_id"] for pair in pairs] == ["near"]
+    assert pairs[0]["trip_km"] > 250
+    assert unmatched == []
+
+
+def test_unknown_place_is_unmatchable():
+    shipments = [shipment("s1", source="Nowhereville"), shipment("s2", destination="")]
+    scored = score_pairs(shipments, [carrier("c1")], NOW)
+    assert not scored["resolved"].any()
+    assert not scored["feasible"].any()
+    assert match_shipments(shipments, [carrier("c1")], NOW) == ([], ["s1", "s2"])
+
+
+def test_carrier_must_fit_the_load():
+    shipments = [shipment("s1", required_capacity=12)]
+    pairs, _ = match_shipments(shipments, [carrier("small", capacity=10), carrier("big", capacity=15)], NOW)
+    assert [pair["carrier_id"] for pair in pairs] == ["big"]
+
+
+def test_load_in_another_unit_is_not_compared():
+    shipments = [shipment("s1", required_capacity=2, capacity_unit="containers")]
+    assert match_shipments(shipments, [carrier("c1", capacity=20)], NOW)[0] == []
+    assert match_shipments(shipments, [carrier("c1", capacity=20, capacity_unit="Containers")], NOW)[0] != []
+
+
+def test_trip_distance_is_per_shipment():
+    lats, lngs = np.array([13.08, 12.97, 28.61]), np.array([80.27, 77.59, 77.21])
+    dest_lats, dest_lngs = lats[::-1], lngs[::-1]
+    matrix = distance.haversine_matrix(lats, lngs, dest_lats, dest_lngs)
+    assert np.allclose(distance.haversine_pairs(lats, lngs, dest_lats, dest_lngs), matrix.diagonal())
+
+
+def test_shipper_terms_use_the_dashboard_keys():
+    row = shipment("s1", min_budget=300, sla_rules={"delayPenalty": 15}, time_window=None, created_at="2026-01-01")
+    assert shipper_terms(row) == {
+        "source": "Chennai", "destination": "Bangalore", "minBudget": 300, "maxBudget": 100000,
+        "deadline": "2026-01-05", "slaRules": {"delayPenalty": 15},
+    }
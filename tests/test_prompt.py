@@ -0,0 +1,36 @@
+import json
+from services.api import build_negotiation_result
+from services.prompt import build_user_prompt
+
+CONTEXT = {
+    "id": "session-1",
+    "shipment_id": "s1",
+    "shipper_request": {"source": "Pune", "destination": "Mumbai", "description": "x" * 4000, "created_at": "2026-01-01"},
+    "carrier_response": {"proposed_price": 2700},
+    "carrier_profile": {"name": "Carrier"},
+    "weather": {"condition": "Clear"},
+    "news": [{"title": f"headline {i}", "content": "y" * 500} for i in range(20)],
+    "news_freshness": "fresh",
+}
+
+
+def test_prompt_token_counts_reach_the_transparency_report():
+    context = {**CONTEXT}
+    prompt = build_user_prompt(context, budget=100)
+    tokens = context["prompt_tokens"]
+    assert tokens["compacted"] < tokens["raw"]
+    assert tokens["trim_steps"] > 0
+    assert "SHIPMENT_REFERENCE: s1" in prompt
+
+    request = {"shipper": {}, "carrier": {}, "unique_id": "session-1", "carrier_id": "c1", "shipment_id": "s1"}
+    raw = json.dumps({"agreement_text": "ok", "transparency": {"market_logic": "..."}})
+    report = build_negotiation_result(request, context, raw)["transparency_report"]
+    assert report["prompt_tokens"] == tokens
+    assert report["news_freshness"] == "fresh"
+
+
+def test_cached_agreement_has_no_prompt_token_counts():
+    request = {"shipper": {}, "carrier": {}, "unique_id": "session-1", "carrier_id": "c1", "shipment_id": "s1"}
+    raw = json.dumps({"agreement_text": "ok", "transparency": {}})
+    report = build_negotiation_result(request, {**CONTEXT}, raw)["transparency_report"]
+    assert "prompt_tokens" not in report
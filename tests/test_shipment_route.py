@@ -0,0 +1,37 @@
+from fastapi.testclient import TestClient
+import server
+from services.progress import RouteTracker, route_tracker
+
+client = TestClient(server.app)
+
+
+def test_route_body_must_be_an_object():
+    for body in ([[13.0, 80.2], [13.1, 80.3]], 1, "route"):
+        response = client.post("/shipments/s-route/route", json=body)
+        assert response.status_code == 422
+        assert response.json() == {"detail": "Body must be a JSON object"}
+    response = client.post("/shipments/s-route/route", json={"carrier_id": ["c1"], "polyline": []})
+    assert response.status_code == 422
+
+
+def test_route_is_tracked():
+    body = {"carrier_id": "c-route", "polyline": [[13.0, 80.2], [13.1, 80.3], [13.2, 80.4]]}
+    response = client.post("/shipments/s-route/route", json=body)
+    assert response.status_code == 200
+    assert response.json()["progress"]["shipment_id"] == "s-route"
+    assert client.post("/shipments/s-route/route", json={"carrier_id": "c-route", "polyline": [[1]]}).status_code == 400
+    route_tracker.untrack("s-route")
+
+
+def test_lookbehind_lets_a_truck_snap_back():
+    points = [(13.0 + i * 0.01, 80.0) for i in range(20)]
+    segments = {}
+    for lookbehind in (0, 3):
+        tracker = RouteTracker(lookahead=2, lookbehind=lookbehind)
+        tracker.track("s", "c", points)
+        for i in range(11):
+            tracker.update("c", 13.0 + i * 0.01, 80.0, t=i + 1)
+        tracker.update("c", 13.085, 80.0, t=20)
+        segments[lookbehind] = tracker.shipments["s"].segment
+    assert segments[0] >= 9
+    assert segments[3] == 8
@@ -0,0 +1,66 @@
+import random
+from services.spatial import GridIndex, haversine_km
+
+
+def brute_force(points, lat, lng, k=None, radius_km=None):
+    found = sorted((haversine_km(lat, lng, p_lat, p_lng), key) for key, (p_lat, p_lng) in points.items())
+    if radius_km is not None:
+        found = [match for match in found if match[0] <= radius_km]
+    return found[:k] if k is not None else found
+
+
+def random_index(rng, count, lat_range, lng_range, cell_deg):
+    index = GridIndex(cell_deg)
+    points = {}
+    for key in range(count):
+        points[key] = (rng.uniform(*lat_range), rng.uniform(*lng_range))
+        index.upsert(key, *points[key])
+    return index, points
+
+
+def test_upsert_moves_and_remove():
+    index = GridIndex(0.1)
+    index.upsert("a", 13.0, 80.0)
+    index.upsert("a", 13.55, 80.55)
+    assert index.position("a") == (13.55, 80.55)
+    assert [key for _, key in index.nearest(13.5, 80.5, 5)] == ["a"]
+    index.remove("a")
+    assert "a" not in index and index.nearest(13.5, 80.5) == []
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(1)
+    index, points = random_index(rng, 400, (8, 30), (68, 90), 0.5)
+    for _ in range(50):
+        lat, lng = rng.uniform(8, 30), rng.uniform(68, 90)
+        assert index.nearest(lat, lng, 5) == brute_force(points, lat, lng, 5)
+
+
+def test_nearest_matches_brute_force_at_high_latitudes():
+    # Cells shrink fast towards the pole, so the ring bound must use the
+    # narrowest row searched, not the row of the query point
+    rng = random.Random(2)
+    index, points = random_index(rng, 300, (55, 85), (-40, 40), 2.0)
+    for _ in range(200):
+        lat, lng = rng.uniform(55, 85), rng.uniform(-40, 40)
+        assert index.nearest(lat, lng, 3) == brute_force(points, lat, lng, 3)
+
+
+def test_ring_bound_uses_the_narrowest_row_searched():
+    index = GridIndex(2.0)
+    # Far-away filler so the ring search does not fall back to a full scan
+    for key in range(1000):
+        index.upsert(("filler", key), -40 - key % 20 * 2, -178 + key // 20 * 2)
+    index.upsert("south", 36.4, 1.76)
+    index.upsert("over-the-pole", 84.9, 82.0)
+    (distance, key), = index.nearest(63.4, 1.76, 1)
+    assert key == "over-the-pole"
+    assert distance < haversine_km(63.4, 1.76, 36.4, 1.76)
+
+
+def test_within_radius_matches_brute_force_at_high_latitudes():
+    rng = random.Random(3)
+    index, points = random_index(rng, 300, (55, 85), (-40, 40), 2.0)
+    for _ in range(100):
+        lat, lng = rng.uniform(55, 85), rng.uniform(-40, 40)
+        assert index.within_radius(lat, lng, 400) == brute_force(points, lat, lng, radius_km=400)
@@ -0,0 +1,42 @@
+import json
+from services.streaming import JsonFieldStream, sse_event
+
+COMPLETION = json.dumps({
+    "agreement": "Price \\u20b9 2,700 \"fixed\"\nline two",
+    "justified_price": 2700,
+    "clauses": [{"id": "pricing", "status": "agreed"}],
+    "summary": "ok",
+})
+
+
+def collect(chunks, fields=("justified_price", "clauses", "summary")):
+    stream = JsonFieldStream("agreement", fields)
+    events = [event for chunk in chunks for event in stream.feed(chunk)]
+    return stream, events
+
+
+def test_sse_event_format():
+    assert sse_event("field", {"a": 1}) == 'event: field\ndata: {"a": 1}\n\n'
+
+
+def test_text_field_streams_as_deltas_at_any_chunking():
+    expected = json.loads(COMPLETION)
+    for size in (1, 2, 3, 7, len(COMPLETION)):
+        chunks = [COMPLETION[i:i + size] for i in range(0, len(COMPLETION), size)]
+        stream, events = collect(chunks)
+        text = "".join(value for kind, value in events if kind == "delta")
+        fields = dict(value for kind, value in events if kind == "field")
+        assert text == expected["agreement"]
+        assert fields == {key: expected[key] for key in ("justified_price", "clauses", "summary")}
+        assert json.loads(stream.document()) == expected
+
+
+def test_number_at_end_of_buffer_waits_for_more_input():
+    stream = JsonFieldStream("agreement", ("justified_price",))
+    assert stream.feed('{"justified_price": 27') == []
+    assert stream.feed('00}') == [("field", ("justified_price", 2700))]
+
+
+def test_document_strips_code_fence():
+    stream, _ = collect(["```json\n", COMPLETION, "\n```"])
+    assert json.loads(stream.document())["summary"] == "ok"
@@ -0,0 +1,81 @@
+import time
+import asyncio
+from datetime import datetime, timezone
+from services.telemetry import HotLocationStore, TelemetryBuffer
+
+
+def row(carrier_id, lat, updated_at):
+    return {
+        "carrier_id": carrier_id,
+        "latitude": lat,
+        "longitude": 80.0,
+        "speed": 0,
+        "heading": 0,
+        "updated_at": datetime.fromtimestamp(updated_at, timezone.utc).isoformat()
+    }
+
+
+def test_ping_fed_record_goes_stale():
+    store = HotLocationStore(ping_ttl=30)
+    store.update("c1", 13.0, 80.0, 0, 0, time.time() - 60)
+    assert store.get("c1") is None
+    assert store.stats()["stale"] == 1
+    store.update("c1", 13.1, 80.0, 0, 0, time.time())
+    assert store.get("c1").lat == 13.1
+
+
+def test_db_row_replaces_stale_position_from_another_worker():
+    store = HotLocationStore(db_ttl=5, ping_ttl=30)
+    now = time.time()
+    store.update("c1", 13.0, 80.0, 0, 0, now - 60)
+    record = store.load_row(row("c1", 19.0, now - 1))
+    assert record.lat == 19.0
+    assert store.get("c1") is record
+    record.loaded_at -= 10
+    assert store.get("c1") is None
+
+
+def test_db_row_does_not_overwrite_newer_ping():
+    store = HotLocationStore()
+    now = time.time()
+    store.update("c1", 13.0, 80.0, 0, 0, now)
+    record = store.load_row(row("c1", 19.0, now - 5))
+    assert record.lat == 13.0
+    assert record.loaded_at is not None
+
+
+def test_store_is_capped_least_recently_updated_first():
+    store = HotLocationStore(max_carriers=2)
+    now = time.time()
+    store.update("a", 1, 1, 0, 0, now)
+    store.update("b", 2, 2, 0, 0, now)
+    store.update("a", 1, 1, 0, 0, now)
+    store.update("c", 3, 3, 0, 0, now)
+    assert len(store) == 2
+    assert store.peek("b") is None
+    assert store.stats()["evicted"] == 1
+
+
+def test_idle_records_are_evicted():
+    store = HotLocationStore(idle_seconds=60)
+    now = time.time()
+    store.update("old", 1, 1, 0, 0, now - 120)
+    store.update("new", 2, 2, 0, 0, now)
+    store.evict()
+    assert store.peek("old") is None
+    assert store.peek("new") is not None
+
+
+def test_flush_skips_evicted_carriers():
+    written = []
+
+    async def writer(rows):
+        written.extend(rows)
+
+    store = HotLocationStore()
+    buffer = TelemetryBuffer(writer, store)
+    store.update("a", 1, 1, 0, 0, time.time())
+    buffer.mark("a")
+    buffer.mark("gone")
+    asyncio.run(buffer.flush())
+    assert [r["carrier_id"] for r in written] == ["a"]
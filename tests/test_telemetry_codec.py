@@ -0,0 +1,77 @@
+import json
+import uuid
+import numpy as np
+import pytest
+from services import telemetry_codec as codec
+
+CARRIER = str(uuid.UUID(int=1))
+
+
+def points():
+    return [
+        {"carrier_id": CARRIER, "lat": 13.08, "lng": 80.27, "speed": 42.5, "heading": 90, "timestamp": 1_700_000_000.5},
+        {"carrier_id": str(uuid.UUID(int=2)), "lat": -33.9, "lng": 151.2},
+    ]
+
+
+def decoded(batch):
+    return list(batch.rows(np.ones(len(batch), dtype=bool)))
+
+
+def test_binary_round_trip():
+    batch = codec.decode(codec.encode_binary(points()), codec.BINARY_CONTENT_TYPE)
+    assert decoded(batch) == [
+        (CARRIER, 13.08, 80.27, 42.5, 90.0, 1_700_000_000.5),
+        (str(uuid.UUID(int=2)), -33.9, 151.2, 0.0, 0.0, None),
+    ]
+
+
+def test_binary_body_must_be_whole_records():
+    with pytest.raises(ValueError):
+        codec.decode_binary(codec.encode_binary(points())[:-1])
+
+
+def test_json_and_ndjson_agree():
+    as_json = codec.decode(json.dumps({"points": points()}), "application/json; charset=utf-8")
+    as_ndjson = codec.decode("\n".join(json.dumps(p) for p in points()) + "\n\n", codec.NDJSON_CONTENT_TYPE)
+    assert decoded(as_json) == decoded(as_ndjson)
+    assert decoded(codec.decode_json(json.dumps(points()))) == decoded(as_json)
+    with pytest.raises(ValueError):
+        codec.decode_json('"points"')
+
+
+def test_fix_timestamps_accept_epoch_and_iso():
+    batch = codec.from_points([
+        {"carrier_id": CARRIER, "lat": 13, "lng": 80, "timestamp": 1_700_000_000},
+        {"carrier_id": CARRIER, "lat": 13, "lng": 80, "timestamp": "2023-11-14T22:13:20Z"},
+        {"carrier_id": CARRIER, "lat": 13, "lng": 80, "timestamp": "2023-11-14T22:13:20"},
+        {"carrier_id": CARRIER, "lat": 13, "lng": 80, "timestamp": "yesterday"},
+        {"carrier_id": CARRIER, "lat": 13, "lng": 80, "timestamp": -5},
+    ])
+    valid, errors = batch.validate()
+    assert [row[5] for row in batch.rows(valid)] == [1_700_000_000.0] * 3
+    assert errors == [(3, "invalid timestamp"), (4, "invalid timestamp")]
+
+
+def test_validation_reports_first_failing_check_per_fix():
+    batch = codec.from_points([
+        {"carrier_id": CARRIER, "lat": 13, "lng": 80},
+        {"carrier_id": "", "lat": 13, "lng": 80},
+        {"carrier_id": CARRIER, "lat": 91, "lng": 200},
+        {"carrier_id": CARRIER, "lat": "north", "lng": 80},
+        {"carrier_id": CARRIER, "lat": 13, "lng": 80, "speed": -1},
+        "not a point",
+    ])
+    valid, errors = batch.validate()
+    assert valid.tolist() == [True, False, False, False, False, False]
+    assert sorted(errors) == [
+        (1, "missing carrier_id"), (2, "lat out of range"), (3, "lat out of range"),
+        (4, "invalid speed"), (5, "missing carrier_id"),
+    ]
+
+
+def test_reported_errors_are_capped():
+    batch = codec.from_points([{"lat": 0, "lng": 0}] * (codec.MAX_REPORTED_ERRORS + 5))
+    valid, errors = batch.validate()
+    assert not valid.any()
+    assert len(errors) == codec.MAX_REPORTED_ERRORS